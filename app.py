@@ -3,14 +3,13 @@ import stripe
 import json
 import random
 import traceback
-import logging
-from logging.handlers import RotatingFileHandler
 from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
 from config import Config
+from app.log import init_logging
 from models import db, User, Accommodation, Booking, Review, Favorite
 from forms import RegistrationForm, LoginForm, AccommodationForm, BookingForm, ReviewForm, SearchForm
 
@@ -20,18 +19,9 @@ app = Flask(__name__)
 # Load configuration
 app.config.from_object(Config)
 
-# Configure logging
-if not app.debug:
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/campusstay.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
-    app.logger.info('CampusStay startup')
+# Configure logging - JSON lines written off the request thread (app/log.py)
+init_logging(app)
+app.logger.info('CampusStay startup')
 
 # Initialize extensions
 db.init_app(app)
@@ -262,7 +252,7 @@ def toggle_favorite(accommodation_id):
         if favorite:
             db.session.delete(favorite)
             db.session.commit()
-            app.logger.info(f'User {current_user.id} removed favorite {accommodation_id}')
+            app.logger.info(f'User {current_user.id} removed favorite {accommodation_id}', extra={'sample': 'favorites'})
             return jsonify({'status': 'removed'})
         else:
             favorite = Favorite(
@@ -271,7 +261,7 @@ def toggle_favorite(accommodation_id):
             )
             db.session.add(favorite)
             db.session.commit()
-            app.logger.info(f'User {current_user.id} added favorite {accommodation_id}')
+            app.logger.info(f'User {current_user.id} added favorite {accommodation_id}', extra={'sample': 'favorites'})
             return jsonify({'status': 'added'})
     except Exception as e:
         app.logger.error(f'Error toggling favorite: {e}')
@@ -470,14 +460,18 @@ def admin_dashboard():
         return redirect(url_for('index'))
     
     try:
-        stats = {
-            'total_users': User.query.count(),
-            'total_accommodations': Accommodation.query.count(),
-            'active_accommodations': Accommodation.query.filter_by(is_active=True).count(),
-            'total_bookings': Booking.query.count(),
-            'paid_bookings': Booking.query.filter_by(status='paid').count(),
-            'total_revenue': db.session.query(db.func.sum(Booking.total_price)).filter_by(status='paid').scalar() or 0
-        }
+        # One aggregate query instead of a count per card
+        paid = Booking.status == 'paid'
+        row = db.session.execute(db.select(
+            db.select(db.func.count(User.id)).scalar_subquery().label('total_users'),
+            db.select(db.func.count(Accommodation.id)).scalar_subquery().label('total_accommodations'),
+            db.select(db.func.count(Accommodation.id)).where(Accommodation.is_active == True)
+                .scalar_subquery().label('active_accommodations'),
+            db.func.count(Booking.id).label('total_bookings'),
+            db.func.count(db.case((paid, 1))).label('paid_bookings'),
+            db.func.coalesce(db.func.sum(db.case((paid, Booking.total_price))), 0).label('total_revenue'),
+        ).select_from(Booking)).mappings().one()
+        stats = dict(row)
         
         return render_template('admin/dashboard.html', stats=stats)
     except Exception as e:
@@ -634,8 +628,24 @@ def admin_users():
         return redirect(url_for('index'))
     
     try:
-        users = User.query.all()
-        return render_template('admin/users.html', users=users)
+        # Server-side search and paging; same matching rules as app/search.py
+        q = request.args.get('q', '').strip().lower()
+        page = request.args.get('page', 1, type=int)
+        query = User.query
+        if q:
+            pattern = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            if '@' in q:
+                query = query.filter(db.func.lower(User.email).like(pattern, escape='\\'))
+            elif q.isdigit():
+                query = query.filter(User.student_number.like(pattern, escape='\\'))
+            else:
+                query = query.filter(db.or_(
+                    db.func.lower(User.full_name).like(pattern, escape='\\'),
+                    db.func.lower(User.email).like(pattern, escape='\\'),
+                ))
+        users = query.order_by(User.created_at.desc()).paginate(page=page, per_page=50, error_out=False)
+        admin_count = User.query.filter_by(is_admin=True).count()
+        return render_template('admin/users.html', users=users, q=q, admin_count=admin_count)
     except Exception as e:
         app.logger.error(f'Error loading users: {e}')
         flash('Error loading users.', 'danger')
@@ -719,30 +729,25 @@ def my_bookings():
         flash('Error loading your bookings.', 'danger')
         return redirect(url_for('index'))
 
-# Remove the context block at the bottom - we'll use gunicorn to initialize
-# The database will be initialized when the app starts via the before_first_request handler
-# or manually run db.create_all() in a separate migration script
-
-# Add this at the very bottom of app.py, replacing the existing if __name__ block
+def init_database():
+    """Create missing tables and seed data; run once, not on every import"""
+    with app.app_context():
+        try:
+            # ONLY create tables if they don't exist (safe!)
+            db.create_all()
+            
+            # Create admin user if doesn't exist
+            seed_admin()
+            
+            # Seed accommodations ONLY if they don't exist
+            seed_accommodations()
+            
+            print("✅ Application initialized successfully")
+        except Exception as e:
+            print(f"❌ Database initialization error: {e}")
+            app.logger.error(f"Database initialization error: {e}")
 
 if __name__ == '__main__':
+    init_database()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=app.config['DEBUG'])
-
-# This runs when gunicorn starts the app
-# This runs when gunicorn starts the app
-with app.app_context():
-    try:
-        # ONLY create tables if they don't exist (safe!)
-        db.create_all()
-        
-        # Create admin user if doesn't exist
-        seed_admin()
-        
-        # Seed accommodations ONLY if they don't exist
-        seed_accommodations()
-        
-        print("✅ Application initialized successfully")
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
-        app.logger.error(f"Database initialization error: {e}")
\ No newline at end of file
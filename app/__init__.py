@@ -1,15 +1,25 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
-import stripe
+from app.db_routing import RoutingSession, init_routing
+from app.sqlite import init_sqlite
+from app.metrics import init_metrics
+from app.log import init_logging
+from app.sqlprofile import init_sql_profiler
+from app.boot import BootTimer
 import os
 
+_imports_done = time.perf_counter()
+
 # ------------------------------------------------------------------
 # Extensions
 # ------------------------------------------------------------------
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
 csrf = CSRFProtect()
@@ -26,103 +36,80 @@ def ljust_filter(value, width, fillchar=' '):
 def center_filter(value, width, fillchar=' '):
     return str(value).center(int(width), str(fillchar))
 
-def reset_database_schema(app):
-    """Drop all tables using CASCADE"""
-    with app.app_context():
-        from sqlalchemy import create_engine, text
-        from sqlalchemy.pool import NullPool
-        
-        database_url = app.config['SQLALCHEMY_DATABASE_URI']
-        engine = create_engine(database_url, poolclass=NullPool)
-        
-        try:
-            with engine.connect() as connection:
-                # Get all table names
-                result = connection.execute(text("""
-                    SELECT tablename FROM pg_tables 
-                    WHERE schemaname = 'public'
-                    AND tablename NOT LIKE 'pg_%'
-                    AND tablename NOT LIKE 'sql_%';
-                """))
-                tables = [row[0] for row in result.fetchall()]
-                
-                app.logger.info(f"Found tables to drop: {tables}")
-                
-                # Drop all tables with CASCADE
-                for table in tables:
-                    try:
-                        connection.execute(text(f'DROP TABLE IF EXISTS "{table}" CASCADE'))
-                        connection.commit()
-                        app.logger.info(f"Dropped table: {table}")
-                    except Exception as e:
-                        connection.rollback()
-                        app.logger.warning(f"Could not drop {table}: {e}")
-                
-                # Drop alembic version
-                try:
-                    connection.execute(text('DROP TABLE IF EXISTS alembic_version CASCADE'))
-                    connection.commit()
-                except:
-                    pass
-                
-                app.logger.info("Schema reset completed successfully")
-                return True
-                
-        except Exception as e:
-            app.logger.error(f"Schema reset error: {e}")
-            import traceback
-            app.logger.error(traceback.format_exc())
-            return False
-        finally:
-            engine.dispose()
-
 # ------------------------------------------------------------------
 # App Factory
 # ------------------------------------------------------------------
 def create_app(config_class='config.Config'):
-    app = Flask(__name__, instance_relative_config=False)
-    app.config.from_object(config_class)
-
-    # Filters
-    app.jinja_env.filters['rjust'] = rjust_filter
-    app.jinja_env.filters['ljust'] = ljust_filter
-    app.jinja_env.filters['center'] = center_filter
-
-    # Stripe
-    stripe.api_key = app.config['STRIPE_SECRET_KEY']
-
-    # Extensions
-    db.init_app(app)
-    login_manager.init_app(app)
-    migrate.init_app(app, db)
-    csrf.init_app(app)
-
-    # Login manager
-    login_manager.login_view = 'auth.login'
-    login_manager.login_message = 'Please log in to access this page.'
-    login_manager.login_message_category = 'info'
-
-    # Upload folders
-    os.makedirs(os.path.join(app.root_path, 'static/uploads/profiles'), exist_ok=True)
-    os.makedirs(os.path.join(app.root_path, 'static/uploads/accommodations'), exist_ok=True)
-    os.makedirs(os.path.join(app.root_path, 'static/images'), exist_ok=True)
-    os.makedirs(os.path.join(app.root_path, 'static/img'), exist_ok=True)
-
-    # EMERGENCY RESET - Comment out after first deploy!
-    app.logger.info("Starting database reset...")
-    success = reset_database_schema(app)
-    app.logger.info(f"Database reset result: {success}")
+    timer = BootTimer(started=_import_started)
+    timer.add('imports', _import_started, _imports_done)
+
+    with timer.step('config'):
+        app = Flask(__name__, instance_relative_config=False)
+        app.config.from_object(config_class)
+        init_logging(app)
+
+        # Filters
+        app.jinja_env.filters['rjust'] = rjust_filter
+        app.jinja_env.filters['ljust'] = ljust_filter
+        app.jinja_env.filters['center'] = center_filter
+
+    with timer.step('extensions'):
+        db.init_app(app)
+        login_manager.init_app(app)
+        migrate.init_app(app, db)
+        csrf.init_app(app)
+        init_sqlite(app, db)
+        # First request hooks, so the latency includes the others
+        init_metrics(app)
+        init_sql_profiler(app)
+
+        # Login manager
+        login_manager.login_view = 'auth.login'
+        login_manager.login_message = 'Please log in to access this page.'
+        login_manager.login_message_category = 'info'
+
+        # Upload folders
+        os.makedirs(os.path.join(app.root_path, 'static/uploads/profiles'), exist_ok=True)
+        os.makedirs(os.path.join(app.root_path, 'static/uploads/accommodations'), exist_ok=True)
+        os.makedirs(os.path.join(app.root_path, 'static/images'), exist_ok=True)
+        os.makedirs(os.path.join(app.root_path, 'static/img'), exist_ok=True)
 
     # Register blueprints
-    from app.routes.main import bp as main_bp
-    from app.routes.auth import bp as auth_bp
-    from app.routes.bookings import bp as bookings_bp
-    from app.routes.admin import bp as admin_bp
-
-    app.register_blueprint(main_bp)
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(bookings_bp)
-    app.register_blueprint(admin_bp)
+    with timer.step('blueprints'):
+        from app.routes.main import bp as main_bp
+        from app.routes.auth import bp as auth_bp
+        from app.routes.bookings import bp as bookings_bp
+        from app.routes.admin import bp as admin_bp
+
+        app.register_blueprint(main_bp)
+        app.register_blueprint(auth_bp)
+        app.register_blueprint(bookings_bp)
+        app.register_blueprint(admin_bp)
+
+    with timer.step('listeners'):
+        # Keep the dashboard stats snapshot current on commit
+        from app.stats import register_stats_listeners
+        register_stats_listeners()
+
+        # Keep revenue rollups current as payments are written
+        from app.rollups import register_rollup_listeners
+        register_rollup_listeners()
+
+        # Buffered listing analytics
+        from app.analytics import init_analytics
+        init_analytics(app)
+
+        # Send reads from @use_replica views to the read replicas
+        init_routing(app, db)
+
+        # Admin audit log writer
+        from app.audit import init_audit
+        init_audit(app)
+
+    # CLI commands
+    with timer.step('commands'):
+        from app.commands import register_commands
+        register_commands(app)
 
     # Serve uploads
     @app.route('/static/uploads/<path:filename>')
@@ -132,23 +119,41 @@ def create_app(config_class='config.Config'):
             filename
         )
 
-    # Create tables and seed
+    # Schema and seed data are set up once per deploy with `flask init-db`;
+    # workers only run it when DB_INIT_ON_BOOT is set (local development)
+    if app.config.get('DB_INIT_ON_BOOT'):
+        with timer.step('db_init'):
+            init_database(app)
+
+    app.extensions['boot_timings'] = timer.as_dict()
+    app.logger.info(timer.summary())
+    return app
+
+def init_database(app):
+    """Create missing tables and the admin user; never drops anything"""
     with app.app_context():
         try:
-            app.logger.info("Creating all tables...")
+            app.logger.info("Creating missing tables...")
             db.create_all()
             app.logger.info("Tables created successfully")
-            
+
+            # create_all skips tables that already exist, and with them any
+            # index added to the models since
+            from sqlalchemy.schema import CreateIndex
+            with db.engine.begin() as conn:
+                for table in db.metadata.sorted_tables:
+                    for index in table.indexes:
+                        conn.execute(CreateIndex(index, if_not_exists=True))
+
             app.logger.info("Seeding admin user...")
             seed_admin_user(app)
             app.logger.info("Admin seeding completed")
-            
+            return True
         except Exception as e:
             app.logger.error(f"Database setup error: {e}")
             import traceback
             app.logger.error(traceback.format_exc())
-
-    return app
+            return False
 
 def seed_admin_user(app):
     """Seed admin user"""
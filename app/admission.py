@@ -0,0 +1,259 @@
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, render_template, request, session, url_for
+from flask_login import current_user
+from sqlalchemy import delete, func, insert, or_, select, text, update
+
+from app import db
+
+SESSION_KEY = 'admission_token'
+
+
+def _tickets_table():
+    from app.models import AdmissionTicket
+    return AdmissionTicket.__table__
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+# ------------------------------------------------------------------
+# Queue
+# ------------------------------------------------------------------
+# Key for pg_try_advisory_xact_lock, held while tickets are admitted
+ADVISORY_LOCK_KEY = 7_204_311
+FINISHED_STATUSES = ('released', 'expired')
+
+_advance_lock = threading.Lock()
+_last_advance = 0.0
+
+
+def _issue_ticket(conn):
+    table = _tickets_table()
+    now = datetime.utcnow()
+    token = secrets.token_urlsafe(32)
+    conn.execute(insert(table).values(
+        token=token,
+        user_id=int(current_user.get_id()) if current_user.is_authenticated else None,
+        status='waiting',
+        created_at=now,
+        last_seen_at=now,
+    ))
+    session[SESSION_KEY] = token
+    return conn.execute(select(table).where(table.c.token == token)).mappings().first()
+
+
+def _greatest(conn, *args):
+    return func.max(*args) if conn.dialect.name == 'sqlite' else func.greatest(*args)
+
+
+def _advance(conn):
+    """
+    Expire stale tickets, purge finished ones and admit waiting ones, oldest
+    first, until ADMISSION_CONCURRENCY tickets are admitted. Returns False
+    when another worker holds the admission lock.
+    """
+    table = _tickets_table()
+    if conn.dialect.name == 'postgresql':
+        if not conn.execute(text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': ADVISORY_LOCK_KEY}).scalar():
+            return False
+
+    now = datetime.utcnow()
+    poll_seconds = _config('ADMISSION_POLL_SECONDS', 5)
+    abandon_after = timedelta(seconds=poll_seconds * 4)
+    idle_after = timedelta(seconds=_config('ADMISSION_IDLE_SECONDS', 120))
+
+    # At most ADMISSION_CONCURRENCY admitted rows; ix_admission_status_id.
+    # An admitted student who stopped making gated requests (left the form
+    # open, closed the tab) gives the slot back after ADMISSION_IDLE_SECONDS
+    conn.execute(
+        update(table)
+        .where(
+            table.c.status == 'admitted',
+            or_(table.c.expires_at <= now, table.c.last_seen_at < now - idle_after),
+        )
+        .values(status='expired')
+    )
+    # ix_admission_status_seen
+    conn.execute(
+        update(table)
+        .where(table.c.status == 'waiting', table.c.last_seen_at < now - abandon_after)
+        .values(status='expired')
+    )
+    conn.execute(
+        delete(table).where(
+            table.c.status.in_(FINISHED_STATUSES),
+            table.c.last_seen_at < now - timedelta(seconds=_config('ADMISSION_PURGE_SECONDS', 3600)),
+        )
+    )
+
+    # One statement counts the free slots and admits that many, so two
+    # workers can never both fill the same slots (SQLite runs it under its
+    # write lock, PostgreSQL under the advisory lock above)
+    admitted = select(func.count()).select_from(table).where(table.c.status == 'admitted').scalar_subquery()
+    free = _greatest(conn, _config('ADMISSION_CONCURRENCY', 20) - admitted, 0)
+    next_ids = (
+        select(table.c.id)
+        .where(table.c.status == 'waiting')
+        .order_by(table.c.id)
+        .limit(free)
+    )
+    conn.execute(
+        update(table)
+        .where(table.c.id.in_(next_ids), table.c.status == 'waiting')
+        .values(
+            status='admitted',
+            admitted_at=now,
+            expires_at=now + timedelta(seconds=_config('ADMISSION_TICKET_SECONDS', 300)),
+        )
+    )
+    return True
+
+
+def _advance_due():
+    """Admission runs at most every ADMISSION_ADVANCE_SECONDS per worker, not on every poll"""
+    global _last_advance
+    interval = _config('ADMISSION_ADVANCE_SECONDS', 1)
+    with _advance_lock:
+        now = time.monotonic()
+        if now - _last_advance < interval:
+            return False
+        _last_advance = now
+        return True
+
+
+def advance_queue():
+    with db.engine.begin() as conn:
+        return _advance(conn)
+
+
+def _current_ticket(conn):
+    token = session.get(SESSION_KEY)
+    if not token:
+        return None
+    table = _tickets_table()
+    return conn.execute(select(table).where(table.c.token == token)).mappings().first()
+
+
+def _is_admitted(ticket):
+    return (
+        ticket is not None
+        and ticket['status'] == 'admitted'
+        and ticket['expires_at'] > datetime.utcnow()
+    )
+
+
+def _position(conn, ticket):
+    table = _tickets_table()
+    ahead = conn.execute(
+        select(func.count()).select_from(table)
+        .where(table.c.status == 'waiting', table.c.id < ticket['id'])
+    ).scalar()
+    return ahead + 1
+
+
+def _touch(ticket):
+    """Stamp last_seen_at, at most every other poll interval"""
+    now = datetime.utcnow()
+    if ticket['last_seen_at'] >= now - timedelta(seconds=_config('ADMISSION_POLL_SECONDS', 5) * 2):
+        return
+    table = _tickets_table()
+    with db.engine.begin() as conn:
+        conn.execute(update(table).where(table.c.id == ticket['id']).values(last_seen_at=now))
+
+
+def check_admission():
+    """
+    Returns (admitted, position) for the caller, issuing a ticket on first
+    contact. Used by the gate and by the waiting room status endpoint.
+    A poll is a lookup by token, a last_seen_at touch at most every other
+    poll and the position count; admission runs once per arrival and is
+    otherwise rate limited. Admitted requests touch the ticket too, so an
+    idle admitted ticket can be told from one in use.
+    """
+    table = _tickets_table()
+    with db.engine.connect() as conn:
+        ticket = _current_ticket(conn)
+    if _is_admitted(ticket):
+        _touch(ticket)
+        return True, 0
+
+    issued = ticket is None or ticket['status'] not in ('waiting', 'admitted')
+    if issued:
+        with db.engine.begin() as conn:
+            ticket = _issue_ticket(conn)
+    else:
+        _touch(ticket)
+
+    # A new arrival is admitted straight away when a slot is free; waiting
+    # clients rely on the rate-limited step
+    if (issued or _advance_due()) and advance_queue():
+        with db.engine.connect() as conn:
+            ticket = conn.execute(select(table).where(table.c.id == ticket['id'])).mappings().first()
+        if _is_admitted(ticket):
+            return True, 0
+    with db.engine.connect() as conn:
+        return False, _position(conn, ticket)
+
+
+def release_admission():
+    """Give the slot back once the caller has finished the gated flow"""
+    token = session.pop(SESSION_KEY, None)
+    if not token:
+        return
+    table = _tickets_table()
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(table)
+            .where(table.c.token == token, table.c.status == 'admitted')
+            .values(status='released')
+        )
+
+
+def get_admission_stats():
+    table = _tickets_table()
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            select(table.c.status, func.count()).group_by(table.c.status)
+        ).all()
+    return {status: count for status, count in rows}
+
+
+# ------------------------------------------------------------------
+# Decorator
+# ------------------------------------------------------------------
+def admission_required(f):
+    """
+    Let at most ADMISSION_CONCURRENCY sessions through at once; everyone else
+    gets the waiting room page, which polls a cheap status endpoint.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not _config('ADMISSION_CONTROL_ENABLED', True):
+            return f(*args, **kwargs)
+
+        admitted, position = check_admission()
+        if admitted:
+            return f(*args, **kwargs)
+
+        # A POST cannot be replayed from the waiting room, send them back to the page
+        next_url = request.url if request.method == 'GET' else request.referrer or request.url
+        response = current_app.make_response((
+            render_template(
+                'bookings/waiting_room.html',
+                position=position,
+                next_url=next_url,
+                status_url=url_for('bookings.waiting_room_status'),
+                poll_seconds=_config('ADMISSION_POLL_SECONDS', 5),
+            ),
+            200,
+        ))
+        response.headers['Retry-After'] = str(_config('ADMISSION_POLL_SECONDS', 5))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return decorated_function
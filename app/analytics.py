@@ -0,0 +1,181 @@
+"""
+Write-behind listing analytics.
+
+Request handlers only bump an in-memory counter (a dict update under a lock).
+A daemon thread per worker process swaps the counters out every
+ANALYTICS_FLUSH_SECONDS and adds them to accommodation_stats, one row per
+accommodation per day, with multi-row upserts. Counts buffered when a
+worker is killed are lost, which is acceptable for popularity figures.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import and_, func, insert, select, update
+
+from app import db
+
+EVENTS = ('views', 'impressions', 'favorites')
+# Counters kept after a failed flush, so a database outage cannot grow the buffer forever
+MAX_PENDING_KEYS = 50000
+# Rows per multi-row upsert, kept under SQLite's bound parameter limit
+UPSERT_CHUNK = 500
+
+
+class EventBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._app = None
+        self._pid = None
+        self._interval = 15
+        self.enabled = True
+
+    def init_app(self, app):
+        self._app = app
+        self._interval = app.config.get('ANALYTICS_FLUSH_SECONDS', 15)
+        self.enabled = app.config.get('ANALYTICS_ENABLED', True)
+
+    def record(self, event, accommodation_ids):
+        if not self.enabled:
+            return
+        today = date.today()
+        with self._lock:
+            for accommodation_id in accommodation_ids:
+                self._counts[(today, accommodation_id, event)] += 1
+        if self._pid != os.getpid():
+            self._start()
+
+    def _start(self):
+        # Started lazily so that every forked worker gets its own thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Running in a forked child: inherited counts belong to the parent
+                self._counts = Counter()
+            self._pid = os.getpid()
+        thread = threading.Thread(target=self._run, name='analytics-flush', daemon=True)
+        thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            self.flush()
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def flush(self):
+        """Write buffered counts; safe to call from any thread"""
+        counts = self.drain()
+        if not counts or self._app is None:
+            return 0
+        try:
+            with self._app.app_context():
+                write_counts(counts)
+        except Exception as e:
+            self._app.logger.warning(f'Analytics flush failed, keeping {len(counts)} counter(s): {e}')
+            with self._lock:
+                if len(self._counts) + len(counts) <= MAX_PENDING_KEYS:
+                    self._counts.update(counts)
+            return 0
+        return len(counts)
+
+
+buffer = EventBuffer()
+
+
+def init_analytics(app):
+    buffer.init_app(app)
+
+
+def record_view(accommodation_id):
+    buffer.record('views', (accommodation_id,))
+
+
+def record_impressions(accommodation_ids):
+    buffer.record('impressions', accommodation_ids)
+
+
+def record_favorite(accommodation_id):
+    buffer.record('favorites', (accommodation_id,))
+
+
+# ------------------------------------------------------------------
+# Storage
+# ------------------------------------------------------------------
+def _rows(counts):
+    rows = {}
+    for (day, accommodation_id, event), count in counts.items():
+        row = rows.setdefault((day, accommodation_id), {
+            'day': day, 'accommodation_id': accommodation_id,
+            'views': 0, 'impressions': 0, 'favorites': 0,
+        })
+        row[event] += count
+    return list(rows.values())
+
+
+def write_counts(counts):
+    from app.models import AccommodationStat
+
+    table = AccommodationStat.__table__
+    rows = _rows(counts)
+    with db.engine.begin() as conn:
+        dialect = conn.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            for start in range(0, len(rows), UPSERT_CHUNK):
+                stmt = dialect_insert(table).values(rows[start:start + UPSERT_CHUNK])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['day', 'accommodation_id'],
+                    set_={name: table.c[name] + stmt.excluded[name] for name in EVENTS},
+                )
+                conn.execute(stmt)
+            return
+
+        for row in rows:
+            result = conn.execute(
+                update(table)
+                .where(and_(table.c.day == row['day'], table.c.accommodation_id == row['accommodation_id']))
+                .values({name: table.c[name] + row[name] for name in EVENTS})
+            )
+            if result.rowcount == 0:
+                conn.execute(insert(table).values(**row))
+
+
+# ------------------------------------------------------------------
+# Report
+# ------------------------------------------------------------------
+def most_viewed(days=7, limit=20, order='views'):
+    """Top accommodations over the last `days` days with view-through rate"""
+    from app.models import Accommodation, AccommodationStat as S
+
+    since = date.today() - timedelta(days=days - 1)
+    views = func.sum(S.views).label('views')
+    impressions = func.sum(S.impressions).label('impressions')
+    favorites = func.sum(S.favorites).label('favorites')
+    sort = {'views': views, 'impressions': impressions, 'favorites': favorites}.get(order, views)
+    stmt = (
+        select(S.accommodation_id, Accommodation.title, Accommodation.location, views, impressions, favorites)
+        .join(Accommodation, Accommodation.id == S.accommodation_id, isouter=True)
+        .where(S.day >= since)
+        .group_by(S.accommodation_id, Accommodation.title, Accommodation.location)
+        .order_by(sort.desc())
+        .limit(limit)
+    )
+    rows = []
+    for row in db.session.execute(stmt).mappings():
+        row = dict(row)
+        row['view_rate'] = row['views'] / row['impressions'] if row['impressions'] else None
+        rows.append(row)
+    return rows
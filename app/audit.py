@@ -0,0 +1,206 @@
+"""
+Admin audit log.
+
+audit() only puts a dict on an in-process queue, so admin requests never wait
+on the insert. A daemon writer thread per worker process takes entries off the
+queue and inserts them in batches. If the queue is full or an insert fails the
+entries are written to the application log instead, so nothing disappears
+silently. Rows are never updated or deleted through the ORM.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime
+
+from flask import has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event, insert
+
+from app import db
+
+
+class AuditWriter:
+    def __init__(self):
+        self._queue = None
+        self._app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batch_size = 200
+        self.flush_seconds = 2.0
+        self.written = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        self._app = app
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', 200)
+        self.flush_seconds = app.config.get('AUDIT_FLUSH_SECONDS', 2.0)
+        self._queue = queue.Queue(maxsize=app.config.get('AUDIT_QUEUE_SIZE', 10000))
+
+    def put(self, entry):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            self._app.logger.warning(f'Audit queue full, entry logged only: {_dumps(entry)}')
+
+    def _start(self):
+        # Started lazily so that every forked worker gets its own writer
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Queue contents inherited across fork are the parent's to write
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='audit-writer', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _take_batch(self, block):
+        batch = []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Wait for the first entry, then keep collecting until the batch
+            # is full or flush_seconds have passed
+            first = self._queue.get()
+            batch = [first] + self._take_batch(block=True)
+            self._write(batch)
+
+    def _write(self, batch):
+        from app.models import AuditLog
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(insert(AuditLog.__table__), batch)
+            self.written += len(batch)
+        except Exception as e:
+            self._app.logger.error(f'Audit insert failed for {len(batch)} entries: {e}')
+            for entry in batch:
+                self._app.logger.error(f'AUDIT {_dumps(entry)}')
+
+    def flush(self):
+        """Write everything queued in this process now"""
+        if self._queue is None:
+            return 0
+        count = 0
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return count
+            self._write(batch)
+            count += len(batch)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+
+writer = AuditWriter()
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    return str(value)
+
+
+def _dumps(entry):
+    return json.dumps({k: _jsonable(v) for k, v in entry.items()})
+
+
+def snapshot(obj, fields):
+    """Current values of `fields`, taken before a change for diff()"""
+    return {field: _jsonable(getattr(obj, field)) for field in fields}
+
+
+def diff(before, obj):
+    """{field: [old, new]} for the fields in `before` that changed on obj"""
+    changes = {}
+    for field, old in before.items():
+        new = _jsonable(getattr(obj, field))
+        if new != old:
+            changes[field] = [old, new]
+    return changes
+
+
+def audit(action, target=None, changes=None, target_type=None, target_id=None):
+    """Queue an audit entry for the current admin; never blocks"""
+    if target is not None:
+        target_type = target_type or type(target).__name__.lower()
+        target_id = target_id if target_id is not None else target.id
+    actor_id = actor_email = ip_address = None
+    if has_request_context():
+        ip_address = request.remote_addr
+        if current_user.is_authenticated:
+            actor_id = current_user.id
+            actor_email = current_user.email
+    writer.put({
+        'created_at': datetime.utcnow(),
+        'actor_id': actor_id,
+        'actor_email': actor_email,
+        'action': action,
+        'target_type': target_type,
+        'target_id': target_id,
+        'changes': changes or None,
+        'ip_address': ip_address,
+    })
+
+
+def _append_only(mapper, connection, target):
+    raise ValueError('The audit log is append-only')
+
+
+def init_audit(app):
+    from app.models import AuditLog
+    writer.init_app(app)
+    for hook in ('before_update', 'before_delete'):
+        if not event.contains(AuditLog, hook, _append_only):
+            event.listen(AuditLog, hook, _append_only)
+
+
+# ------------------------------------------------------------------
+# Query
+# ------------------------------------------------------------------
+def search_audit_log(actor=None, action=None, target_type=None, target_id=None,
+                     since=None, until=None, page=1, per_page=50):
+    from app.models import AuditLog
+
+    query = AuditLog.query
+    if actor:
+        if str(actor).isdigit():
+            query = query.filter(AuditLog.actor_id == int(actor))
+        else:
+            query = query.filter(AuditLog.actor_email == actor)
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if target_type:
+        query = query.filter(AuditLog.target_type == target_type)
+    if target_id is not None:
+        query = query.filter(AuditLog.target_id == target_id)
+    if since:
+        query = query.filter(AuditLog.created_at >= since)
+    if until:
+        query = query.filter(AuditLog.created_at < until)
+    return query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc())\
+        .paginate(page=page, per_page=per_page, error_out=False)
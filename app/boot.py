@@ -0,0 +1,157 @@
+"""
+Boot-time instrumentation for create_app.
+
+Each step is timed with perf_counter; the breakdown is logged once the app is
+built and kept in app.extensions['boot_timings'] for `flask boot-report`.
+"""
+import time
+from contextlib import contextmanager
+
+
+class BootTimer:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, (time.perf_counter() - start) * 1000))
+
+    def add(self, name, started, ended=None):
+        ended = ended if ended is not None else time.perf_counter()
+        self.steps.append((name, (ended - started) * 1000))
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total_ms, 1),
+            'steps': [{'step': name, 'ms': round(ms, 1)} for name, ms in self.steps],
+        }
+
+    def summary(self):
+        parts = ', '.join(f'{name} {ms:.0f}ms' for name, ms in self.steps)
+        return f'Boot finished in {self.total_ms:.0f}ms ({parts})'
+
+
+# ------------------------------------------------------------------
+# Import report
+# ------------------------------------------------------------------
+# Modules that must stay out of a freshly booted worker; they are imported
+# on first use (checkout, reconciliation, image uploads)
+LAZY_MODULES = ('stripe', 'PIL')
+
+# Imported one by one in a fresh interpreter so each RSS step is attributed
+# to the module that caused it; anything they pull in is counted with them
+REPORT_MODULES = (
+    'flask', 'sqlalchemy', 'flask_sqlalchemy', 'flask_migrate', 'flask_login',
+    'flask_wtf', 'wtforms', 'app', 'app.models', 'app.forms', 'app.helpers',
+    'app.routes.main', 'app.routes.auth', 'app.routes.bookings',
+    'app.routes.admin', 'app.commands',
+)
+
+_DRIVER = '''
+import importlib, json, os, sys, time
+
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+steps = []
+for name in sys.argv[2:]:
+    before, started = rss(), time.perf_counter()
+    importlib.import_module(name)
+    steps.append([name, (time.perf_counter() - started) * 1000, rss() - before])
+before, started = rss(), time.perf_counter()
+from app import create_app
+create_app(sys.argv[1])
+steps.append(['create_app()', (time.perf_counter() - started) * 1000, rss() - before])
+print(json.dumps({'steps': steps, 'rss': rss(), 'loaded': sorted(m for m in sys.modules if '.' not in m)}))
+'''
+
+
+def _parse_importtime(stderr):
+    """Self/cumulative microseconds per module from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def import_report(root, config_class='config.Config', top=20):
+    """Cold-import the app in a child interpreter and measure it"""
+    import json
+    import subprocess
+    import sys
+
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _DRIVER, config_class, *REPORT_MODULES],
+        cwd=root, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'import failed')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = _parse_importtime(proc.stderr)
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+    return {
+        'steps': [{'module': name, 'ms': round(ms, 1), 'rss_mb': round(rss / 2**20, 1)}
+                  for name, ms, rss in result['steps']],
+        'import_ms': round(sum(ms for _, ms, _ in result['steps']), 1),
+        'rss_mb': round(result['rss'] / 2**20, 1),
+        'slowest': [{'module': name, 'self_ms': round(s / 1000, 1), 'cumulative_ms': round(c / 1000, 1)}
+                    for name, (s, c, depth) in slowest if depth == 0][:top],
+        'lazy_loaded': [name for name in LAZY_MODULES if name in result['loaded']],
+    }
+
+
+# ------------------------------------------------------------------
+# Preload / fork
+# ------------------------------------------------------------------
+def precompile_templates(app):
+    """Compile every template into the Jinja cache so forked workers share it"""
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith('.html')]
+    # The default cache (400 entries) would start evicting and recompiling
+    if env.cache is not None and getattr(env.cache, 'capacity', 0) < len(names):
+        from jinja2.utils import LRUCache
+        env.cache = LRUCache(len(names) * 2)
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def prepare_for_fork(app):
+    """Run in the gunicorn master once the app is loaded, before any fork"""
+    import gc
+    count = precompile_templates(app)
+    # Move everything allocated so far into the permanent generation: the
+    # collector then never writes to those objects' headers, so the pages
+    # stay shared between the master and the workers
+    gc.collect()
+    gc.freeze()
+    app.logger.info(f'Preloaded: {count} templates compiled, {gc.get_freeze_count()} objects frozen')
+
+
+def after_fork(app):
+    """Run in each worker right after fork"""
+    from app import db
+    # Connections opened in the master must not be shared; drop the
+    # inherited pool entries without closing the master's sockets
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,323 @@
+import time
+
+import click
+from flask.cli import AppGroup
+
+# ------------------------------------------------------------------
+# Database setup
+# ------------------------------------------------------------------
+def reset_database_schema(app):
+    """Drop every table (CASCADE on PostgreSQL), including alembic_version"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.pool import NullPool
+    from app import db
+
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], poolclass=NullPool)
+    try:
+        with engine.connect() as connection:
+            if connection.dialect.name != 'postgresql':
+                db.metadata.drop_all(connection)
+                connection.execute(text('DROP TABLE IF EXISTS alembic_version'))
+                connection.commit()
+                app.logger.info("Schema reset completed successfully")
+                return True
+
+            result = connection.execute(text("""
+                SELECT tablename FROM pg_tables
+                WHERE schemaname = 'public'
+                AND tablename NOT LIKE 'pg_%'
+                AND tablename NOT LIKE 'sql_%';
+            """))
+            tables = [row[0] for row in result.fetchall()]
+            app.logger.info(f"Found tables to drop: {tables}")
+
+            for table in tables + ['alembic_version']:
+                try:
+                    connection.execute(text(f'DROP TABLE IF EXISTS "{table}" CASCADE'))
+                    connection.commit()
+                    app.logger.info(f"Dropped table: {table}")
+                except Exception as e:
+                    connection.rollback()
+                    app.logger.warning(f"Could not drop {table}: {e}")
+
+            app.logger.info("Schema reset completed successfully")
+            return True
+    except Exception as e:
+        app.logger.error(f"Schema reset error: {e}")
+        return False
+    finally:
+        engine.dispose()
+
+
+@click.command('init-db')
+def init_db_command():
+    """Create missing tables and seed the admin user (safe to re-run)."""
+    from flask import current_app
+    from app import init_database
+    if not init_database(current_app):
+        raise click.ClickException('Database initialisation failed, see the log')
+    click.echo('Database initialised')
+
+
+@click.command('reset-db')
+@click.option('--yes', is_flag=True, help='Confirm dropping every table.')
+def reset_db_command(yes):
+    """Drop ALL tables, then recreate the schema and admin user."""
+    from flask import current_app
+    from app import init_database
+    if not yes:
+        click.confirm('This drops every table and all data. Continue?', abort=True)
+    if not reset_database_schema(current_app):
+        raise click.ClickException('Schema reset failed, see the log')
+    if not init_database(current_app):
+        raise click.ClickException('Database initialisation failed, see the log')
+    click.echo('Database reset')
+
+
+@click.command('boot-report')
+@click.option('--json', 'as_json', is_flag=True, help='Print the timings as JSON.')
+def boot_report_command(as_json):
+    """Show how long each create_app step took in this process."""
+    import json
+    from flask import current_app
+    timings = current_app.extensions['boot_timings']
+    if as_json:
+        click.echo(json.dumps(timings, indent=2))
+        return
+    for step in timings['steps']:
+        click.echo(f"{step['step']:<12} {step['ms']:8.1f} ms")
+    click.echo(f"{'total':<12} {timings['total_ms']:8.1f} ms")
+
+
+# ------------------------------------------------------------------
+# Waitlist
+# ------------------------------------------------------------------
+waitlist_cli = AppGroup('waitlist', help='Waitlist maintenance.')
+
+
+@waitlist_cli.command('expire-offers')
+def expire_waitlist_offers():
+    """Expire lapsed waitlist offers and promote the next students."""
+    from app.waitlist import expire_offers
+    expired = expire_offers()
+    click.echo(f'Expired {expired} waitlist offer(s)')
+
+
+# ------------------------------------------------------------------
+# Payments
+# ------------------------------------------------------------------
+payments_cli = AppGroup('payments', help='Payment maintenance.')
+
+
+@payments_cli.command('reconcile')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), required=True, help='First day (UTC).')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Day after the last day (UTC), default today.')
+@click.option('--workers', default=4, show_default=True, help='Concurrent Stripe pagers.')
+@click.option('--window-hours', default=24, show_default=True, help='Size of each Stripe listing window.')
+@click.option('--fix', is_flag=True, help='Write corrections instead of only reporting.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None, help='Resume file; completed windows are skipped (same --fix and --window-hours only).')
+@click.option('--fake', is_flag=True, help='Use the offline fake built from local bookings.')
+@click.option('--seed', default=0, help='Seed for the fake client.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the full report as JSON.')
+def reconcile_payments(since, until, workers, window_hours, fix, checkpoint, fake, seed, as_json):
+    """Check Payment and Booking rows against Stripe."""
+    import json
+    from datetime import datetime, timedelta
+    from flask import current_app
+    from app.reconciliation import CheckpointMismatch, FakeStripeClient, StripeClient, reconcile
+
+    until = until or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    if fake:
+        client = FakeStripeClient(seed=seed).load_from_database(since, until)
+    else:
+        client = StripeClient(current_app.config['STRIPE_SECRET_KEY'])
+
+    def progress(window_start, count, report):
+        click.echo(f'{window_start:%Y-%m-%d %H:%M}  {count:6d} intents  {sum(report.counts.values()):6d} mismatches', err=True)
+
+    started = time.monotonic()
+    try:
+        report = reconcile(client, since, until, workers=workers, fix=fix, checkpoint_path=checkpoint,
+                           window=timedelta(hours=window_hours), progress=progress)
+    except CheckpointMismatch as e:
+        raise click.ClickException(str(e))
+    result = report.as_dict()
+    result['seconds'] = round(time.monotonic() - started, 2)
+
+    if as_json:
+        click.echo(json.dumps(result, indent=2, default=str))
+        return
+    click.echo(f"Checked {result['intents_checked']} payment intents in {result['windows']} window(s) "
+               f"({result['skipped_windows']} resumed) in {result['seconds']}s")
+    for kind, count in sorted(result['mismatches'].items()):
+        click.echo(f'  {kind}: {count}')
+    click.echo(f"Fixed {result['fixed']} row(s)" if fix else 'Report only, run with --fix to correct')
+    if fix and result['fixed']:
+        from app.rollups import rebuild_rollups
+        rebuild_rollups(since=since.date())
+
+
+# ------------------------------------------------------------------
+# Revenue rollups
+# ------------------------------------------------------------------
+rollups_cli = AppGroup('rollups', help='Revenue rollup tables.')
+
+
+@rollups_cli.command('rebuild')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Only rebuild from the month of this day onwards.')
+def rebuild_revenue_rollups(since):
+    """Recompute daily and monthly revenue rollups from payments."""
+    from app.rollups import rebuild_rollups
+    started = time.monotonic()
+    counts = rebuild_rollups(since=since.date() if since else None)
+    click.echo(f"Rebuilt {counts['daily_rows']} daily and {counts['monthly_rows']} monthly row(s) "
+               f"in {time.monotonic() - started:.2f}s")
+
+
+
+# ------------------------------------------------------------------
+# Bulk import
+# ------------------------------------------------------------------
+import_cli = AppGroup('import', help='Bulk CSV imports.')
+
+
+def _report_import(result, errors):
+    click.echo(f"{'Validated' if result.dry_run else 'Imported'} {result.imported} of {result.total} "
+               f"{result.kind} in {result.elapsed:.1f}s, {result.failed_lines} row(s) rejected")
+    for e in result.errors[:20]:
+        click.echo(f"  line {e['line']}: {e['field'] or 'row'}: {e['message']}")
+    if len(result.errors) > 20:
+        click.echo(f'  ... {len(result.errors) - 20} more')
+    if errors and result.errors:
+        result.write_errors(errors)
+        click.echo(f'Error report written to {errors.name}')
+
+
+@import_cli.command('users')
+@click.argument('csv_file', type=click.File('rb'))
+@click.option('--dry-run', is_flag=True, help='Validate only, write nothing.')
+@click.option('--batch-size', type=int, default=None, help='Rows per batch (default IMPORT_BATCH_SIZE).')
+@click.option('--workers', type=int, default=None, help='Password hashing processes (default IMPORT_HASH_WORKERS).')
+@click.option('--errors', type=click.File('w'), default=None, help='Write rejected rows to this CSV.')
+def import_users_command(csv_file, dry_run, batch_size, workers, errors):
+    """Import students from a CSV file."""
+    from app.imports import import_users
+    _report_import(import_users(csv_file, dry_run=dry_run, batch_size=batch_size, workers=workers), errors)
+
+
+@import_cli.command('accommodations')
+@click.argument('csv_file', type=click.File('rb'))
+@click.option('--admin-email', default=None, help='Admin recorded as having added the listings.')
+@click.option('--dry-run', is_flag=True, help='Validate only, write nothing.')
+@click.option('--batch-size', type=int, default=None, help='Rows per batch (default IMPORT_BATCH_SIZE).')
+@click.option('--errors', type=click.File('w'), default=None, help='Write rejected rows to this CSV.')
+def import_accommodations_command(csv_file, admin_email, dry_run, batch_size, errors):
+    """Import accommodation listings from a CSV file."""
+    from app.imports import import_accommodations
+    from app.models import User
+    admin_id = None
+    if admin_email:
+        admin = User.query.filter_by(email=admin_email).first()
+        if admin is None:
+            raise click.BadParameter(f'No user with email {admin_email}', param_hint='--admin-email')
+        admin_id = admin.id
+    _report_import(import_accommodations(csv_file, admin_id=admin_id, dry_run=dry_run, batch_size=batch_size), errors)
+
+
+@click.command('import-report')
+@click.option('--top', default=15, show_default=True, help='Slowest imports to list.')
+@click.option('--budget-ms', type=int, default=None, help='Fail above this import time (default IMPORT_BUDGET_MS).')
+@click.option('--budget-rss', type=int, default=None, help='Fail above this RSS in MB (default IMPORT_BUDGET_RSS_MB).')
+@click.option('--json', 'as_json', is_flag=True, help='Print the report as JSON.')
+def import_report_command(top, budget_ms, budget_rss, as_json):
+    """Cold-import the app in a fresh interpreter and check the budget."""
+    import json
+    import os
+    from flask import current_app
+    from app.boot import import_report
+
+    budget_ms = budget_ms or current_app.config['IMPORT_BUDGET_MS']
+    budget_rss = budget_rss or current_app.config['IMPORT_BUDGET_RSS_MB']
+    try:
+        report = import_report(os.path.dirname(current_app.root_path), top=top)
+    except RuntimeError as e:
+        raise click.ClickException(f'Import failed: {e}')
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2))
+    else:
+        click.echo(f"{'step':<22} {'ms':>8} {'+RSS MB':>8}")
+        for step in report['steps']:
+            click.echo(f"{step['module']:<22} {step['ms']:8.1f} {step['rss_mb']:8.1f}")
+        click.echo("\nSlowest imports:")
+        for mod in report['slowest']:
+            click.echo(f"  {mod['module']:<30} {mod['cumulative_ms']:8.1f} ms")
+        click.echo(f"\nTotal {report['import_ms']:.0f} ms (budget {budget_ms}), "
+                   f"RSS {report['rss_mb']:.1f} MB (budget {budget_rss})")
+
+    problems = []
+    if report['import_ms'] > budget_ms:
+        problems.append(f"import time {report['import_ms']:.0f} ms > {budget_ms} ms")
+    if report['rss_mb'] > budget_rss:
+        problems.append(f"RSS {report['rss_mb']:.1f} MB > {budget_rss} MB")
+    if report['lazy_loaded']:
+        problems.append(f"loaded at boot: {', '.join(report['lazy_loaded'])}")
+    if problems:
+        raise click.ClickException('Over budget: ' + '; '.join(problems))
+
+
+# ------------------------------------------------------------------
+# Synthetic data
+# ------------------------------------------------------------------
+@click.command('generate-data')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--accommodations', default=100, show_default=True)
+@click.option('--bookings', default=5000, show_default=True)
+@click.option('--reviews', default=5000, show_default=True)
+@click.option('--favorites', default=2000, show_default=True)
+@click.option('--images-per-listing', default=3, show_default=True, help='Up to this many images per listing.')
+@click.option('--years', default=3, show_default=True, help='Years of booking history.')
+@click.option('--seed', default=0, show_default=True, help='Same seed and sizes give the same rows.')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Last day of generated history (default today); fix it for identical reruns.')
+@click.option('--batch-size', type=int, default=None, help='Rows per COPY/INSERT batch (default IMPORT_BATCH_SIZE).')
+@click.option('--yes', is_flag=True, help='Do not ask before writing to a non-SQLite database.')
+def generate_data_command(users, accommodations, bookings, reviews, favorites, images_per_listing,
+                          years, seed, until, batch_size, yes):
+    """Insert deterministic synthetic users, listings, bookings and reviews."""
+    from app import db
+    from app.datagen import generate
+
+    if db.engine.dialect.name != 'sqlite' and not yes:
+        click.confirm(f'Add generated rows to {db.engine.url.render_as_string(hide_password=True)}?', abort=True)
+
+    written = {}
+
+    def progress(table, count):
+        written[table] = written.get(table, 0) + count
+        click.echo(f'\r{table:<22} {written[table]:>10,d}', nl=False, err=True)
+
+    try:
+        counts = generate(users=users, accommodations=accommodations, bookings=bookings, reviews=reviews,
+                          favorites=favorites, images_per_listing=images_per_listing, years=years, seed=seed,
+                          until=until, batch_size=batch_size, progress=progress)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo('', err=True)
+    seconds = counts.pop('seconds')
+    for table, count in counts.items():
+        click.echo(f'{table:<22} {count:>10,d}')
+    click.echo(f'Generated {sum(counts.values()):,d} rows in {seconds}s')
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(reset_db_command)
+    app.cli.add_command(boot_report_command)
+    app.cli.add_command(import_report_command)
+    app.cli.add_command(generate_data_command)
+    app.cli.add_command(waitlist_cli)
+    app.cli.add_command(payments_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(import_cli)
@@ -0,0 +1,79 @@
+"""
+Conditional GET for the public listing pages.
+
+A view decorated with @conditional(validator) calls validator(**view_args)
+before doing any work. The validator reads what the page depends on with one
+cheap query and returns (parts, last_modified). The ETag is a hash of those
+parts, the query string, the signed-in user and ETAG_VERSION (the deployed
+release, so a template change invalidates every page). When If-None-Match
+matches, or for anonymous visitors If-Modified-Since is not older than
+last_modified, the view is skipped and an empty 304 is sent.
+
+The page is rendered as usual when flashed messages are waiting in the
+session, or when the validator returns None because the page depends on
+more than it can cheaply see (e.g. a student's waitlist position).
+"""
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+
+
+def _etag(parts):
+    user = current_user.get_id() if current_user.is_authenticated else None
+    raw = repr((current_app.config.get('ETAG_VERSION', ''), request.full_path, user, parts))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match wins when both are sent (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(validator, not_modified=None):
+    """
+    Answer repeat GETs with 304 when validator(**view_args) is unchanged.
+    not_modified(**view_args) runs instead of the view on a 304.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if (not current_app.config.get('CONDITIONAL_GET_ENABLED', True)
+                    or request.method != 'GET' or session.get('_flashes')):
+                return f(*args, **kwargs)
+
+            state = validator(**kwargs)
+            if state is None:
+                return f(*args, **kwargs)
+            parts, last_modified = state
+            etag = _etag(parts)
+            # Last-Modified cannot tell one signed-in student from another
+            if last_modified and not current_user.is_authenticated:
+                last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+            else:
+                last_modified = None
+
+            if _not_modified(etag, last_modified):
+                if not_modified:
+                    not_modified(**kwargs)
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            # Browsers keep the page but ask again every time
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,405 @@
+"""
+Deterministic synthetic data at production scale.
+
+generate() adds users, accommodations with images, bookings, payments,
+reviews and favorites. On the same starting database, the same sizes, seed
+and end date always give the same rows.
+Distributions are skewed the way real traffic is:
+
+* accommodation popularity follows a Zipf curve, so a few listings take
+  most bookings, reviews and favorites
+* bookings cluster at the start of each term (January/February, July)
+* booking statuses, durations and ratings follow fixed weights
+
+Rows are produced in batches and written with COPY on PostgreSQL and
+executemany INSERTs elsewhere; payments are written with the batch of
+bookings they belong to. Memory grows only with the listings and with the
+(user, accommodation) keys that keep reviews and favorites unique, one
+integer per row.
+IDs continue after the largest existing ID, and generated student and ID
+numbers start with a G, which no real (all-digit) number does, so generated
+data can be added to a database that already has rows. Every generated
+user has the password DATAGEN_PASSWORD; it is hashed once.
+"""
+import io
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, select, text, update
+
+from app import db
+from app.helpers import calculate_total_price
+from app.imports import _copy_rows
+
+ROOM_TYPES = (('single', 30), ('double', 20), ('shared', 30), ('studio', 12), ('apartment', 8))
+# Base monthly price per room type in ZAR
+ROOM_PRICES = {'single': 5200, 'double': 4400, 'shared': 3600, 'studio': 6800, 'apartment': 8200}
+LOCATIONS = (
+    'Braamfontein, Johannesburg', 'Auckland Park, Johannesburg', 'Hatfield, Pretoria',
+    'Sunnyside, Pretoria', 'Observatory, Cape Town', 'Rondebosch, Cape Town',
+    'Stellenbosch Central, Stellenbosch', 'Glenwood, Durban', 'Westville, Durban',
+    'Brandwag, Bloemfontein', 'Potchefstroom Central, Potchefstroom', 'Makhanda, Eastern Cape',
+)
+AMENITIES = ('wifi', 'laundry', 'kitchen', 'parking', 'gym', 'pool', 'tv', 'ac',
+             'heating', 'security', 'cleaning', 'study', 'furnished')
+BOOKING_STATUSES = (('paid', 55), ('approved', 15), ('pending', 12), ('cancelled', 18))
+PAYERS = (('nsfas', 45), ('bursary', 15), ('parent', 25), ('guardian', 8), ('self', 7))
+RATINGS = ((5, 38), (4, 34), (3, 15), (2, 7), (1, 6))
+# Month weights for booking dates: peaks before each semester starts
+MONTH_WEIGHTS = (16, 14, 6, 4, 4, 9, 12, 6, 5, 6, 8, 10)
+COMMENTS = (
+    'Close to campus and quiet during exams.', 'Wifi drops in the evenings.',
+    'Friendly staff, clean kitchen.', 'Good value for the area.',
+    'Rooms are small but well furnished.', 'Security is excellent.', None,
+)
+IMAGE_PALETTE_SIZE = 24
+
+
+class Picker:
+    """Weighted choice with precomputed cumulative weights"""
+
+    def __init__(self, rng, items, weights):
+        self.rng = rng
+        self.items = list(items)
+        self.cum_weights = list(accumulate(weights))
+
+    def pick(self, k=1):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+    def one(self):
+        return self.pick()[0]
+
+
+def zipf(rng, items, s=1.1):
+    """Picker where the n-th item is drawn ~1/n^s as often as the first"""
+    items = list(items)
+    ranked = items[:]
+    # Popularity is not tied to ID order
+    rng.shuffle(ranked)
+    return Picker(rng, ranked, [1 / (rank ** s) for rank in range(1, len(ranked) + 1)])
+
+
+def weighted(rng, pairs):
+    return Picker(rng, [item for item, _ in pairs], [weight for _, weight in pairs])
+
+
+# ------------------------------------------------------------------
+# Writing
+# ------------------------------------------------------------------
+class Writer:
+    def __init__(self, batch_size, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.counts = {}
+
+    def write(self, table, rows):
+        """Write an iterable of row dicts in batches; returns the row count"""
+        batch, total = [], 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                total += self._flush(table, batch)
+                batch = []
+        if batch:
+            total += self._flush(table, batch)
+        self.counts[table.name] = self.counts.get(table.name, 0) + total
+        return total
+
+    def _flush(self, table, batch):
+        conn = db.session.connection()
+        if conn.dialect.name == 'postgresql':
+            _copy_rows(conn, table, list(batch[0]), batch)
+        else:
+            conn.execute(insert(table), batch)
+        db.session.commit()
+        if self.progress:
+            self.progress(table.name, len(batch))
+        return len(batch)
+
+
+def _next_id(table):
+    return (db.session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _reset_sequences(tables):
+    """COPY with explicit IDs does not advance PostgreSQL's serial sequences"""
+    conn = db.session.connection()
+    if conn.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table.name}), 1))"
+        ))
+    db.session.commit()
+
+
+def image_palette(rng, count=IMAGE_PALETTE_SIZE):
+    """Small JPEGs in different colours, stored base64 like uploaded images"""
+    import base64
+    # Pillow is only needed here, not at worker boot
+    from PIL import Image, ImageDraw
+
+    palette = []
+    for _ in range(count):
+        image = Image.new('RGB', (160, 120), tuple(rng.randrange(40, 230) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(4):
+            x, y = rng.randrange(0, 140), rng.randrange(0, 100)
+            draw.rectangle((x, y, x + rng.randrange(10, 60), y + rng.randrange(10, 40)),
+                           fill=tuple(rng.randrange(0, 255) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=70)
+        palette.append(base64.b64encode(buffer.getvalue()).decode('ascii'))
+    return palette
+
+
+# ------------------------------------------------------------------
+# Row generators
+# ------------------------------------------------------------------
+def _random_moment(rng, now, years):
+    """A moment in the last `years` years, clustered around term starts"""
+    year = now.year - rng.randrange(0, years)
+    month = rng.choices(range(1, 13), MONTH_WEIGHTS)[0]
+    moment = datetime(year, month, rng.randint(1, 28), rng.randrange(7, 23), rng.randrange(60), rng.randrange(60))
+    if moment > now:
+        moment -= timedelta(days=365)
+    return moment
+
+
+def _users(first_id, count, password_hash, now, rng):
+    for i in range(first_id, first_id + count):
+        yield {
+            'id': i,
+            'student_number': f'G{i:07d}',
+            'full_name': f'Student {i}',
+            'email': f'student{i}@datagen.campusstay.co.za',
+            'password_hash': password_hash,
+            'id_number': f'G{i:012d}',
+            'phone_number': f'07{rng.randrange(10**8):08d}',
+            'role': 'admin' if i % 500 == 0 else 'user',
+            'created_at': now - timedelta(days=rng.randrange(0, 1100), seconds=rng.randrange(86400)),
+        }
+
+
+def _accommodations(first_id, count, admin_id, now, rng):
+    room_types = weighted(rng, ROOM_TYPES)
+    for i in range(first_id, first_id + count):
+        room_type = room_types.one()
+        created = now - timedelta(days=rng.randrange(0, 1100), seconds=rng.randrange(86400))
+        yield {
+            'id': i,
+            'title': f'{rng.choice(("Campus", "Varsity", "Scholar", "Academy", "Student"))} '
+                     f'{rng.choice(("House", "Lofts", "Residence", "Court", "Village"))} {i}',
+            'description': 'Furnished student accommodation with study areas, '
+                           'secure access and transport to campus.',
+            'room_type': room_type,
+            # Log-normal spread around the room type's base price, R50 steps
+            'price_per_month': float(round(ROOM_PRICES[room_type] * rng.lognormvariate(0, 0.25) / 50) * 50),
+            'location': rng.choice(LOCATIONS),
+            'capacity': rng.choices((1, 2, 4, 10, 40, 120), (20, 20, 20, 20, 12, 8))[0],
+            'current_occupancy': 0,
+            'amenities': sorted(rng.sample(AMENITIES, rng.randint(2, 7))),
+            'status': 'available',
+            'admin_id': admin_id,
+            'created_at': created,
+            'updated_at': created,
+        }
+
+
+def _images(accommodation_ids, palette, per_listing, now, rng):
+    for accommodation_id in accommodation_ids:
+        for n in range(rng.randint(1, per_listing)):
+            yield {
+                'accommodation_id': accommodation_id,
+                'image_data': rng.choice(palette),
+                'image_type': 'image/jpeg',
+                'filename': f'acc_{accommodation_id}_{n}.jpg',
+                'created_at': now,
+            }
+
+
+def _bookings(first_id, count, users, listings, prices, now, years, rng, payments, active):
+    statuses = weighted(rng, BOOKING_STATUSES)
+    payers = weighted(rng, PAYERS)
+    for i in range(first_id, first_id + count):
+        accommodation_id = listings.one()
+        duration = 'annual' if rng.random() < 0.6 else 'semester'
+        status = statuses.one()
+        created = _random_moment(rng, now, years)
+        total = calculate_total_price(prices[accommodation_id], duration)
+        yield {
+            'id': i,
+            'user_id': users.one(),
+            'accommodation_id': accommodation_id,
+            'duration': duration,
+            'period': None if duration == 'annual' else ('SEM1' if created.month < 6 else 'SEM2'),
+            'payment_responsible': payers.one(),
+            'total_price': total,
+            'status': status,
+            'stripe_session_id': f'cs_gen_{i}' if status in ('paid', 'approved') else None,
+            'stripe_payment_intent_id': f'pi_gen_{i}' if status in ('paid', 'approved') else None,
+            'created_at': created,
+            'updated_at': created,
+        }
+        if status in ('approved', 'paid'):
+            active[accommodation_id] += 1
+        if status == 'paid':
+            payments.append((i, total, created + timedelta(minutes=rng.randrange(5, 600)), 'succeeded'))
+        elif status == 'cancelled' and rng.random() < 0.2:
+            payments.append((i, total, created + timedelta(minutes=rng.randrange(5, 600)), 'failed'))
+
+
+def _payments(pending):
+    for booking_id, amount, created, status in pending:
+        yield {
+            'booking_id': booking_id,
+            'stripe_payment_id': f'pi_gen_{booking_id}',
+            'amount': amount,
+            'status': status,
+            'created_at': created,
+        }
+
+
+def _pairs(count, users, listings, rng, taken):
+    """Unique (user, accommodation) pairs drawn from the skewed pickers"""
+    attempts = 0
+    produced = 0
+    while produced < count and attempts < count * 20:
+        attempts += 1
+        user_id, accommodation_id = users.one(), listings.one()
+        # One int per pair instead of a tuple keeps the set a third of the size
+        key = user_id << 32 | accommodation_id
+        if key in taken:
+            continue
+        taken.add(key)
+        produced += 1
+        yield user_id, accommodation_id
+
+
+def _reviews(count, users, listings, now, rng):
+    ratings = weighted(rng, RATINGS)
+    for user_id, accommodation_id in _pairs(count, users, listings, rng, set()):
+        yield {
+            'user_id': user_id,
+            'accommodation_id': accommodation_id,
+            'rating': ratings.one(),
+            'comment': rng.choice(COMMENTS),
+            'created_at': now - timedelta(days=rng.randrange(0, 700), seconds=rng.randrange(86400)),
+        }
+
+
+def _favorites(count, users, listings, now, rng):
+    for user_id, accommodation_id in _pairs(count, users, listings, rng, set()):
+        yield {
+            'user_id': user_id,
+            'accommodation_id': accommodation_id,
+            'created_at': now - timedelta(days=rng.randrange(0, 400)),
+        }
+
+
+# ------------------------------------------------------------------
+# Entry point
+# ------------------------------------------------------------------
+def generate(users=1000, accommodations=100, bookings=5000, reviews=5000, favorites=2000,
+             images_per_listing=3, years=3, seed=0, until=None, batch_size=None, password=None,
+             progress=None):
+    """
+    Generate and insert a dataset; returns {table: rows written, 'seconds': elapsed}.
+    Dates run up to `until` (default: today at midnight), so runs on different
+    days only match when `until` is given.
+    """
+    from werkzeug.security import generate_password_hash
+    from app.passwords import hash_params
+    from app.models import (Accommodation, AccommodationImage, Booking, Favorite,
+                            Payment, Review, User)
+    from app.rollups import rebuild_rollups
+
+    started = time.monotonic()
+    rng = random.Random(seed)
+    now = until or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    config = current_app.config
+    writer = Writer(batch_size or config.get('IMPORT_BATCH_SIZE', 5000), progress)
+    method, salt_length = hash_params(config)
+    password_hash = generate_password_hash(password or config.get('DATAGEN_PASSWORD', 'password123'),
+                                           method=method, salt_length=salt_length)
+
+    user_table, acc_table = User.__table__, Accommodation.__table__
+    first_user = _next_id(user_table)
+    if first_user + users > 10 ** 7:
+        raise ValueError('Generated student numbers are G plus 7 digits; at most 9,999,999 user IDs')
+    writer.write(user_table, _users(first_user, users, password_hash, now, rng))
+    user_ids = range(first_user, first_user + users)
+
+    admin_id = db.session.execute(select(User.id).where(User.role == 'admin').order_by(User.id)).scalar()
+    first_acc = _next_id(acc_table)
+    prices, listings = {}, {}
+
+    def listings_rows():
+        for row in _accommodations(first_acc, accommodations, admin_id, now, rng):
+            prices[row['id']] = row['price_per_month']
+            listings[row['id']] = (row['capacity'], row['created_at'])
+            yield row
+
+    writer.write(acc_table, listings_rows())
+    acc_ids = range(first_acc, first_acc + accommodations)
+
+    if images_per_listing and accommodations:
+        writer.write(AccommodationImage.__table__,
+                     _images(acc_ids, image_palette(rng), images_per_listing, now, rng))
+
+    if users and accommodations:
+        # Some students are far more active than others, and some listings far more popular
+        user_picker = zipf(rng, user_ids, s=0.6)
+        listing_picker = zipf(rng, acc_ids, s=1.1)
+
+        # Bookings go out one batch at a time, each followed by its payments
+        active = Counter()
+        first_booking = _next_id(Booking.__table__)
+        for start in range(first_booking, first_booking + bookings, writer.batch_size):
+            count = min(writer.batch_size, first_booking + bookings - start)
+            payments = []
+            writer.write(Booking.__table__, _bookings(start, count, user_picker, listing_picker, prices,
+                                                      now, years, rng, payments, active))
+            writer.write(Payment.__table__, _payments(payments))
+        writer.write(Review.__table__, _reviews(reviews, user_picker, listing_picker, now, rng))
+        writer.write(Favorite.__table__, _favorites(favorites, user_picker, listing_picker, now, rng))
+
+        _set_occupancy(listings, active)
+
+    _reset_sequences([user_table, acc_table, AccommodationImage.__table__, Booking.__table__,
+                      Payment.__table__, Review.__table__, Favorite.__table__])
+    rebuild_rollups()
+    return dict(writer.counts, seconds=round(time.monotonic() - started, 1))
+
+
+def _set_occupancy(listings, active):
+    """Occupancy from the approved and paid bookings, capped at capacity"""
+    from app.models import Accommodation
+
+    table = Accommodation.__table__
+    rows = []
+    for accommodation_id, count in active.items():
+        capacity, created = listings[accommodation_id]
+        occupancy = min(count, capacity)
+        rows.append({
+            'b_id': accommodation_id,
+            'current_occupancy': occupancy,
+            'status': 'fully_occupied' if occupancy >= capacity else 'available',
+            # Set explicitly, otherwise onupdate stamps the time of the run
+            'updated_at': created,
+        })
+    if rows:
+        db.session.connection().execute(
+            update(table).where(table.c.id == bindparam('b_id')).values(
+                current_occupancy=bindparam('current_occupancy'),
+                status=bindparam('status'),
+                updated_at=bindparam('updated_at'),
+            ),
+            rows,
+        )
+        db.session.commit()
@@ -0,0 +1,158 @@
+"""
+Read-replica routing.
+
+Views marked with @use_replica send their plain SELECTs to one of the
+replica binds (SQLALCHEMY_BINDS keys replica_0, replica_1, ... built from
+DATABASE_REPLICA_URLS). Everything else stays on the primary:
+
+* flushes, INSERT/UPDATE/DELETE and SELECT ... FOR UPDATE
+* any read after the session has written in this request
+* every request for REPLICA_STICKY_SECONDS after this browser session wrote
+  (read-your-writes)
+* replicas whose replication lag exceeds REPLICA_MAX_LAG_SECONDS or that
+  cannot be reached; lag is re-checked every REPLICA_CHECK_SECONDS
+
+This module must not import the app package, which creates db with
+RoutingSession.
+"""
+import random
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+REPLICA_PREFIX = 'replica_'
+
+# Lag in seconds; 0 when the replica has replayed everything it received and
+# NULL (treated as 0) when the server is not a streaming replica
+POSTGRES_LAG_SQL = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if clause is not None and getattr(clause, 'is_dml', False):
+                self.info['db_wrote'] = True
+            elif self._can_use_replica(clause):
+                return self._db.engines[g.db_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _can_use_replica(self, clause):
+        return (
+            g.get('db_replica') is not None
+            and not self._flushing
+            and not self.info.get('db_wrote')
+            and clause is not None
+            and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None
+        )
+
+
+def _mark_written(session, flush_context):
+    session.info['db_wrote'] = True
+
+
+# ------------------------------------------------------------------
+# Replica health
+# ------------------------------------------------------------------
+class ReplicaMonitor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def lag(self, key, engine, check_seconds):
+        """Cached replication lag in seconds, None when the replica is unusable"""
+        now = time.monotonic()
+        with self._lock:
+            checked_at, lag = self._state.get(key, (None, None))
+            if checked_at is not None and now - checked_at < check_seconds:
+                return lag
+            # Claim the check so concurrent requests keep using the cached value
+            self._state[key] = (now, lag)
+        lag = self._measure(key, engine)
+        with self._lock:
+            self._state[key] = (time.monotonic(), lag)
+        return lag
+
+    def _measure(self, key, engine):
+        try:
+            with engine.connect() as conn:
+                if conn.dialect.name == 'postgresql':
+                    return float(conn.execute(POSTGRES_LAG_SQL).scalar() or 0)
+                conn.execute(text('SELECT 1'))
+                return 0.0
+        except Exception as e:
+            current_app.logger.warning(f'Replica {key} unavailable: {e}')
+            return None
+
+    def status(self):
+        with self._lock:
+            return {key: lag for key, (_, lag) in self._state.items()}
+
+
+monitor = ReplicaMonitor()
+
+
+def replica_keys(app=None):
+    binds = (app or current_app).config.get('SQLALCHEMY_BINDS') or {}
+    return sorted(key for key in binds if key.startswith(REPLICA_PREFIX))
+
+
+def choose_replica():
+    """A replica within the staleness tolerance, or None for the primary"""
+    from app import db
+
+    max_lag = current_app.config.get('REPLICA_MAX_LAG_SECONDS', 10)
+    check_seconds = current_app.config.get('REPLICA_CHECK_SECONDS', 5)
+    healthy = []
+    for key in replica_keys():
+        lag = monitor.lag(key, db.engines[key], check_seconds)
+        if lag is not None and lag <= max_lag:
+            healthy.append(key)
+    return random.choice(healthy) if healthy else None
+
+
+# ------------------------------------------------------------------
+# Request hooks
+# ------------------------------------------------------------------
+def use_replica(view):
+    """Mark a read-only view as safe to serve from a replica"""
+    view.use_replica = True
+    return view
+
+
+def _route_request():
+    g.db_replica = None
+    if request.method not in ('GET', 'HEAD'):
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, 'use_replica', False):
+        return
+    sticky = current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+    if time.time() - session.get('db_write_at', 0) < sticky:
+        return
+    g.db_replica = choose_replica()
+
+
+def _remember_write(response):
+    from app import db
+    if has_request_context() and db.session.info.get('db_wrote'):
+        session['db_write_at'] = time.time()
+    return response
+
+
+def init_routing(app, db):
+    if not replica_keys(app):
+        return
+    if not event.contains(db.session, 'after_flush', _mark_written):
+        event.listen(db.session, 'after_flush', _mark_written)
+    app.before_request(_route_request)
+    app.after_request(_remember_write)
+    app.logger.info(f"Read replicas enabled: {', '.join(replica_keys(app))}")
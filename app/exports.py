@@ -0,0 +1,258 @@
+"""
+Streaming CSV / NDJSON exports for the admin area.
+
+Rows are selected as plain columns (never ORM objects, so nothing piles up in
+the identity map) and read with yield_per, which uses a server-side cursor on
+PostgreSQL. Output is written in small chunks as rows arrive, so memory stays
+flat and the first byte goes out before the query has finished.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from app import db
+
+YIELD_PER = 1000
+ROWS_PER_CHUNK = 500
+
+# Cells starting with these are treated as formulas by spreadsheet programs
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+# ------------------------------------------------------------------
+# Datasets
+# ------------------------------------------------------------------
+def _bookings():
+    from app.models import Accommodation, Booking, User
+    return {
+        'columns': {
+            'id': Booking.id,
+            'status': Booking.status,
+            'created_at': Booking.created_at,
+            'updated_at': Booking.updated_at,
+            'duration': Booking.duration,
+            'period': Booking.period,
+            'payment_responsible': Booking.payment_responsible,
+            'total_price': Booking.total_price,
+            'user_id': Booking.user_id,
+            'student_number': User.student_number,
+            'full_name': User.full_name,
+            'email': User.email,
+            'accommodation_id': Booking.accommodation_id,
+            'accommodation': Accommodation.title,
+            'location': Accommodation.location,
+            'stripe_session_id': Booking.stripe_session_id,
+            'stripe_payment_intent_id': Booking.stripe_payment_intent_id,
+        },
+        'default': ['id', 'status', 'created_at', 'student_number', 'full_name', 'email',
+                    'accommodation', 'duration', 'total_price'],
+        'joins': [(User, User.id == Booking.user_id), (Accommodation, Accommodation.id == Booking.accommodation_id)],
+        'filters': {
+            'status': lambda v: Booking.status == v,
+            'accommodation_id': lambda v: Booking.accommodation_id == int(v),
+            'since': lambda v: Booking.created_at >= _parse_date(v),
+            'until': lambda v: Booking.created_at < _parse_date(v),
+        },
+        'model': Booking,
+        'order_by': Booking.id,
+    }
+
+
+def _users():
+    from app.models import User
+    return {
+        'columns': {
+            'id': User.id,
+            'student_number': User.student_number,
+            'full_name': User.full_name,
+            'email': User.email,
+            'phone_number': User.phone_number,
+            'role': User.role,
+            'created_at': User.created_at,
+        },
+        'default': ['id', 'student_number', 'full_name', 'email', 'phone_number', 'role', 'created_at'],
+        'joins': [],
+        'filters': {
+            'role': lambda v: User.role == v,
+            'since': lambda v: User.created_at >= _parse_date(v),
+            'until': lambda v: User.created_at < _parse_date(v),
+        },
+        'model': User,
+        'order_by': User.id,
+    }
+
+
+def _payments():
+    from app.models import Booking, Payment
+    return {
+        'columns': {
+            'id': Payment.id,
+            'booking_id': Payment.booking_id,
+            'accommodation_id': Booking.accommodation_id,
+            'user_id': Booking.user_id,
+            'stripe_payment_id': Payment.stripe_payment_id,
+            'amount': Payment.amount,
+            'status': Payment.status,
+            'created_at': Payment.created_at,
+        },
+        'default': ['id', 'booking_id', 'stripe_payment_id', 'amount', 'status', 'created_at'],
+        'joins': [(Booking, Booking.id == Payment.booking_id)],
+        'filters': {
+            'status': lambda v: Payment.status == v,
+            'accommodation_id': lambda v: Booking.accommodation_id == int(v),
+            'since': lambda v: Payment.created_at >= _parse_date(v),
+            'until': lambda v: Payment.created_at < _parse_date(v),
+        },
+        'model': Payment,
+        'order_by': Payment.id,
+    }
+
+
+def _accommodations():
+    from app.models import Accommodation
+    return {
+        'columns': {
+            'id': Accommodation.id,
+            'title': Accommodation.title,
+            'room_type': Accommodation.room_type,
+            'location': Accommodation.location,
+            'price_per_month': Accommodation.price_per_month,
+            'capacity': Accommodation.capacity,
+            'current_occupancy': Accommodation.current_occupancy,
+            'status': Accommodation.status,
+            'amenities': Accommodation.amenities,
+            'description': Accommodation.description,
+            'created_at': Accommodation.created_at,
+        },
+        'default': ['id', 'title', 'room_type', 'location', 'price_per_month',
+                    'capacity', 'current_occupancy', 'status'],
+        'joins': [],
+        'filters': {
+            'status': lambda v: Accommodation.status == v,
+            'room_type': lambda v: Accommodation.room_type == v,
+            'location': lambda v: Accommodation.location == v,
+        },
+        'model': Accommodation,
+        'order_by': Accommodation.id,
+    }
+
+
+DATASETS = {
+    'bookings': _bookings,
+    'users': _users,
+    'payments': _payments,
+    'accommodations': _accommodations,
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+# ------------------------------------------------------------------
+# Query
+# ------------------------------------------------------------------
+def build_export(dataset, columns=None, filters=None):
+    """
+    Validate the request and return (column names, statement). Raises
+    ExportError for unknown datasets, columns or bad filter values.
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f'Unknown export: {dataset}')
+    spec = DATASETS[dataset]()
+
+    names = columns or spec['default']
+    unknown = [name for name in names if name not in spec['columns']]
+    if unknown:
+        raise ExportError(f"Unknown column(s): {', '.join(unknown)}")
+
+    stmt = select(*(spec['columns'][name].label(name) for name in names))
+    stmt = stmt.select_from(spec['model'])
+    for target, onclause in spec['joins']:
+        stmt = stmt.join(target, onclause)
+    for key, value in (filters or {}).items():
+        if key not in spec['filters'] or value in (None, ''):
+            continue
+        try:
+            stmt = stmt.where(spec['filters'][key](value))
+        except ValueError:
+            raise ExportError(f'Invalid value for {key}: {value}')
+    return names, stmt.order_by(spec['order_by'])
+
+
+def iter_rows(stmt):
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+
+# ------------------------------------------------------------------
+# Encoders
+# ------------------------------------------------------------------
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = ';'.join(str(item) for item in value)
+    value = _plain(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(names, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    # Sent before the query runs, so the client and any proxy see bytes at once
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_cell(value) for value in row])
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def stream_ndjson(names, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps({name: _plain(value) for name, value in zip(names, row)}))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def stream_export(names, stmt, fmt='csv'):
+    encode = stream_ndjson if fmt == 'ndjson' else stream_csv
+    return encode(names, iter_rows(stmt))
@@ -1,6 +1,5 @@
 import os
 from werkzeug.utils import secure_filename
-from PIL import Image
 from flask import current_app
 from datetime import datetime
 import base64
@@ -31,6 +30,9 @@ def process_image_to_base64(file, max_size=(800, 600), quality=85):
     Convert uploaded file to Base64 string
     Resizes image to reduce database size
     """
+    # Pillow is only needed when an upload arrives
+    from PIL import Image
+
     try:
         img = Image.open(file)
         
@@ -154,16 +156,9 @@ def format_amenities_list(amenities_string):
 # Dashboard stats
 # ------------------------------------------------------------------
 def get_dashboard_stats():
-    from app.models import db, User, Accommodation, Booking, Payment
-    return {
-        'total_users': User.query.count(),
-        'total_accommodations': Accommodation.query.count(),
-        'total_bookings': Booking.query.count(),
-        'pending_bookings': Booking.query.filter_by(status='pending').count(),
-        'approved_bookings': Booking.query.filter_by(status='approved').count(),
-        'paid_bookings': Booking.query.filter_by(status='paid').count(),
-        'total_revenue': db.session.query(db.func.sum(Payment.amount)).filter_by(status='succeeded').scalar() or 0
-    }
+    """Cached snapshot backed by a single aggregate query, see app/stats.py"""
+    from app.stats import get_dashboard_stats as snapshot_stats
+    return snapshot_stats()
 
 # ------------------------------------------------------------------
 # Fake email logger
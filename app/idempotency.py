@@ -0,0 +1,239 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, flash, g, request, make_response, session
+from flask_login import current_user
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+# Form fields that change between renders of the same page and must not
+# affect the fingerprint of a submission
+IGNORED_FIELDS = {'csrf_token', 'idempotency_key', 'submit'}
+
+# Headers worth keeping when a response is stored for replay. Set-Cookie is
+# not one of them: the session of the retrying client is saved as usual and
+# the messages the first response flashed are flashed into it again
+STORED_HEADERS = ('Location', 'Content-Type')
+
+_stats_lock = threading.Lock()
+_stats = {'claimed': 0, 'replayed': 0, 'conflicts': 0}
+_purge_counter = 0
+
+
+def _keys_table():
+    from app.models import IdempotencyKey
+    return IdempotencyKey.__table__
+
+
+def _bump(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+# ------------------------------------------------------------------
+# Fingerprints
+# ------------------------------------------------------------------
+def request_fingerprint(include_body=True):
+    """Hash of who is calling what, with which input"""
+    user_id = current_user.get_id() if current_user.is_authenticated else 'anon'
+    parts = [request.method, request.path, str(user_id)]
+    if include_body:
+        for name in sorted(request.form.keys()):
+            if name in IGNORED_FIELDS:
+                continue
+            parts.append(f'{name}={"|".join(request.form.getlist(name))}')
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def request_key(fingerprint):
+    """Client supplied key (header or form field) scoped to the user, or the fingerprint itself"""
+    client_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    if not client_key:
+        return f'fp:{fingerprint}'
+    user_id = current_user.get_id() if current_user.is_authenticated else 'anon'
+    return f'key:{user_id}:{client_key[:80]}'
+
+
+# ------------------------------------------------------------------
+# Storage
+# ------------------------------------------------------------------
+def _claim(key, fingerprint, window):
+    """
+    Try to insert the key. Returns None when this request owns it,
+    otherwise the existing row.
+    """
+    global _purge_counter
+    table = _keys_table()
+    now = datetime.utcnow()
+    values = {
+        'key': key,
+        'fingerprint': fingerprint,
+        'user_id': int(current_user.get_id()) if current_user.is_authenticated else None,
+        'endpoint': request.endpoint,
+        'state': 'in_progress',
+        'replay_count': 0,
+        'created_at': now,
+        'expires_at': now + timedelta(seconds=window),
+    }
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(table).values(**values))
+    except IntegrityError:
+        with db.engine.begin() as conn:
+            row = conn.execute(select(table).where(table.c.key == key)).mappings().first()
+            if row is not None and row['expires_at'] <= now:
+                # Stale entry from an earlier window, take it over
+                result = conn.execute(
+                    update(table)
+                    .where(table.c.key == key, table.c.expires_at <= now)
+                    .values(**values, response_status=None, response_headers=None, response_body=None,
+                            response_flashes=None)
+                )
+                if result.rowcount == 1:
+                    row = None
+            if row is not None:
+                return row
+
+    _bump('claimed')
+    _purge_counter += 1
+    if _purge_counter % 100 == 0:
+        purge_expired_keys()
+    return None
+
+
+def _store(key, response, flashes):
+    table = _keys_table()
+    headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(table).where(table.c.key == key).values(
+                state='completed',
+                response_status=response.status_code,
+                response_headers=headers,
+                response_body=response.get_data(),
+                response_flashes=[list(message) for message in flashes],
+            )
+        )
+
+
+def _release(key):
+    table = _keys_table()
+    with db.engine.begin() as conn:
+        conn.execute(delete(table).where(table.c.key == key))
+
+
+def _wait_for_completion(key, timeout):
+    table = _keys_table()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        with db.engine.connect() as conn:
+            row = conn.execute(select(table).where(table.c.key == key)).mappings().first()
+        if row is None or row['state'] == 'completed':
+            return row
+    return None
+
+
+def _replay(key, row, on_replay):
+    table = _keys_table()
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(table).where(table.c.key == key).values(replay_count=table.c.replay_count + 1)
+        )
+    _bump('replayed')
+    current_app.logger.info(f'Idempotent replay of {row["endpoint"]} for key {key[:24]}',
+                            extra={'sample': 'idempotency'})
+
+    for category, message in row['response_flashes'] or []:
+        flash(message, category)
+    if on_replay:
+        on_replay()
+
+    response = make_response(row['response_body'] or b'', row['response_status'])
+    for name, value in (row['response_headers'] or {}).items():
+        response.headers[name] = value
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired_keys():
+    """Delete stored responses whose window has passed"""
+    table = _keys_table()
+    with db.engine.begin() as conn:
+        result = conn.execute(delete(table).where(table.c.expires_at <= datetime.utcnow()))
+    return result.rowcount
+
+
+def skip_idempotency():
+    """Called by a view whose outcome should not be replayed (e.g. a transient Stripe error)"""
+    g.idempotency_skip = True
+
+
+def get_idempotency_stats():
+    """Duplicates suppressed by this worker and across all workers for the live window"""
+    table = _keys_table()
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            select(func.count(), func.coalesce(func.sum(table.c.replay_count), 0))
+        ).first()
+    with _stats_lock:
+        worker = dict(_stats)
+    return {
+        'worker': worker,
+        'stored_keys': row[0],
+        'duplicates_suppressed': int(row[1]),
+    }
+
+
+# ------------------------------------------------------------------
+# Decorator
+# ------------------------------------------------------------------
+def idempotent(methods=('POST',), include_body=True, on_replay=None):
+    """
+    Answer repeated submissions of the same request with the stored response
+    of the first one, without running the view again. Messages the first
+    response flashed are flashed again; on_replay() stands in for any other
+    side effect on the caller's session (e.g. giving back an admission slot).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in methods or not current_app.config.get('IDEMPOTENCY_ENABLED', True):
+                return f(*args, **kwargs)
+
+            window = current_app.config.get('IDEMPOTENCY_WINDOW_SECONDS', 600)
+            fingerprint = request_fingerprint(include_body)
+            key = request_key(fingerprint)
+
+            row = _claim(key, fingerprint, window)
+            if row is not None:
+                if row['fingerprint'] != fingerprint:
+                    _bump('conflicts')
+                    return make_response('Idempotency key reused with a different request', 422)
+                if row['state'] != 'completed':
+                    row = _wait_for_completion(key, current_app.config.get('IDEMPOTENCY_WAIT_SECONDS', 5))
+                    if row is None:
+                        response = make_response('Request is already being processed', 409)
+                        response.headers['Retry-After'] = '1'
+                        return response
+                return _replay(key, row, on_replay)
+
+            flashed = len(session.get('_flashes', []))
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                _release(key)
+                raise
+
+            if g.pop('idempotency_skip', False) or response.status_code >= 400 or response.is_streamed:
+                _release(key)
+            else:
+                _store(key, response, session.get('_flashes', [])[flashed:])
+            return response
+        return decorated_function
+    return decorator
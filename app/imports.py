@@ -0,0 +1,314 @@
+"""
+Bulk CSV import of users and accommodations.
+
+Rows are validated with the same WTForms classes the registration and
+add-accommodation pages use, then written in batches: COPY on PostgreSQL,
+a single executemany INSERT elsewhere. Password hashes for a batch are
+computed in a process pool. Invalid rows are skipped and reported by line
+number; valid rows are imported.
+"""
+import csv
+import io
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.passwords import hash_params
+
+LOOKUP_CHUNK = 500
+# Below this many passwords the pool start-up costs more than it saves
+POOL_THRESHOLD = 200
+ACCOMMODATION_STATUSES = ('available', 'fully_occupied')
+
+
+class ImportResult:
+    def __init__(self, kind, dry_run=False):
+        self.kind = kind
+        self.dry_run = dry_run
+        self.total = 0
+        self.imported = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def error(self, line, field, message):
+        self.errors.append({'line': line, 'field': field, 'message': message})
+
+    @property
+    def failed_lines(self):
+        return len({e['line'] for e in self.errors})
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'dry_run': self.dry_run,
+            'total': self.total,
+            'imported': self.imported,
+            'failed': self.failed_lines,
+            'elapsed': round(self.elapsed, 2),
+            'errors': self.errors,
+        }
+
+    def write_errors(self, fh):
+        writer = csv.writer(fh)
+        writer.writerow(['line', 'field', 'message'])
+        for e in self.errors:
+            writer.writerow([e['line'], e['field'], e['message']])
+
+
+# ------------------------------------------------------------------
+# Reading and validation
+# ------------------------------------------------------------------
+def _read_batches(fileobj, batch_size):
+    """Yield lists of (line number, row dict); accepts text or binary files"""
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(fileobj)
+    batch = []
+    for row in reader:
+        # Header is line 1
+        line = reader.line_num
+        cleaned = {
+            (key or '').strip(): value.strip()
+            for key, value in row.items()
+            if key and isinstance(value, str) and value.strip()
+        }
+        batch.append((line, cleaned))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _validate(form_class, data, line, result):
+    form = form_class(formdata=MultiDict(data), meta={'csrf': False})
+    if form.validate():
+        return form
+    for field, messages in form.errors.items():
+        for message in messages:
+            result.error(line, field, message)
+    return None
+
+
+def _existing(column, values):
+    found = set()
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_CHUNK):
+        chunk = values[start:start + LOOKUP_CHUNK]
+        found.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+# ------------------------------------------------------------------
+# Writing
+# ------------------------------------------------------------------
+def _copy_rows(conn, table, columns, rows):
+    buffer = io.StringIO()
+    # Strings are quoted so that only None ends up as an unquoted empty field (NULL)
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([
+            json.dumps(row[c]) if isinstance(row[c], (list, dict)) else row[c]
+            for c in columns
+        ])
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _write_batch(table, rows, lines, result):
+    """Write one batch; on a constraint error fall back to row-by-row inserts"""
+    if not rows:
+        return
+    columns = list(rows[0])
+    conn = db.session.connection()
+    # COPY runs on the raw DBAPI cursor, so its errors are not wrapped by SQLAlchemy
+    dbapi_integrity_error = getattr(conn.dialect.dbapi, 'IntegrityError', IntegrityError)
+    try:
+        if conn.dialect.name == 'postgresql':
+            _copy_rows(conn, table, columns, rows)
+        else:
+            conn.execute(insert(table), rows)
+        db.session.commit()
+        result.imported += len(rows)
+        return
+    except (IntegrityError, dbapi_integrity_error):
+        db.session.rollback()
+
+    for line, row in zip(lines, rows):
+        try:
+            with db.session.begin_nested():
+                db.session.connection().execute(insert(table), [row])
+            result.imported += 1
+        except IntegrityError as e:
+            result.error(line, '', f'Rejected by database: {e.orig}')
+    db.session.commit()
+
+
+class _Hasher:
+    """Hashes passwords inline for small batches and in a process pool otherwise"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+        method, salt_length = hash_params()
+        self.hash = partial(generate_password_hash, method=method, salt_length=salt_length)
+
+    def __call__(self, passwords):
+        if self.workers <= 1 or len(passwords) < POOL_THRESHOLD:
+            return [self.hash(p) for p in passwords]
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self.pool.map(self.hash, passwords, chunksize=chunksize))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def _finish(result):
+    result.elapsed = time.monotonic() - result.started
+    result.errors.sort(key=lambda e: e['line'])
+    if result.imported:
+        # Bulk inserts bypass the ORM events that keep the stats snapshot current
+        from app.stats import snapshot
+        snapshot.invalidate()
+    current_app.logger.info(
+        f'Imported {result.imported}/{result.total} {result.kind} '
+        f'({result.failed_lines} failed) in {result.elapsed:.1f}s'
+    )
+    return result
+
+
+# ------------------------------------------------------------------
+# Importers
+# ------------------------------------------------------------------
+def import_users(fileobj, dry_run=False, batch_size=None, workers=None):
+    """
+    Columns: student_number, full_name, email, id_number, phone_number,
+    password (confirm_password optional), role (optional, default user).
+    """
+    from app.forms import RegistrationForm
+    from app.models import User
+
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 5000)
+    hasher = _Hasher(workers or current_app.config.get('IMPORT_HASH_WORKERS', 1))
+    result = ImportResult('users', dry_run)
+    seen = {'email': set(), 'student_number': set(), 'id_number': set()}
+    try:
+        for batch in _read_batches(fileobj, batch_size):
+            result.total += len(batch)
+            valid = []
+            for line, data in batch:
+                data.setdefault('confirm_password', data.get('password', ''))
+                role = data.pop('role', 'user')
+                if role not in ('user', 'admin'):
+                    result.error(line, 'role', 'Role must be user or admin')
+                    continue
+                form = _validate(RegistrationForm, data, line, result)
+                if form is None:
+                    continue
+                duplicate = next((key for key in seen if getattr(form, key).data in seen[key]), None)
+                if duplicate:
+                    result.error(line, duplicate, f'Duplicate {duplicate} in file')
+                    continue
+                for key in seen:
+                    seen[key].add(getattr(form, key).data)
+                valid.append((line, form, role))
+
+            taken = {
+                key: _existing(getattr(User, key), [getattr(form, key).data for _, form, _ in valid])
+                for key in seen
+            }
+            rows, lines, passwords = [], [], []
+            for line, form, role in valid:
+                clash = next((key for key in taken if getattr(form, key).data in taken[key]), None)
+                if clash:
+                    result.error(line, clash, f"{clash.replace('_', ' ').capitalize()} already registered")
+                    continue
+                now = datetime.utcnow()
+                rows.append({
+                    'student_number': form.student_number.data,
+                    'full_name': form.full_name.data,
+                    'email': form.email.data,
+                    'id_number': form.id_number.data,
+                    'phone_number': form.phone_number.data,
+                    'password_hash': None,
+                    'role': role,
+                    'created_at': now,
+                })
+                lines.append(line)
+                passwords.append(form.password.data)
+
+            if dry_run:
+                result.imported += len(rows)
+                continue
+            for row, password_hash in zip(rows, hasher(passwords)):
+                row['password_hash'] = password_hash
+            _write_batch(User.__table__, rows, lines, result)
+    finally:
+        hasher.close()
+    return _finish(result)
+
+
+def import_accommodations(fileobj, admin_id=None, dry_run=False, batch_size=None):
+    """
+    Columns: title, description, room_type, price_per_month, location,
+    capacity, current_occupancy, amenities (comma-separated), status (optional,
+    available or fully_occupied).
+    """
+    from app.forms import AccommodationForm
+    from app.helpers import format_amenities_list
+    from app.models import Accommodation
+
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 5000)
+    result = ImportResult('accommodations', dry_run)
+    for batch in _read_batches(fileobj, batch_size):
+        result.total += len(batch)
+        rows, lines = [], []
+        for line, data in batch:
+            status = data.pop('status', 'available')
+            form = _validate(AccommodationForm, data, line, result)
+            if status not in ACCOMMODATION_STATUSES:
+                result.error(line, 'status', 'Not a valid choice.')
+                continue
+            if form is None:
+                continue
+            now = datetime.utcnow()
+            rows.append({
+                'title': form.title.data,
+                'description': form.description.data,
+                'room_type': form.room_type.data,
+                'price_per_month': form.price_per_month.data,
+                'location': form.location.data,
+                'capacity': form.capacity.data,
+                'current_occupancy': form.current_occupancy.data or 0,
+                'amenities': format_amenities_list(form.amenities.data),
+                'status': status,
+                'admin_id': admin_id,
+                'created_at': now,
+                'updated_at': now,
+            })
+            lines.append(line)
+
+        if dry_run:
+            result.imported += len(rows)
+            continue
+        _write_batch(Accommodation.__table__, rows, lines, result)
+    return _finish(result)
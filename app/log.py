@@ -0,0 +1,190 @@
+"""
+Application logging.
+
+app.logger only has a QueueHandler, so a log call on the request thread
+formats the record and puts it on a bounded in-memory queue. A
+QueueListener thread per worker process writes the records as JSON lines to
+stderr and, when LOG_FILE is set, to a RotatingFileHandler sized by
+LOG_MAX_BYTES / LOG_BACKUP_COUNT. Records are dropped (and counted) rather
+than blocking a request when the queue is full.
+
+Every record carries the request id (the X-Request-ID header, or a new one)
+which is also returned on the response. Chatty info messages can be sampled:
+
+    app.logger.info('...', extra={'sample': 'favorites'})
+
+keeps a LOG_SAMPLE_RATES['favorites'] fraction of them. Warnings and errors
+are never sampled.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# LogRecord attributes that are not extra fields
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id', 'sample'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Runs on the calling thread: attach the request id and apply sampling"""
+
+    def __init__(self, sample_rates=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+
+    def filter(self, record):
+        sample = getattr(record, 'sample', None)
+        if sample is not None and record.levelno < logging.WARNING:
+            if random.random() >= self.sample_rates.get(sample, 1.0):
+                return False
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.path = request.path
+        return True
+
+
+class AsyncHandler(QueueHandler):
+    """QueueHandler whose listener thread is started lazily in every process"""
+
+    def __init__(self, queue_size, build_handlers):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self._build_handlers = build_handlers
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+        self._exc_formatter = logging.Formatter()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked worker: the master's listener thread did not survive
+                # the fork, and records queued there are the master's to write
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = QueueListener(self.queue, *self._build_handlers(), respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+        atexit.register(self.stop)
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Render the message and traceback on the calling thread; the
+        # listener must not touch args or exc_info that may change later
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+
+def _parse_rates(value):
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, rate = item.split('=', 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def build_handlers(config):
+    formatter = JsonFormatter()
+    stream = logging.StreamHandler()
+    stream.setFormatter(formatter)
+    handlers = [stream]
+    path = config.get('LOG_FILE')
+    if path:
+        # One file per worker: RotatingFileHandler cannot rotate a file
+        # shared between processes safely
+        path = path.format(pid=os.getpid())
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        rotating = RotatingFileHandler(
+            path,
+            maxBytes=config.get('LOG_MAX_BYTES', 50 * 1024 * 1024),
+            backupCount=config.get('LOG_BACKUP_COUNT', 5),
+            delay=True,
+        )
+        rotating.setFormatter(formatter)
+        handlers.append(rotating)
+    return handlers
+
+
+def _assign_request_id():
+    g.request_id = request.headers.get(REQUEST_ID_HEADER, '')[:64] or uuid.uuid4().hex
+
+
+def _return_request_id(response):
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers.setdefault(REQUEST_ID_HEADER, request_id)
+    return response
+
+
+def init_logging(app):
+    from flask.logging import default_handler
+
+    config = app.config
+    handler = AsyncHandler(config.get('LOG_QUEUE_SIZE', 10000), lambda: build_handlers(config))
+    handler.addFilter(ContextFilter(_parse_rates(config.get('LOG_SAMPLE_RATES'))))
+
+    logger = app.logger
+    logger.removeHandler(default_handler)
+    for existing in [h for h in logger.handlers if isinstance(h, AsyncHandler)]:
+        logger.removeHandler(existing)
+        existing.stop()
+    logger.addHandler(handler)
+    logger.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    logger.propagate = False
+
+    app.before_request(_assign_request_id)
+    app.after_request(_return_request_id)
+    app.extensions['log_handler'] = handler
+    return handler
@@ -0,0 +1,330 @@
+"""
+Prometheus metrics.
+
+Each worker process keeps its counters, histograms and gauges in memory;
+recording one is a dict update under a lock. A daemon thread per worker
+writes a snapshot to METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS, and
+GET /metrics merges the snapshots of every worker into the text exposition
+format. Counters and histograms of workers that have exited are kept so the
+totals never go backwards; gauges only count live workers. /metrics requires
+Bearer METRICS_TOKEN, and is not registered at all without a token unless
+METRICS_PUBLIC is on (the non-production default).
+
+Recorded per request: count and latency per endpoint, in-flight requests,
+template render time. Recorded at collection: SQLAlchemy pool checked-out,
+overflow and size per bind. Stripe calls are timed with stripe_timer();
+password hashing records its own queue and run times (app/passwords.py).
+"""
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, current_app, g, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Time to build the response, by endpoint.'),
+    'http_requests_in_flight': ('gauge', 'Requests being handled right now.'),
+    'template_render_seconds': ('histogram', 'Jinja render time, by template.'),
+    'stripe_request_seconds': ('histogram', 'Stripe API call latency, by operation and outcome.'),
+    'password_hash_queue_seconds': ('histogram', 'Wait for a password hashing slot, by operation.'),
+    'password_hash_seconds': ('histogram', 'Password hash/verify time in the pool, by operation.'),
+    'password_hash_waiting': ('gauge', 'Requests waiting for a password hashing slot.'),
+    'password_hash_rejected_total': ('counter', 'Password operations refused because the pool was busy.'),
+    'db_pool_checked_out': ('gauge', 'Connections checked out of the SQLAlchemy pool.'),
+    'db_pool_overflow': ('gauge', 'Connections open beyond pool_size.'),
+    'db_pool_size': ('gauge', 'Configured pool_size.'),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._app = None
+        self._pid = None
+        self.directory = None
+        self.interval = 5
+        self.enabled = True
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.interval = app.config.get('METRICS_FLUSH_SECONDS', 5)
+        self.directory = app.config.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'campusstay-metrics')
+        os.makedirs(self.directory, exist_ok=True)
+
+    # -- recording --------------------------------------------------
+    def inc(self, name, value=1, **labels):
+        self._ensure_started()
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, buckets=LATENCY_BUCKETS, **labels):
+        self._ensure_started()
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [list(buckets), [0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(histogram[0], seconds)
+            if index < len(histogram[1]):
+                histogram[1][index] += 1
+            histogram[2] += seconds
+            histogram[3] += 1
+
+    def set(self, name, value, **labels):
+        self._ensure_started()
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def add(self, name, value, **labels):
+        self._ensure_started()
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    # -- per-process snapshot -----------------------------------------
+    def _ensure_started(self):
+        if self._pid == os.getpid() or self.directory is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked worker: what the master recorded is the master's
+                self._counters, self._histograms, self._gauges = {}, {}, {}
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[n, l, v] for (n, l), v in self._counters.items()],
+                'histograms': [[n, l, h[0], list(h[1]), h[2], h[3]] for (n, l), h in self._histograms.items()],
+                'gauges': [[n, l, v] for (n, l), v in self._gauges.items()],
+            }
+
+    def flush(self):
+        """Write this process's snapshot; safe to call from any thread"""
+        if self.directory is None or self._pid != os.getpid():
+            return
+        self._sample_pools()
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        tmp = f'{path}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            if self._app is not None:
+                self._app.logger.warning(f'Metrics flush failed: {e}')
+
+    def _sample_pools(self):
+        if self._app is None:
+            return
+        from app import db
+        try:
+            with self._app.app_context():
+                engines = dict(db.engines)
+        except Exception:
+            return
+        for bind, engine in engines.items():
+            pool = engine.pool
+            if not hasattr(pool, 'checkedout'):
+                continue
+            bind = bind or 'default'
+            self.set('db_pool_checked_out', pool.checkedout(), bind=bind)
+            self.set('db_pool_overflow', max(0, pool.overflow()), bind=bind)
+            self.set('db_pool_size', pool.size(), bind=bind)
+
+
+registry = Registry()
+
+
+# ------------------------------------------------------------------
+# Collection
+# ------------------------------------------------------------------
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect(directory):
+    """Merge every worker's snapshot into (counters, histograms, gauges)"""
+    counters, histograms, gauges = {}, {}, {}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data['counters']:
+            key = _key(name, dict(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total, count in data['histograms']:
+            key = _key(name, dict(labels))
+            merged = histograms.setdefault(key, [buckets, [0] * len(buckets), 0.0, 0])
+            merged[1] = [a + b for a, b in zip(merged[1], counts)]
+            merged[2] += total
+            merged[3] += count
+        if not _alive(data['pid']):
+            continue
+        for name, labels, value in data['gauges']:
+            key = _key(name, dict(labels))
+            gauges[key] = gauges.get(key, 0) + value
+    return counters, histograms, gauges
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def render(counters, histograms, gauges):
+    series = {}
+    for (name, labels), value in sorted(counters.items()):
+        series.setdefault(name, []).append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), value in sorted(gauges.items()):
+        series.setdefault(name, []).append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_labels(labels, le=repr(float(bound)))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {count}')
+        lines.append(f'{name}_sum{_labels(labels)} {total}')
+        lines.append(f'{name}_count{_labels(labels)} {count}')
+    out = []
+    for name in sorted(series):
+        kind, text = HELP.get(name, ('untyped', name))
+        out += [f'# HELP {name} {text}', f'# TYPE {name} {kind}'] + series[name]
+    return '\n'.join(out) + '\n'
+
+
+def clear_metrics_dir(directory=None):
+    """Remove snapshots left by a previous server run (gunicorn on_starting)"""
+    directory = directory or os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'campusstay-metrics')
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.endswith(('.json', '.tmp')):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+
+# ------------------------------------------------------------------
+# Instrumentation
+# ------------------------------------------------------------------
+@contextmanager
+def stripe_timer(operation):
+    """Time a Stripe API call: `with stripe_timer('checkout.session.create'):`"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        if registry.enabled:
+            registry.observe('stripe_request_seconds', time.perf_counter() - started,
+                             operation=operation, outcome=outcome)
+
+
+def _endpoint():
+    # Unmatched URLs share one label so scanners cannot blow up the series count
+    return request.endpoint or 'unmatched'
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_templates = []
+    registry.add('http_requests_in_flight', 1)
+
+
+def _after_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        endpoint = _endpoint()
+        registry.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        registry.observe('http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+    return response
+
+
+def _teardown_request(exc):
+    if g.pop('metrics_started', None) is not None:
+        registry.add('http_requests_in_flight', -1)
+
+
+def _before_render(sender, template, context, **extra):
+    stack = g.get('metrics_templates')
+    if stack is not None:
+        stack.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stack = g.get('metrics_templates')
+    if stack:
+        registry.observe('template_render_seconds', time.perf_counter() - stack.pop(),
+                         template=template.name or 'string')
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    registry.flush()
+    body = render(*collect(registry.directory))
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    registry.init_app(app)
+    if not registry.enabled:
+        return
+    from flask import before_render_template, template_rendered
+
+    # Registered before the other request hooks so the timing covers them
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    # Metrics are still recorded; without a token they are only served where allowed
+    if app.config.get('METRICS_TOKEN') or app.config.get('METRICS_PUBLIC'):
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
+    else:
+        app.logger.warning('METRICS_TOKEN is not set; /metrics is not served')
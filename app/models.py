@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from app.passwords import HashingBusy, hash_password, needs_rehash, verify_password
 import base64
 
 class User(UserMixin, db.Model):
@@ -20,16 +20,33 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), default='user')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Admin user search, see app/search.py
+    __table_args__ = (
+        db.Index('ix_users_full_name_lower', db.func.lower(full_name)),
+        db.Index('ix_users_email_lower', db.func.lower(email)),
+        db.Index('ix_users_role_created', 'role', 'created_at'),
+        db.Index('ix_users_created_at', 'created_at'),
+    )
+    
     # Relationships
     favorites = db.relationship('Favorite', backref='user', lazy=True, cascade='all, delete-orphan')
     bookings = db.relationship('Booking', backref='user', lazy=True)
     reviews = db.relationship('Review', backref='user', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify, and re-hash with the current parameters if they changed; the caller commits"""
+        if not verify_password(self.password_hash, password):
+            return False
+        if needs_rehash(self.password_hash):
+            try:
+                # Only with a free slot, so an upgrade never queues or fails a login
+                self.password_hash = hash_password(password, wait=False)
+            except HashingBusy:
+                pass
+        return True
     
     def is_admin(self):
         return self.role == 'admin'
@@ -52,6 +69,11 @@ class AccommodationImage(db.Model):
     filename = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Conditional GET validators, see app/routes/main.py
+    __table_args__ = (
+        db.Index('ix_accommodation_images_accommodation_created', 'accommodation_id', 'created_at'),
+    )
+    
     def to_data_uri(self):
         """Convert to data URI for HTML img src"""
         return f"data:{self.image_type};base64,{self.image_data}"
@@ -74,6 +96,11 @@ class Accommodation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Conditional GET validators, see app/routes/main.py
+    __table_args__ = (
+        db.Index('ix_accommodations_status_updated', 'status', 'updated_at'),
+    )
+    
     # Relationships
     admin = db.relationship('User', backref='accommodations_added')
     favorites = db.relationship('Favorite', backref='accommodation', lazy=True, cascade='all, delete-orphan')
@@ -119,8 +146,8 @@ class Booking(db.Model):
     payment_responsible = db.Column(db.String(50), nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')
-    stripe_session_id = db.Column(db.String(100))
-    stripe_payment_intent_id = db.Column(db.String(100))
+    stripe_session_id = db.Column(db.String(100), index=True)
+    stripe_payment_intent_id = db.Column(db.String(100), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -137,14 +164,147 @@ class Review(db.Model):
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'accommodation_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'accommodation_id'),
+        db.Index('ix_reviews_accommodation_created', 'accommodation_id', 'created_at'),
+    )
 
 class Payment(db.Model):
     __tablename__ = 'payments'
     
     id = db.Column(db.Integer, primary_key=True)
-    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False, index=True)
     stripe_payment_id = db.Column(db.String(100), unique=True)
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_payments_status_created', 'status', 'created_at'),
+    )
+
+class RevenueDaily(db.Model):
+    """Payment totals per day, accommodation and payment status"""
+    __tablename__ = 'revenue_daily'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    accommodation_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.Float, default=0, nullable=False)
+    payment_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'accommodation_id', 'status', name='uq_revenue_daily_bucket'),
+        db.Index('ix_revenue_daily_status_day', 'status', 'day'),
+    )
+
+class RevenueMonthly(db.Model):
+    """Payment totals per month (first day of the month), accommodation and payment status"""
+    __tablename__ = 'revenue_monthly'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False)
+    accommodation_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.Float, default=0, nullable=False)
+    payment_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('month', 'accommodation_id', 'status', name='uq_revenue_monthly_bucket'),
+        db.Index('ix_revenue_monthly_status_month', 'status', 'month'),
+    )
+
+class AccommodationStat(db.Model):
+    """Views, search impressions and favorite clicks per accommodation per day"""
+    __tablename__ = 'accommodation_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    accommodation_id = db.Column(db.Integer, nullable=False)
+    views = db.Column(db.Integer, default=0, nullable=False)
+    impressions = db.Column(db.Integer, default=0, nullable=False)
+    favorites = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'accommodation_id', name='uq_accommodation_stats_bucket'),
+    )
+
+class AuditLog(db.Model):
+    """Append-only record of admin actions, written in batches by app/audit.py"""
+    __tablename__ = 'audit_log'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    actor_id = db.Column(db.Integer)
+    actor_email = db.Column(db.String(120))
+    action = db.Column(db.String(50), nullable=False)
+    target_type = db.Column(db.String(50))
+    target_id = db.Column(db.Integer)
+    changes = db.Column(db.JSON)
+    ip_address = db.Column(db.String(45))
+    
+    __table_args__ = (
+        db.Index('ix_audit_actor_created', 'actor_id', 'created_at'),
+        db.Index('ix_audit_action_created', 'action', 'created_at'),
+        db.Index('ix_audit_target', 'target_type', 'target_id', 'created_at'),
+    )
+
+class IdempotencyKey(db.Model):
+    """Stored outcome of a mutating request so that replays can be answered without redoing the work"""
+    __tablename__ = 'idempotency_keys'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(128), unique=True, nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    user_id = db.Column(db.Integer)
+    endpoint = db.Column(db.String(100))
+    state = db.Column(db.String(20), default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer)
+    response_headers = db.Column(db.JSON)
+    response_body = db.Column(db.LargeBinary)
+    response_flashes = db.Column(db.JSON)  # [category, message] pairs flashed by the first response
+    replay_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class WaitlistEntry(db.Model):
+    """A student queued for a bed in a fully occupied accommodation"""
+    __tablename__ = 'waitlist_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    accommodation_id = db.Column(db.Integer, db.ForeignKey('accommodations.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    priority = db.Column(db.Integer, default=0, nullable=False)  # lower is served first
+    status = db.Column(db.String(20), default='waiting', nullable=False)  # waiting, offered, claimed, expired, left
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    offered_at = db.Column(db.DateTime)
+    offer_expires_at = db.Column(db.DateTime)
+    
+    # Relationships
+    accommodation = db.relationship('Accommodation', backref=db.backref('waitlist_entries', lazy='dynamic'))
+    user = db.relationship('User', backref=db.backref('waitlist_entries', lazy='dynamic'))
+    
+    __table_args__ = (
+        # Queue order within an accommodation; serves next-in-line and position lookups
+        db.Index('ix_waitlist_queue', 'accommodation_id', 'status', 'priority', 'created_at', 'id'),
+        db.Index('ix_waitlist_user', 'user_id', 'accommodation_id', 'status'),
+    )
+
+class AdmissionTicket(db.Model):
+    """Place in the virtual waiting room in front of the booking and payment routes"""
+    __tablename__ = 'admission_tickets'
+    
+    id = db.Column(db.Integer, primary_key=True)  # issue order is queue order
+    token = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer)
+    status = db.Column(db.String(20), default='waiting', nullable=False)  # waiting, admitted, released, expired
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    admitted_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_admission_status_id', 'status', 'id'),
+        db.Index('ix_admission_status_seen', 'status', 'last_seen_at'),
+    )
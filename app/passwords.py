@@ -0,0 +1,142 @@
+"""
+Password hashing off the request thread.
+
+Hashing and verifying run in a small per-worker pool (threads by default;
+hashlib releases the GIL while it works, or processes with
+PASSWORD_HASH_POOL=process), at most PASSWORD_HASH_CONCURRENCY at a time.
+At most PASSWORD_HASH_MAX_WAITING further requests wait for a slot, for up
+to PASSWORD_HASH_QUEUE_SECONDS; beyond that HashingBusy is raised and the
+auth views answer 503. A burst of logins at the start of term therefore
+holds a bounded number of request threads, and listing pages keep being
+served by the rest.
+
+New hashes use PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH. A stored hash
+made with other parameters is replaced on a successful login when a slot is
+free right away; during a burst the upgrade waits for a later login.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from app.metrics import registry
+
+SCRYPT_DEFAULTS = '32768:8:1'
+
+
+class HashingBusy(Exception):
+    """No hashing slot came free in time; the caller should ask the user to retry"""
+
+
+def normalise_method(method):
+    """The method string werkzeug stores for `method`, defaults filled in"""
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return f'scrypt:{SCRYPT_DEFAULTS}'
+    if name == 'pbkdf2' and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def hash_params(config=None):
+    """(method, salt_length) for new hashes"""
+    if config is None:
+        config = current_app.config if has_app_context() else {}
+    return (normalise_method(config.get('PASSWORD_HASH_METHOD', 'scrypt')),
+            config.get('PASSWORD_SALT_LENGTH', 16))
+
+
+def _record(name, seconds, operation):
+    if registry.enabled:
+        registry.observe(name, seconds, operation=operation)
+
+
+class _Pool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+        self._waiting = 0
+
+    def _ensure_started(self, config):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A pool inherited through fork has no threads/processes behind it
+            size = max(1, config.get('PASSWORD_HASH_CONCURRENCY', 1))
+            if config.get('PASSWORD_HASH_POOL', 'thread') == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=size)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='password-hash')
+            self._slots = threading.BoundedSemaphore(size)
+            self._waiting = 0
+            self._pid = os.getpid()
+
+    def run(self, operation, fn, *args, wait=True):
+        if not has_app_context():
+            return fn(*args)
+        config = current_app.config
+        self._ensure_started(config)
+
+        queued = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            if not wait:
+                raise HashingBusy(operation)
+            with self._lock:
+                full = self._waiting >= config.get('PASSWORD_HASH_MAX_WAITING', 2)
+                if not full:
+                    self._waiting += 1
+            if full:
+                self._reject(operation)
+            if registry.enabled:
+                registry.add('password_hash_waiting', 1)
+            try:
+                acquired = self._slots.acquire(timeout=config.get('PASSWORD_HASH_QUEUE_SECONDS', 5))
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+                if registry.enabled:
+                    registry.add('password_hash_waiting', -1)
+            if not acquired:
+                self._reject(operation)
+
+        started = time.perf_counter()
+        _record('password_hash_queue_seconds', started - queued, operation)
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            _record('password_hash_seconds', time.perf_counter() - started, operation)
+
+    def _reject(self, operation):
+        if registry.enabled:
+            registry.inc('password_hash_rejected_total', operation=operation)
+        current_app.logger.warning(f'Password {operation} rejected, hashing pool is busy')
+        raise HashingBusy(operation)
+
+
+_pool = _Pool()
+
+
+def hash_password(password, wait=True):
+    """With wait=False, raise HashingBusy at once unless a slot is free"""
+    method, salt_length = hash_params()
+    return _pool.run('hash', generate_password_hash, password, method, salt_length, wait=wait)
+
+
+def verify_password(stored_hash, password):
+    return _pool.run('verify', check_password_hash, stored_hash, password)
+
+
+def needs_rehash(stored_hash):
+    """True when the hash was made with a method or salt length other than the configured one"""
+    method, salt_length = hash_params()
+    stored_method, _, rest = stored_hash.partition('$')
+    salt = rest.partition('$')[0]
+    return stored_method != method or len(salt) != salt_length
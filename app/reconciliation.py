@@ -0,0 +1,336 @@
+"""
+Reconcile local Payment/Booking rows against Stripe.
+
+Stripe is paged per day window in a bounded thread pool; matching and fixes
+run in the calling thread, one window at a time, with batched lookups and
+updates. Completed windows are recorded in a checkpoint file so an
+interrupted run can be resumed.
+"""
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select, update
+
+from app import db
+
+LOOKUP_CHUNK = 500
+
+# Stripe PaymentIntent status -> local Payment status
+PAYMENT_STATUS = {
+    'succeeded': 'succeeded',
+    'canceled': 'failed',
+    'requires_payment_method': 'failed',
+}
+
+
+def _ts(dt):
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _chunks(items, size=LOOKUP_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# ------------------------------------------------------------------
+# Stripe clients
+# ------------------------------------------------------------------
+class StripeClient:
+    """Thin pager over the Stripe API returning plain dicts"""
+
+    page_size = 100
+
+    def __init__(self, api_key, max_network_retries=3):
+        import stripe
+        self.stripe = stripe
+        self.stripe.api_key = api_key
+        self.stripe.max_network_retries = max_network_retries
+
+    def _page_all(self, resource, start, end):
+        params = {'created': {'gte': _ts(start), 'lt': _ts(end)}, 'limit': self.page_size}
+        while True:
+            page = resource.list(**params)
+            yield from page.data
+            if not page.has_more or not page.data:
+                return
+            params['starting_after'] = page.data[-1].id
+
+    def list_payment_intents(self, start, end):
+        for pi in self._page_all(self.stripe.PaymentIntent, start, end):
+            yield {
+                'id': pi.id,
+                'amount': (pi.amount_received or pi.amount or 0) / 100,
+                'status': pi.status,
+                'booking_id': (pi.metadata or {}).get('booking_id'),
+            }
+
+    def list_checkout_sessions(self, start, end):
+        for cs in self._page_all(self.stripe.checkout.Session, start, end):
+            yield {
+                'id': cs.id,
+                'payment_intent': cs.payment_intent,
+                'payment_status': cs.payment_status,
+                'amount': (cs.amount_total or 0) / 100,
+                'booking_id': (cs.metadata or {}).get('booking_id'),
+            }
+
+
+class FakeStripeClient:
+    """
+    Offline stand-in built from local bookings, for development and load
+    testing. A seeded share of objects disagrees with the database so that
+    every mismatch path gets exercised.
+    """
+
+    def __init__(self, seed=0, mismatch_rate=0.05, latency=0.0):
+        self.latency = latency
+        self._intents = []
+        self._sessions = []
+        self._rng = random.Random(seed)
+        self._mismatch_rate = mismatch_rate
+
+    def load_from_database(self, start, end):
+        """Call from the app context before the run starts"""
+        from app.models import Booking
+        rows = db.session.execute(
+            select(
+                Booking.id, Booking.status, Booking.total_price, Booking.created_at,
+                Booking.stripe_session_id, Booking.stripe_payment_intent_id,
+            ).where(
+                Booking.created_at >= start,
+                Booking.created_at < end,
+                Booking.status.in_(['approved', 'paid']),
+            )
+        ).all()
+        for row in rows:
+            pi_id = row.stripe_payment_intent_id or f'pi_fake_{row.id}'
+            status = 'succeeded' if row.status == 'paid' else 'requires_payment_method'
+            amount = row.total_price
+            roll = self._rng.random()
+            if roll < self._mismatch_rate / 2:
+                status = 'succeeded' if status != 'succeeded' else 'canceled'
+            elif roll < self._mismatch_rate:
+                amount = round(amount * 0.9, 2)
+            self._intents.append({
+                'id': pi_id, 'amount': amount, 'status': status,
+                'booking_id': str(row.id), 'created': row.created_at,
+            })
+            self._sessions.append({
+                'id': row.stripe_session_id or f'cs_fake_{row.id}',
+                'payment_intent': pi_id,
+                'payment_status': 'paid' if status == 'succeeded' else 'unpaid',
+                'amount': amount, 'booking_id': str(row.id), 'created': row.created_at,
+            })
+        return self
+
+    def _in_window(self, items, start, end):
+        if self.latency:
+            time.sleep(self.latency)
+        return [dict(item) for item in items if start <= item['created'] < end]
+
+    def list_payment_intents(self, start, end):
+        return self._in_window(self._intents, start, end)
+
+    def list_checkout_sessions(self, start, end):
+        return self._in_window(self._sessions, start, end)
+
+
+# ------------------------------------------------------------------
+# Checkpoint
+# ------------------------------------------------------------------
+class CheckpointMismatch(ValueError):
+    pass
+
+
+class Checkpoint:
+    """
+    Completed windows of one run mode. Windows are keyed by their start, so a
+    file is only resumed with the same --fix and window size it was written with.
+    """
+
+    def __init__(self, path, fix=False, window=timedelta(days=1)):
+        self.path = path
+        self.fix = fix
+        self.window_seconds = int(window.total_seconds())
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as fh:
+                data = json.load(fh)
+            saved = (data.get('fix'), data.get('window_seconds'))
+            if saved != (fix, self.window_seconds):
+                raise CheckpointMismatch(
+                    f'{path} was written with fix={saved[0]}, window={saved[1]}s; '
+                    f'this run uses fix={fix}, window={self.window_seconds}s. Use another checkpoint file.'
+                )
+            self.done = set(data.get('completed_windows', []))
+
+    def mark(self, window_start):
+        self.done.add(window_start.isoformat())
+        if not self.path:
+            return
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump({'fix': self.fix, 'window_seconds': self.window_seconds,
+                       'completed_windows': sorted(self.done)}, fh)
+        os.replace(tmp, self.path)
+
+    def __contains__(self, window_start):
+        return window_start.isoformat() in self.done
+
+
+# ------------------------------------------------------------------
+# Matching
+# ------------------------------------------------------------------
+def _fetch_window(client, start, end):
+    return start, list(client.list_payment_intents(start, end)), list(client.list_checkout_sessions(start, end))
+
+
+def _lookup(column, values, *columns):
+    """Rows whose indexed `column` is in `values`, keyed by that column"""
+    found = {}
+    for chunk in _chunks(set(v for v in values if v)):
+        for row in db.session.execute(select(column, *columns).where(column.in_(chunk))):
+            found[row[0]] = row
+    return found
+
+
+def _match_window(intents, sessions, report, fix):
+    from app.models import Booking, Payment
+
+    # Sessions tell us which PaymentIntent belongs to which booking, which is
+    # the only link for payments recorded as local_<booking id>
+    sessions_by_id = {s['id']: s for s in sessions}
+    bookings_by_session = _lookup(Booking.stripe_session_id, sessions_by_id, Booking.id)
+    intent_booking = {}
+    for s in sessions:
+        booking_row = bookings_by_session.get(s['id'])
+        booking_id = booking_row.id if booking_row else s.get('booking_id')
+        if s.get('payment_intent') and str(booking_id or '').isdigit():
+            intent_booking[s['payment_intent']] = int(booking_id)
+
+    intent_ids = [pi['id'] for pi in intents]
+    payments_by_intent = _lookup(Payment.stripe_payment_id, intent_ids, Payment.id, Payment.amount, Payment.status)
+    bookings_by_intent = _lookup(Booking.stripe_payment_intent_id, intent_ids, Booking.id)
+    for pi in intents:
+        if pi['id'] in bookings_by_intent:
+            intent_booking[pi['id']] = bookings_by_intent[pi['id']].id
+        elif pi['id'] not in intent_booking and str(pi.get('booking_id') or '').isdigit():
+            intent_booking[pi['id']] = int(pi['booking_id'])
+
+    booking_ids = set(intent_booking.values())
+    bookings = _lookup(Booking.id, booking_ids, Booking.status, Booking.total_price)
+    payments_by_booking = _lookup(Payment.booking_id, booking_ids, Payment.id, Payment.stripe_payment_id, Payment.status)
+
+    payment_updates, payment_inserts, booking_updates = [], [], []
+    for pi in intents:
+        booking_id = intent_booking.get(pi['id'])
+        payment = payments_by_intent.get(pi['id'])
+        succeeded = pi['status'] == 'succeeded'
+
+        if booking_id is None or booking_id not in bookings:
+            if succeeded:
+                report.add('unknown_intent', pi['id'], amount=pi['amount'])
+            continue
+        booking = bookings[booking_id]
+
+        if payment is None and succeeded:
+            local = payments_by_booking.get(booking_id)
+            if local is not None and (local.stripe_payment_id or '').startswith('local_'):
+                report.add('unverified_local_payment', pi['id'], booking_id=booking_id, payment_id=local.id)
+                payment_updates.append({'id': local.id, 'stripe_payment_id': pi['id'], 'status': 'succeeded'})
+            elif local is not None:
+                # Second successful charge for a booking that already has a payment
+                report.add('duplicate_charge', pi['id'], booking_id=booking_id, payment_id=local.id)
+                continue
+            else:
+                report.add('missing_payment', pi['id'], booking_id=booking_id)
+                payment_inserts.append({
+                    'booking_id': booking_id, 'stripe_payment_id': pi['id'],
+                    'amount': pi['amount'], 'status': 'succeeded', 'created_at': datetime.utcnow(),
+                })
+        elif payment is not None:
+            expected = PAYMENT_STATUS.get(pi['status'], 'pending')
+            if payment.status != expected:
+                report.add('payment_status_mismatch', pi['id'], local=payment.status, stripe=pi['status'])
+                payment_updates.append({'id': payment.id, 'status': expected})
+            if abs((payment.amount or 0) - pi['amount']) >= 0.01:
+                # Amount differences need a human, they are reported but never fixed
+                report.add('amount_mismatch', pi['id'], local=payment.amount, stripe=pi['amount'])
+
+        if succeeded and booking.status != 'paid':
+            report.add('booking_not_paid', pi['id'], booking_id=booking_id, local=booking.status)
+            booking_updates.append({'id': booking_id, 'status': 'paid'})
+
+    report.checked += len(intents)
+    if fix:
+        if payment_updates:
+            db.session.execute(update(Payment), payment_updates)
+        if payment_inserts:
+            db.session.execute(insert(Payment), payment_inserts)
+        if booking_updates:
+            db.session.execute(update(Booking), booking_updates)
+        db.session.commit()
+        # Bulk statements bypass the ORM events that keep the stats snapshot current
+        from app.stats import snapshot
+        snapshot.invalidate()
+        report.fixed += len(payment_updates) + len(payment_inserts) + len(booking_updates)
+
+
+class Report:
+    def __init__(self, sample_size=50):
+        self.counts = Counter()
+        self.samples = []
+        self.sample_size = sample_size
+        self.checked = 0
+        self.fixed = 0
+        self.windows = 0
+        self.skipped_windows = 0
+
+    def add(self, kind, stripe_id, **details):
+        self.counts[kind] += 1
+        if len(self.samples) < self.sample_size:
+            self.samples.append({'kind': kind, 'stripe_id': stripe_id, **details})
+
+    def as_dict(self):
+        return {
+            'windows': self.windows,
+            'skipped_windows': self.skipped_windows,
+            'intents_checked': self.checked,
+            'mismatches': dict(self.counts),
+            'fixed': self.fixed,
+            'samples': self.samples,
+        }
+
+
+def reconcile(client, since, until, workers=4, fix=False, checkpoint_path=None,
+              window=timedelta(days=1), progress=None):
+    """Run the reconciliation inside an app context and return a Report"""
+    report = Report()
+    checkpoint = Checkpoint(checkpoint_path, fix=fix, window=window)
+
+    windows = []
+    start = since
+    while start < until:
+        end = min(start + window, until)
+        if start in checkpoint:
+            report.skipped_windows += 1
+        else:
+            windows.append((start, end))
+        start = end
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_fetch_window, client, start, end) for start, end in windows]
+        for future in as_completed(futures):
+            window_start, intents, sessions = future.result()
+            _match_window(intents, sessions, report, fix)
+            checkpoint.mark(window_start)
+            report.windows += 1
+            if progress:
+                progress(window_start, len(intents), report)
+    return report
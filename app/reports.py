@@ -0,0 +1,78 @@
+"""
+Reporting queries for the admin area. Aggregation, ordering and limits are
+done by the database so only the rows that are displayed reach Python.
+"""
+from sqlalchemy import case, func, select
+
+from app import db
+
+
+# ------------------------------------------------------------------
+# Occupancy
+# ------------------------------------------------------------------
+def _occupancy_rate():
+    from app.models import Accommodation
+    return case(
+        (Accommodation.capacity > 0,
+         Accommodation.current_occupancy * 100.0 / Accommodation.capacity),
+        else_=0.0,
+    )
+
+
+def _occupancy_filters(location=None, room_type=None):
+    from app.models import Accommodation
+    filters = []
+    if location:
+        filters.append(Accommodation.location.ilike(f'%{location}%'))
+    if room_type:
+        filters.append(Accommodation.room_type == room_type)
+    return filters
+
+
+def occupancy_rows(limit=10, order='desc', location=None, room_type=None):
+    """Top (order='desc') or bottom (order='asc') accommodations by occupancy rate"""
+    from app.models import Accommodation
+    rate = _occupancy_rate().label('occupancy_rate')
+    stmt = (
+        select(
+            Accommodation.id,
+            Accommodation.title,
+            Accommodation.current_occupancy.label('current'),
+            Accommodation.capacity,
+            rate,
+        )
+        .where(*_occupancy_filters(location, room_type))
+        .order_by(rate.asc() if order == 'asc' else rate.desc(), Accommodation.id)
+        .limit(limit)
+    )
+    return [dict(row) for row in db.session.execute(stmt).mappings()]
+
+
+def occupancy_totals(location=None, room_type=None):
+    from app.models import Accommodation
+    stmt = select(
+        func.count(Accommodation.id).label('accommodations'),
+        func.coalesce(func.sum(Accommodation.current_occupancy), 0).label('occupied_beds'),
+        func.coalesce(func.sum(Accommodation.capacity), 0).label('total_beds'),
+        func.coalesce(func.avg(_occupancy_rate()), 0).label('average_rate'),
+        func.count(case((Accommodation.current_occupancy >= Accommodation.capacity, 1))).label('full'),
+    ).where(*_occupancy_filters(location, room_type))
+    totals = dict(db.session.execute(stmt).mappings().one())
+    totals['overall_rate'] = (
+        totals['occupied_beds'] * 100.0 / totals['total_beds'] if totals['total_beds'] else 0.0
+    )
+    totals['average_rate'] = float(totals['average_rate'])
+    return totals
+
+
+def occupancy_series(limit=10, order='desc', location=None, room_type=None):
+    """Compact column-oriented payload for the dashboard chart"""
+    rows = occupancy_rows(limit, order, location, room_type)
+    return {
+        'ids': [row['id'] for row in rows],
+        'labels': [row['title'] for row in rows],
+        'rates': [round(float(row['occupancy_rate']), 1) for row in rows],
+        'current': [row['current'] for row in rows],
+        'capacity': [row['capacity'] for row in rows],
+        'totals': occupancy_totals(location, room_type),
+    }
@@ -0,0 +1,257 @@
+"""
+Daily and monthly revenue rollups.
+
+Payments written through the ORM adjust their day and month buckets inside
+the same flush, so the rollups commit or roll back together with the payment.
+Bulk writers (reconciliation, imports) call rebuild_rollups() afterwards.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, delete, event, func, insert, inspect, literal_column, select, update
+
+from app import db
+
+
+def _tables():
+    from app.models import RevenueDaily, RevenueMonthly
+    return RevenueDaily.__table__, RevenueMonthly.__table__
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+# ------------------------------------------------------------------
+# Incremental maintenance
+# ------------------------------------------------------------------
+def _upsert(conn, table, bucket_column, bucket, accommodation_id, status, amount, count):
+    keys = {bucket_column: bucket, 'accommodation_id': accommodation_id, 'status': status}
+    dialect = conn.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(**keys, amount=amount, payment_count=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[bucket_column, 'accommodation_id', 'status'],
+            set_={
+                'amount': table.c.amount + stmt.excluded.amount,
+                'payment_count': table.c.payment_count + stmt.excluded.payment_count,
+            },
+        )
+        conn.execute(stmt)
+        return
+
+    result = conn.execute(
+        update(table)
+        .where(and_(*(table.c[name] == value for name, value in keys.items())))
+        .values(amount=table.c.amount + amount, payment_count=table.c.payment_count + count)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(**keys, amount=amount, payment_count=count))
+
+
+def _payment_deltas(session):
+    """(day, booking_id, status) -> [amount, count] for the payments in this flush"""
+    from app.models import Payment
+
+    deltas = {}
+
+    def add(created_at, booking_id, status, amount, count):
+        if created_at is None or booking_id is None:
+            return
+        day = created_at.date() if isinstance(created_at, datetime) else created_at
+        bucket = deltas.setdefault((day, booking_id, status or 'pending'), [0.0, 0])
+        bucket[0] += (amount or 0) * count
+        bucket[1] += count
+
+    for obj in session.new:
+        if isinstance(obj, Payment):
+            add(obj.created_at, obj.booking_id, obj.status, obj.amount, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Payment):
+            add(obj.created_at, obj.booking_id, obj.status, obj.amount, -1)
+    for obj in session.dirty:
+        if not isinstance(obj, Payment):
+            continue
+        state = inspect(obj)
+        changed = {
+            name: state.attrs[name].history
+            for name in ('status', 'amount', 'booking_id')
+            if state.attrs[name].history.has_changes()
+        }
+        if not changed:
+            continue
+
+        def previous(name):
+            history = changed.get(name)
+            return history.deleted[0] if history and history.deleted else getattr(obj, name)
+
+        add(obj.created_at, previous('booking_id'), previous('status'), previous('amount'), -1)
+        add(obj.created_at, obj.booking_id, obj.status, obj.amount, 1)
+    return {key: value for key, value in deltas.items() if value[1] or value[0]}
+
+
+def _apply_payment_deltas(session, flush_context):
+    from app.models import Booking
+
+    deltas = _payment_deltas(session)
+    if not deltas:
+        return
+
+    conn = session.connection()
+    booking_ids = {booking_id for _, booking_id, _ in deltas}
+    accommodation_of = dict(conn.execute(
+        select(Booking.id, Booking.accommodation_id).where(Booking.id.in_(booking_ids))
+    ).all())
+
+    daily, monthly = _tables()
+    for (day, booking_id, status), (amount, count) in deltas.items():
+        accommodation_id = accommodation_of.get(booking_id)
+        if accommodation_id is None:
+            continue
+        _upsert(conn, daily, 'day', day, accommodation_id, status, amount, count)
+        _upsert(conn, monthly, 'month', _month_start(day), accommodation_id, status, amount, count)
+
+
+def register_rollup_listeners():
+    from app.models import Payment
+    from app.stats import track_previous_values
+    if event.contains(db.session, 'after_flush', _apply_payment_deltas):
+        return
+    track_previous_values(Payment.status, Payment.amount, Payment.booking_id)
+    event.listen(db.session, 'after_flush', _apply_payment_deltas)
+
+
+# ------------------------------------------------------------------
+# Bulk rebuild
+# ------------------------------------------------------------------
+def _day_expr(conn, column):
+    if conn.dialect.name == 'postgresql':
+        return func.date_trunc('day', column).cast(db.Date)
+    return func.date(column)
+
+
+def _month_expr(conn, column):
+    if conn.dialect.name == 'postgresql':
+        return func.date_trunc('month', column).cast(db.Date)
+    return func.date(column, 'start of month')
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute the rollups with two INSERT ... SELECT statements. With `since`
+    only buckets from the start of that month onwards are replaced.
+    """
+    from app.models import Booking, Payment
+
+    daily, monthly = _tables()
+    with db.engine.begin() as conn:
+        day = _day_expr(conn, Payment.created_at)
+        source = (
+            select(
+                day.label('day'),
+                Booking.accommodation_id,
+                func.coalesce(Payment.status, 'pending').label('status'),
+                func.sum(Payment.amount).label('amount'),
+                func.count(Payment.id).label('payment_count'),
+            )
+            .join(Booking, Booking.id == Payment.booking_id)
+            .group_by(day, Booking.accommodation_id, func.coalesce(Payment.status, 'pending'))
+        )
+        month_since = None
+        if since is not None:
+            month_since = _month_start(since)
+            source = source.where(Payment.created_at >= datetime.combine(month_since, datetime.min.time()))
+            conn.execute(delete(daily).where(daily.c.day >= month_since))
+            conn.execute(delete(monthly).where(monthly.c.month >= month_since))
+        else:
+            conn.execute(delete(daily))
+            conn.execute(delete(monthly))
+
+        conn.execute(insert(daily).from_select(
+            ['day', 'accommodation_id', 'status', 'amount', 'payment_count'], source
+        ))
+
+        month = _month_expr(conn, daily.c.day)
+        monthly_source = (
+            select(
+                month.label('month'),
+                daily.c.accommodation_id,
+                daily.c.status,
+                func.sum(daily.c.amount),
+                func.sum(daily.c.payment_count),
+            )
+            .group_by(month, daily.c.accommodation_id, daily.c.status)
+        )
+        if month_since is not None:
+            monthly_source = monthly_source.where(daily.c.day >= month_since)
+        conn.execute(insert(monthly).from_select(
+            ['month', 'accommodation_id', 'status', 'amount', 'payment_count'], monthly_source
+        ))
+
+        counts = conn.execute(
+            select(
+                select(func.count()).select_from(daily).scalar_subquery(),
+                select(func.count()).select_from(monthly).scalar_subquery(),
+            )
+        ).one()
+    return {'daily_rows': counts[0], 'monthly_rows': counts[1]}
+
+
+# ------------------------------------------------------------------
+# Report queries
+# ------------------------------------------------------------------
+def revenue_series(period='monthly', status='succeeded', start=None, end=None, accommodation_id=None, limit=36):
+    """Totals per bucket, newest first"""
+    daily, monthly = _tables()
+    table, bucket = (daily, daily.c.day) if period == 'daily' else (monthly, monthly.c.month)
+    stmt = (
+        select(
+            bucket.label('bucket'),
+            func.sum(table.c.amount).label('amount'),
+            func.sum(table.c.payment_count).label('payments'),
+        )
+        .where(table.c.status == status)
+        .group_by(bucket)
+        .order_by(bucket.desc())
+        .limit(limit)
+    )
+    if start:
+        stmt = stmt.where(bucket >= start)
+    if end:
+        stmt = stmt.where(bucket < end)
+    if accommodation_id:
+        stmt = stmt.where(table.c.accommodation_id == accommodation_id)
+    return [dict(row) for row in db.session.execute(stmt).mappings()]
+
+
+def revenue_by_accommodation(status='succeeded', start=None, end=None, limit=20):
+    from app.models import Accommodation
+    _, monthly = _tables()
+    stmt = (
+        select(
+            monthly.c.accommodation_id,
+            Accommodation.title,
+            func.sum(monthly.c.amount).label('amount'),
+            func.sum(monthly.c.payment_count).label('payments'),
+        )
+        .join(Accommodation, Accommodation.id == monthly.c.accommodation_id, isouter=True)
+        .where(monthly.c.status == status)
+        .group_by(monthly.c.accommodation_id, Accommodation.title)
+        .order_by(literal_column('amount').desc())
+        .limit(limit)
+    )
+    if start:
+        stmt = stmt.where(monthly.c.month >= _month_start(start))
+    if end:
+        stmt = stmt.where(monthly.c.month < end)
+    return [dict(row) for row in db.session.execute(stmt).mappings()]
+
+
+def revenue_total(status='succeeded'):
+    _, monthly = _tables()
+    return db.session.execute(
+        select(func.coalesce(func.sum(monthly.c.amount), 0)).where(monthly.c.status == status)
+    ).scalar() or 0
@@ -1,44 +1,69 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, Response, stream_with_context, abort
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from app import db
 from app.models import Accommodation, User, Booking, Payment, Review
 from app.forms import AccommodationForm
 from app.decorators import admin_required
 from app.helpers import save_accommodation_images, format_amenities_list, get_dashboard_stats
+from app.idempotency import get_idempotency_stats
+from app.admission import get_admission_stats
+from app.reports import occupancy_rows, occupancy_totals, occupancy_series
+from app.rollups import revenue_series, revenue_by_accommodation, revenue_total
+from app.exports import ExportError, FORMATS, build_export, stream_export
+from app import waitlist
+from app.analytics import most_viewed
+from app.search import search_users, user_counts
+from app.audit import audit, snapshot, diff, search_audit_log
+from app.db_routing import use_replica, monitor as replica_monitor
+from app import sqlprofile
 import os
 from datetime import datetime, timedelta
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+# Fields recorded in the audit log when an accommodation is edited or deleted
+AUDITED_ACCOMMODATION_FIELDS = (
+    'title', 'description', 'room_type', 'price_per_month', 'location',
+    'capacity', 'current_occupancy', 'amenities', 'status',
+)
+
 # ------------------------------------------------------------------
 # Dashboard
 # ------------------------------------------------------------------
 @bp.route('/dashboard')
+@use_replica
 @login_required
 @admin_required
 def dashboard():
     stats = get_dashboard_stats()
     recent_bookings = Booking.query.order_by(Booking.created_at.desc()).limit(10).all()
-    accommodations = Accommodation.query.all()
-    occupancy_data = []
-    for acc in accommodations:
-        occupancy_rate = (acc.current_occupancy / acc.capacity * 100) if acc.capacity > 0 else 0
-        occupancy_data.append({
-            'title': acc.title,
-            'occupancy_rate': occupancy_rate,
-            'current': acc.current_occupancy,
-            'capacity': acc.capacity
-        })
+    occupancy_data = occupancy_rows(limit=current_app.config.get('DASHBOARD_OCCUPANCY_ROWS', 10))
     return render_template('admin/dashboard.html',
                          stats=stats,
                          recent_bookings=recent_bookings,
-                         occupancy_data=occupancy_data)
+                         occupancy_data=occupancy_data,
+                         occupancy_totals=occupancy_totals())
+
+@bp.route('/dashboard/occupancy.json')
+@use_replica
+@login_required
+@admin_required
+def occupancy_data():
+    """Chart series for the occupancy card: ?order=desc|asc&limit=&location=&room_type="""
+    order = 'asc' if request.args.get('order') == 'asc' else 'desc'
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    return jsonify(occupancy_series(
+        limit=limit,
+        order=order,
+        location=request.args.get('location') or None,
+        room_type=request.args.get('room_type') or None,
+    ))
 
 # ------------------------------------------------------------------
 # List accommodations
 # ------------------------------------------------------------------
 @bp.route('/accommodations')
+@use_replica
 @login_required
 @admin_required
 def manage_accommodations():
@@ -86,6 +111,7 @@ def add_accommodation():
                 db.session.add(image_obj)
             db.session.commit()
 
+        audit('accommodation.create', acc, {'title': [None, acc.title], 'capacity': [None, acc.capacity]})
         flash('Accommodation added successfully!', 'success')
         return redirect(url_for('admin.manage_accommodations'))
     
@@ -113,6 +139,7 @@ def edit_accommodation(id):
         form.amenities.data = ', '.join(acc.amenities)
 
     if form.validate_on_submit():
+        before = snapshot(acc, AUDITED_ACCOMMODATION_FIELDS)
         try:
             # Update basic fields explicitly
             acc.title = form.title.data
@@ -123,7 +150,10 @@ def edit_accommodation(id):
             acc.capacity = form.capacity.data
             acc.current_occupancy = form.current_occupancy.data or 0
             acc.amenities = format_amenities_list(form.amenities.data)
-            acc.status = 'available' if acc.current_occupancy < acc.capacity else 'fully_occupied'
+            # Beds freed by the edit go to the waiting list first; rebalance
+            # reopens the listing once nobody is left in the queue
+            queued = acc.current_occupancy < acc.capacity and waitlist.has_queue(acc.id)
+            acc.status = 'available' if acc.current_occupancy < acc.capacity and not queued else 'fully_occupied'
 
             # Handle images - only process if new files are uploaded
             files = request.files.getlist('images')
@@ -145,6 +175,12 @@ def edit_accommodation(id):
                     db.session.add(image_obj)
 
             db.session.commit()
+            changes = diff(before, acc)
+            if has_new_files:
+                changes['images_added'] = [0, len(image_data_list)]
+            audit('accommodation.update', acc, changes)
+            if queued:
+                waitlist.rebalance(acc.id)
             flash('Accommodation updated successfully!', 'success')
             return redirect(url_for('admin.manage_accommodations'))
             
@@ -174,8 +210,11 @@ def delete_accommodation(id):
         flash('Cannot delete accommodation with existing bookings', 'danger')
         return redirect(url_for('admin.manage_accommodations'))
 
+    before = snapshot(acc, AUDITED_ACCOMMODATION_FIELDS)
     db.session.delete(acc)
     db.session.commit()
+    audit('accommodation.delete', target_type='accommodation', target_id=id,
+          changes={field: [value, None] for field, value in before.items()})
     flash('Accommodation deleted successfully!', 'success')
     return redirect(url_for('admin.manage_accommodations'))
 
@@ -183,6 +222,7 @@ def delete_accommodation(id):
 # Bookings
 # ------------------------------------------------------------------
 @bp.route('/bookings')
+@use_replica
 @login_required
 @admin_required
 def view_all_bookings():
@@ -200,8 +240,14 @@ def update_booking_status(id):
     booking = Booking.query.get_or_404(id)
     new_status = request.form.get('status')
     if new_status in ['pending', 'approved', 'paid', 'cancelled']:
+        frees_bed = new_status == 'cancelled' and booking.status in ('pending', 'approved', 'paid')
+        old_status = booking.status
         booking.status = new_status
         db.session.commit()
+        audit('booking.status', booking, {'status': [old_status, new_status]})
+        if frees_bed:
+            # Give the bed to the next student on the waitlist
+            waitlist.release_bed(booking.accommodation)
         flash(f'Booking status updated to {new_status}', 'success')
     return redirect(url_for('admin.view_all_bookings'))
 
@@ -209,15 +255,19 @@ def update_booking_status(id):
 # Users Management
 # ------------------------------------------------------------------
 @bp.route('/users')
+@use_replica
 @login_required
 @admin_required
 def manage_users():
-    users = User.query.order_by(User.created_at.desc()).all()
-    # Calculate 30 days ago for statistics
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    return render_template('admin/manage_users.html', 
-                         users=users, 
-                         today_minus_30=thirty_days_ago)
+    q = request.args.get('q', '').strip()
+    role = request.args.get('role', '')
+    page = request.args.get('page', 1, type=int)
+    users = search_users(q=q, role=role, page=page)
+    return render_template('admin/manage_users.html',
+                         users=users,
+                         counts=user_counts(),
+                         q=q,
+                         role=role)
 
 @bp.route('/users/promote/<int:user_id>', methods=['POST'])
 @login_required
@@ -228,8 +278,10 @@ def promote_user(user_id):
         flash('You cannot change your own role', 'warning')
         return redirect(url_for('admin.manage_users'))
     
+    old_role = user.role
     user.role = 'admin'
     db.session.commit()
+    audit('user.promote', user, {'role': [old_role, 'admin']})
     flash(f'{user.full_name} has been promoted to admin', 'success')
     return redirect(url_for('admin.manage_users'))
 
@@ -242,8 +294,10 @@ def demote_user(user_id):
         flash('You cannot change your own role', 'warning')
         return redirect(url_for('admin.manage_users'))
     
+    old_role = user.role
     user.role = 'user'
     db.session.commit()
+    audit('user.demote', user, {'role': [old_role, 'user']})
     flash(f'{user.full_name} has been demoted to regular user', 'success')
     return redirect(url_for('admin.manage_users'))
 
@@ -261,8 +315,11 @@ def delete_user(user_id):
         flash('Cannot delete user with existing bookings', 'danger')
         return redirect(url_for('admin.manage_users'))
     
+    before = snapshot(user, ('email', 'student_number', 'full_name', 'role'))
     db.session.delete(user)
     db.session.commit()
+    audit('user.delete', target_type='user', target_id=user_id,
+          changes={field: [value, None] for field, value in before.items()})
     flash(f'User {user.full_name} has been deleted', 'success')
     return redirect(url_for('admin.manage_users'))
 
@@ -270,9 +327,203 @@ def delete_user(user_id):
 # Revenue
 # ------------------------------------------------------------------
 @bp.route('/revenue')
+@use_replica
 @login_required
 @admin_required
 def revenue_report():
-    payments = Payment.query.filter_by(status='succeeded').order_by(Payment.created_at.desc()).all()
-    total_revenue = sum(payment.amount for payment in payments)
-    return render_template('admin/revenue_report.html', payments=payments, total_revenue=total_revenue)
\ No newline at end of file
+    """Totals from the revenue rollups, with a paginated drill-down into payments"""
+    period = 'daily' if request.args.get('period') == 'daily' else 'monthly'
+    accommodation_id = request.args.get('accommodation_id', type=int)
+    series = revenue_series(period, accommodation_id=accommodation_id,
+                            limit=60 if period == 'daily' else 24)
+    by_accommodation = revenue_by_accommodation()
+    total_revenue = revenue_total()
+
+    # Drill-down: ?bucket=YYYY-MM or YYYY-MM-DD narrows the payment list
+    query = Payment.query.filter(Payment.status == 'succeeded')
+    bucket = request.args.get('bucket')
+    if bucket:
+        try:
+            start = datetime.strptime(bucket, '%Y-%m-%d')
+            end = start + timedelta(days=1)
+        except ValueError:
+            try:
+                start = datetime.strptime(bucket, '%Y-%m')
+                end = (start + timedelta(days=32)).replace(day=1)
+            except ValueError:
+                flash(f'Ignored invalid period "{bucket}", expected YYYY-MM or YYYY-MM-DD', 'warning')
+                start = bucket = None
+        if start:
+            query = query.filter(Payment.created_at >= start, Payment.created_at < end)
+    if accommodation_id:
+        query = query.join(Booking).filter(Booking.accommodation_id == accommodation_id)
+    page = request.args.get('page', 1, type=int)
+    payments = query.order_by(Payment.created_at.desc())\
+        .paginate(page=page, per_page=50, error_out=False)
+
+    return render_template('admin/revenue_report.html',
+                         payments=payments,
+                         total_revenue=total_revenue,
+                         series=series,
+                         by_accommodation=by_accommodation,
+                         period=period,
+                         bucket=bucket,
+                         accommodation_id=accommodation_id)
+
+# ------------------------------------------------------------------
+# Listing analytics
+# ------------------------------------------------------------------
+@bp.route('/analytics')
+@use_replica
+@login_required
+@admin_required
+def listing_analytics():
+    days = request.args.get('days', 7, type=int)
+    days = days if days in (1, 7, 30, 90) else 7
+    order = request.args.get('order', 'views')
+    rows = most_viewed(days=days, limit=50, order=order)
+    return render_template('admin/analytics.html', rows=rows, days=days, order=order)
+
+# ------------------------------------------------------------------
+# Exports
+# ------------------------------------------------------------------
+@bp.route('/export/<dataset>')
+@use_replica
+@login_required
+@admin_required
+def export_data(dataset):
+    """
+    Stream a dataset as CSV or NDJSON:
+    ?format=csv|ndjson&columns=id,email&status=&since=YYYY-MM-DD&until=YYYY-MM-DD
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400, f'Unknown format: {fmt}')
+    columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()]
+    filters = {key: value for key, value in request.args.items() if key not in ('format', 'columns')}
+    try:
+        names, stmt = build_export(dataset, columns, filters)
+    except ExportError as e:
+        abort(400, str(e))
+
+    current_app.logger.info(f'Export {dataset}.{fmt} by user {current_user.id}: {filters}')
+    filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(stream_export(names, stmt, fmt)),
+        mimetype=FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+# ------------------------------------------------------------------
+# Bulk import
+# ------------------------------------------------------------------
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_data():
+    result = None
+    if request.method == 'POST':
+        from app.imports import import_users, import_accommodations
+        kind = request.form.get('kind')
+        upload = request.files.get('csv_file')
+        dry_run = bool(request.form.get('dry_run'))
+        if not upload or not upload.filename:
+            flash('Choose a CSV file to import', 'danger')
+        elif kind == 'users':
+            result = import_users(upload.stream, dry_run=dry_run)
+        elif kind == 'accommodations':
+            result = import_accommodations(upload.stream, admin_id=current_user.id, dry_run=dry_run)
+        else:
+            flash('Unknown import type', 'danger')
+        if result is not None and not dry_run:
+            audit(f'import.{result.kind}', changes={
+                'imported': [None, result.imported], 'rejected': [None, result.failed_lines],
+            })
+        if result is not None:
+            verb = 'validated' if dry_run else 'imported'
+            flash(f'{result.imported} of {result.total} {result.kind} {verb}, '
+                  f'{result.failed_lines} row(s) rejected',
+                  'success' if not result.errors else 'warning')
+    return render_template('admin/import_data.html', result=result)
+
+# ------------------------------------------------------------------
+# Audit log
+# ------------------------------------------------------------------
+@bp.route('/audit')
+@use_replica
+@login_required
+@admin_required
+def audit_log():
+    filters = {
+        'actor': request.args.get('actor', '').strip(),
+        'action': request.args.get('action', '').strip(),
+        'target_type': request.args.get('target_type', '').strip(),
+        'target_id': request.args.get('target_id', type=int),
+        'since': request.args.get('since', ''),
+        'until': request.args.get('until', ''),
+    }
+    try:
+        since = datetime.strptime(filters['since'], '%Y-%m-%d') if filters['since'] else None
+        until = datetime.strptime(filters['until'], '%Y-%m-%d') + timedelta(days=1) if filters['until'] else None
+    except ValueError:
+        flash('Dates must be YYYY-MM-DD', 'danger')
+        since = until = None
+    entries = search_audit_log(
+        actor=filters['actor'], action=filters['action'], target_type=filters['target_type'],
+        target_id=filters['target_id'], since=since, until=until,
+        page=request.args.get('page', 1, type=int),
+    )
+    return render_template('admin/audit_log.html', entries=entries, filters=filters)
+
+# ------------------------------------------------------------------
+# Idempotency
+# ------------------------------------------------------------------
+@bp.route('/idempotency')
+@login_required
+@admin_required
+def idempotency_stats():
+    return jsonify(get_idempotency_stats())
+
+# ------------------------------------------------------------------
+# Waiting room
+# ------------------------------------------------------------------
+@bp.route('/admission')
+@login_required
+@admin_required
+def admission_stats():
+    return jsonify(get_admission_stats())
+
+# ------------------------------------------------------------------
+# Read replicas
+# ------------------------------------------------------------------
+@bp.route('/replicas')
+@login_required
+@admin_required
+def replica_status():
+    """Last measured lag per replica in seconds (null = unreachable)"""
+    return jsonify({
+        'max_lag_seconds': current_app.config.get('REPLICA_MAX_LAG_SECONDS'),
+        'replicas': replica_monitor.status(),
+    })
+
+# ------------------------------------------------------------------
+# SQL profile
+# ------------------------------------------------------------------
+@bp.route('/sql-profile', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def sql_profile():
+    """Query fingerprints by total time in this worker (not in production)"""
+    if not current_app.config.get('SQL_PROFILE_DETAILS'):
+        abort(404)
+    if request.method == 'POST':
+        sqlprofile.stats.reset()
+        return redirect(url_for('admin.sql_profile'))
+    order = request.args.get('order', 'total_ms')
+    order = order if order in ('total_ms', 'calls', 'avg_ms', 'max_ms') else 'total_ms'
+    rows = sqlprofile.stats.top(limit=50, order=order)
+    return render_template('admin/sql_profile.html', rows=rows, order=order,
+                         since=datetime.fromtimestamp(sqlprofile.stats.since))
@@ -1,12 +1,22 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import User, Booking
 from app.forms import RegistrationForm, LoginForm
 from app.helpers import save_profile_picture
+from app.passwords import HashingBusy
 
 bp = Blueprint('auth', __name__)
 
+
+def _busy(template, form):
+    """Password hashing is saturated; ask the student to retry instead of queueing"""
+    flash('We are handling a lot of sign-ins right now. Please try again in a few seconds.', 'warning')
+    response = current_app.make_response((render_template(template, form=form), 503))
+    response.headers['Retry-After'] = str(int(current_app.config.get('PASSWORD_HASH_QUEUE_SECONDS', 5)))
+    return response
+
+
 @bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
@@ -38,7 +48,10 @@ def register():
             id_number=form.id_number.data,
             phone_number=form.phone_number.data
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            return _busy('auth/register.html', form)
         
         # Handle profile picture upload - NEW Base64 approach
         if form.profile_picture.data:
@@ -65,7 +78,14 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            return _busy('auth/login.html', form)
+        if valid:
+            if db.session.is_modified(user):
+                # check_password upgraded a hash made with older parameters
+                db.session.commit()
             login_user(user, remember=True)
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
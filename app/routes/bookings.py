@@ -1,22 +1,33 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
-import stripe
 from app import db
 from app.models import Accommodation, Booking, Payment, Review
 from app.forms import BookingForm, ReviewForm
 from app.helpers import calculate_total_price
+from app.idempotency import idempotent, skip_idempotency
+from app.admission import admission_required, check_admission, release_admission
+from app.metrics import stripe_timer
+from app import waitlist
 
 bp = Blueprint('bookings', __name__)
 
 
 @bp.route('/book/<int:accommodation_id>', methods=['GET', 'POST'])
 @login_required
+@admission_required
+@idempotent()
 def book_accommodation(accommodation_id):
     accommodation = Accommodation.query.get_or_404(accommodation_id)
 
+    # A student promoted off the waitlist may book a freed bed that is held for them
+    offer = None
     if not accommodation.is_available:
-        flash('This accommodation is fully occupied', 'danger')
-        return redirect(url_for('main.accommodation_detail', id=accommodation_id))
+        waitlist.expire_offers(accommodation_id)
+        offer = waitlist.get_active_offer(accommodation_id, current_user.id)
+        if offer is None or accommodation.current_occupancy >= accommodation.capacity:
+            release_admission()
+            flash('This accommodation is fully occupied. Join the waiting list to be offered the next free bed.', 'danger')
+            return redirect(url_for('main.accommodation_detail', id=accommodation_id))
 
     existing_booking = Booking.query.filter(
         Booking.user_id == current_user.id,
@@ -25,6 +36,7 @@ def book_accommodation(accommodation_id):
     ).first()
 
     if existing_booking:
+        release_admission()
         flash('You already have a booking for this accommodation', 'warning')
         return redirect(url_for('bookings.view_booking', booking_id=existing_booking.id))
 
@@ -49,6 +61,8 @@ def book_accommodation(accommodation_id):
         accommodation.current_occupancy += 1
         if accommodation.current_occupancy >= accommodation.capacity:
             accommodation.status = 'fully_occupied'
+        if offer:
+            waitlist.claim_offer(offer)
 
         db.session.add(booking)
         db.session.commit()
@@ -63,6 +77,44 @@ def book_accommodation(accommodation_id):
     )
 
 
+@bp.route('/waitlist/<int:accommodation_id>/join', methods=['POST'])
+@login_required
+def join_waitlist(accommodation_id):
+    accommodation = Accommodation.query.get_or_404(accommodation_id)
+    if accommodation.is_available:
+        flash('This accommodation has free beds, you can book it directly', 'info')
+        return redirect(url_for('bookings.book_accommodation', accommodation_id=accommodation_id))
+
+    entry = waitlist.join_waitlist(accommodation_id, current_user.id)
+    flash(f'You are number {waitlist.get_position(entry)} on the waiting list', 'success')
+    return redirect(url_for('main.accommodation_detail', id=accommodation_id))
+
+
+@bp.route('/waitlist/<int:accommodation_id>/leave', methods=['POST'])
+@login_required
+def leave_waitlist(accommodation_id):
+    if waitlist.leave_waitlist(accommodation_id, current_user.id):
+        flash('You have left the waiting list', 'info')
+    return redirect(url_for('main.accommodation_detail', id=accommodation_id))
+
+
+@bp.route('/waitlist/<int:accommodation_id>/position')
+@login_required
+def waitlist_position(accommodation_id):
+    """Cheap status check so students do not need to reload the listing"""
+    waitlist.expire_offers(accommodation_id)
+    entry = waitlist.get_active_entry(accommodation_id, current_user.id)
+    if not entry:
+        return jsonify({'status': 'none', 'position': None})
+    return jsonify({
+        'status': entry.status,
+        'position': waitlist.get_position(entry) or None,
+        'offer_expires_at': entry.offer_expires_at.isoformat() if entry.offer_expires_at else None,
+        'book_url': url_for('bookings.book_accommodation', accommodation_id=accommodation_id)
+                    if entry.status == 'offered' else None,
+    })
+
+
 @bp.route('/bookings')
 @login_required
 def my_bookings():
@@ -84,54 +136,79 @@ def view_booking(booking_id):
 
 @bp.route('/payment/<int:booking_id>')
 @login_required
+@admission_required
+@idempotent(methods=('GET',), include_body=False, on_replay=release_admission)
 def payment(booking_id):
     booking = Booking.query.get_or_404(booking_id)
     if booking.user_id != current_user.id:
+        release_admission()
         flash('Access denied', 'danger')
         return redirect(url_for('main.index'))
     if booking.status != 'approved':
+        release_admission()
         flash('Booking must be approved before payment', 'warning')
         return redirect(url_for('bookings.view_booking', booking_id=booking_id))
 
+    # The Stripe SDK is imported on first checkout, not at worker boot
+    import stripe
     stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            mode='payment',
-            line_items=[{
-                'price_data': {
-                    'currency': 'zar',
-                    'product_data': {
-                        'name': booking.accommodation.title,
-                        'description': f'Booking #{booking.id} – {booking.duration} period',
+        with stripe_timer('checkout.session.create'):
+            session = stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                mode='payment',
+                line_items=[{
+                    'price_data': {
+                        'currency': 'zar',
+                        'product_data': {
+                            'name': booking.accommodation.title,
+                            'description': f'Booking #{booking.id} – {booking.duration} period',
+                        },
+                        'unit_amount': int(booking.total_price * 100),
                     },
-                    'unit_amount': int(booking.total_price * 100),
+                    'quantity': 1,
+                }],
+                metadata={
+                    'booking_id': booking.id,
+                    'user_id': current_user.id
                 },
-                'quantity': 1,
-            }],
-            metadata={
-                'booking_id': booking.id,
-                'user_id': current_user.id
-            },
-            customer_email=current_user.email,
-            success_url=url_for('bookings.payment_success',
-                              booking_id=booking.id,
-                              _external=True),
-            cancel_url=url_for('bookings.view_booking',
-                             booking_id=booking.id,
-                             _external=True),
-        )
+                customer_email=current_user.email,
+                success_url=url_for('bookings.payment_success',
+                                  booking_id=booking.id,
+                                  _external=True),
+                cancel_url=url_for('bookings.view_booking',
+                                 booking_id=booking.id,
+                                 _external=True),
+            )
     except Exception as e:
         current_app.logger.error(f'Stripe Checkout error: {e}')
+        skip_idempotency()
+        release_admission()
         flash('Payment system error. Please try again.', 'danger')
         return redirect(url_for('bookings.view_booking', booking_id=booking_id))
 
     booking.stripe_session_id = session.id
     booking.stripe_payment_intent_id = session.payment_intent
     db.session.commit()
+    # The rest of the flow happens on Stripe, let the next student in
+    release_admission()
     return redirect(session.url, code=303)
 
 
+@bp.route('/waiting-room/status')
+@login_required
+def waiting_room_status():
+    """Polled by the waiting room page; no templates, a few indexed queries"""
+    admitted, position = check_admission()
+    response = jsonify({
+        'admitted': admitted,
+        'position': position,
+        'retry_after': current_app.config.get('ADMISSION_POLL_SECONDS', 5),
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 # --------------  STRIPED-DOWN SUCCESS ROUTE  --------------
 @bp.route('/payment-success/<int:booking_id>')
 @login_required
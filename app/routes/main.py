@@ -1,41 +1,90 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models import Accommodation, Favorite, Booking
+from sqlalchemy import func, select
+from app.models import Accommodation, AccommodationImage, Favorite, Booking, Review
 from app.forms import SearchForm
 from app.helpers import get_amenities_icons
+from app import waitlist
+from app import analytics
+from app.db_routing import use_replica
+from app.conditional import conditional
 
 bp = Blueprint('main', __name__)
 
+
+def _latest(column, *criteria):
+    return select(func.max(column)).where(*criteria).scalar_subquery()
+
+
+def _search_filters():
+    """Listing page criteria from the query string"""
+    filters = [Accommodation.status == 'available']
+    room_type = request.args.get('room_type')
+    if room_type:
+        filters.append(Accommodation.room_type == room_type)
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    if min_price is not None:
+        filters.append(Accommodation.price_per_month >= min_price)
+    if max_price is not None:
+        filters.append(Accommodation.price_per_month <= max_price)
+    return filters
+
+
+def _accommodations_state():
+    """Matching listings (count, last change) and the newest review and image anywhere"""
+    row = db.session.execute(select(
+        func.count(Accommodation.id),
+        func.max(Accommodation.updated_at),
+        _latest(Review.created_at),
+        _latest(AccommodationImage.created_at),
+    ).where(*_search_filters())).one()
+    return tuple(row), max((stamp for stamp in row[1:] if stamp), default=None)
+
+
+def _detail_state(id):
+    row = db.session.execute(select(
+        Accommodation.updated_at,
+        Accommodation.status,
+        Accommodation.current_occupancy,
+        Accommodation.capacity,
+        select(func.count(Review.id)).where(Review.accommodation_id == id).scalar_subquery(),
+        _latest(Review.created_at, Review.accommodation_id == id),
+        select(func.count(AccommodationImage.id)).where(AccommodationImage.accommodation_id == id).scalar_subquery(),
+        _latest(AccommodationImage.created_at, AccommodationImage.accommodation_id == id),
+    ).where(Accommodation.id == id)).first()
+    if row is None:
+        return None
+    available = row.current_occupancy < row.capacity and row.status == 'available'
+    if current_user.is_authenticated and not available:
+        # Waitlist offer and position are per student and change with the queue
+        return None
+    stamps = (row[0], row[5], row[7])
+    return tuple(row), max((stamp for stamp in stamps if stamp), default=None)
+
+
 @bp.route('/')
+@use_replica
 def index():
     featured = Accommodation.query.filter_by(status='available')\
         .order_by(db.func.random()).limit(3).all()
+    analytics.record_impressions([a.id for a in featured])
     return render_template('main/index.html', featured=featured)
 
 @bp.route('/accommodations')
+@use_replica
+@conditional(_accommodations_state)
 def accommodations():
     page = request.args.get('page', 1, type=int)
     form = SearchForm()
 
-    query = Accommodation.query
-
-    room_type = request.args.get('room_type')
-    if room_type:
-        query = query.filter_by(room_type=room_type)
-
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    if min_price is not None:
-        query = query.filter(Accommodation.price_per_month >= min_price)
-    if max_price is not None:
-        query = query.filter(Accommodation.price_per_month <= max_price)
-
     amenities_icons = get_amenities_icons()
 
-    accommodations = query.filter_by(status='available')\
+    accommodations = Accommodation.query.filter(*_search_filters())\
         .order_by(Accommodation.created_at.desc())\
         .paginate(page=page, per_page=12, error_out=False)
+    analytics.record_impressions([a.id for a in accommodations.items])
 
     return render_template('main/accommodations.html', 
                          accommodations=accommodations,
@@ -43,16 +92,25 @@ def accommodations():
                          amenities_icons=amenities_icons)
 
 @bp.route('/accommodations/<int:id>')
+@use_replica
+@conditional(_detail_state, not_modified=lambda id: analytics.record_view(id))
 def accommodation_detail(id):
     accommodation = Accommodation.query.get_or_404(id)
+    analytics.record_view(id)
     amenities_icons = get_amenities_icons()
 
     is_favorite = False
+    waitlist_entry = None
+    waitlist_position = None
     if current_user.is_authenticated:
         is_favorite = Favorite.query.filter_by(
             user_id=current_user.id,
             accommodation_id=id
         ).first() is not None
+        if not accommodation.is_available:
+            waitlist_entry = waitlist.get_active_entry(id, current_user.id)
+            if waitlist_entry:
+                waitlist_position = waitlist.get_position(waitlist_entry)
 
     reviews = accommodation.reviews
 
@@ -60,12 +118,16 @@ def accommodation_detail(id):
                          accommodation=accommodation,
                          is_favorite=is_favorite,
                          reviews=reviews,
+                         waitlist_entry=waitlist_entry,
+                         waitlist_position=waitlist_position,
                          amenities_icons=amenities_icons)
 
 @bp.route('/toggle_favorite/<int:accommodation_id>', methods=['POST'])
 @login_required
 def toggle_favorite(accommodation_id):
     """Temporarily disabled - shows coming soon message"""
+    # Still counted, the click is a useful interest signal
+    analytics.record_favorite(accommodation_id)
     flash('Favorites feature coming soon!', 'info')
     return redirect(request.referrer or url_for('main.accommodation_detail', id=accommodation_id))
 
@@ -0,0 +1,73 @@
+"""
+Server-side user search for the admin user list.
+
+The query shape decides which index is used: an email (contains '@') or a
+student number (all digits) is a prefix match on that column; anything else
+matches the start of the full name or of any word in it. Lowercased
+expression indexes cover the prefix matches, and on PostgreSQL the pg_trgm
+indexes from migration 003 also cover the word matches. Blob columns are never
+loaded for the list.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import load_only
+
+from app import db
+
+USERS_PER_PAGE = 50
+ROLES = ('user', 'admin')
+
+
+def _like_prefix(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{escaped}%'
+
+
+def user_filter(q):
+    from app.models import User
+
+    q = (q or '').strip().lower()
+    if not q:
+        return None
+    if '@' in q:
+        return func.lower(User.email).like(_like_prefix(q), escape='\\')
+    if q.isdigit():
+        return User.student_number.like(_like_prefix(q), escape='\\')
+    name = func.lower(User.full_name)
+    return or_(
+        name.like(_like_prefix(q), escape='\\'),
+        name.like('% ' + _like_prefix(q), escape='\\'),
+        func.lower(User.email).like(_like_prefix(q), escape='\\'),
+    )
+
+
+def search_users(q=None, role=None, page=1, per_page=USERS_PER_PAGE):
+    """Paginated users matching the search, newest first"""
+    from app.models import User
+
+    query = User.query.options(load_only(
+        User.id, User.student_number, User.full_name, User.email,
+        User.id_number, User.phone_number, User.role, User.created_at,
+    ))
+    condition = user_filter(q)
+    if condition is not None:
+        query = query.filter(condition)
+    if role in ROLES:
+        query = query.filter(User.role == role)
+    return query.order_by(User.created_at.desc(), User.id.desc())\
+        .paginate(page=page, per_page=per_page, error_out=False)
+
+
+def user_counts():
+    """Totals for the stat cards in one query"""
+    from app.models import User
+
+    since = datetime.utcnow() - timedelta(days=30)
+    row = db.session.execute(select(
+        func.count(User.id).label('total'),
+        func.count(case((User.role == 'admin', 1))).label('admins'),
+        func.count(case((User.role == 'user', 1))).label('regular'),
+        func.count(case((User.created_at >= since, 1))).label('new'),
+    )).mappings().one()
+    return dict(row)
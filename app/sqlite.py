@@ -0,0 +1,60 @@
+"""
+SQLite production profile.
+
+Used when DATABASE_URL is unset and the app runs on the local
+sqlite:///accommodation.db. Every new connection is set up through a
+`connect` event:
+
+* journal_mode=WAL - readers no longer block behind a writer
+* busy_timeout - writers wait for the lock instead of failing with
+  "database is locked"
+* synchronous=NORMAL - safe with WAL; fsync only at checkpoints
+* mmap_size and cache_size - read pages from the page cache
+* foreign_keys=ON - enforce the same constraints as PostgreSQL
+"""
+from sqlalchemy import event
+
+
+def pragmas(config):
+    statements = []
+    if config.get('SQLITE_WAL', True):
+        statements.append('PRAGMA journal_mode=WAL')
+    statements += [
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA synchronous={config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 0))}",
+        # Negative values are KiB rather than pages
+        f"PRAGMA cache_size=-{int(config.get('SQLITE_CACHE_SIZE_KB', 2000))}",
+        'PRAGMA temp_store=MEMORY',
+        f"PRAGMA foreign_keys={'ON' if config.get('SQLITE_FOREIGN_KEYS', True) else 'OFF'}",
+    ]
+    return statements
+
+
+def configure_engine(engine, config):
+    """Apply the profile to every connection `engine` opens"""
+    statements = pragmas(config)
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+    return set_pragmas
+
+
+def init_sqlite(app, db):
+    if not app.config.get('SQLITE_TUNED', True):
+        return
+    with app.app_context():
+        engines = [engine for engine in db.engines.values() if engine.dialect.name == 'sqlite']
+    for engine in engines:
+        # In-memory databases are per connection; WAL and mmap do not apply
+        if engine.url.database in (None, '', ':memory:'):
+            continue
+        configure_engine(engine, app.config)
+        app.logger.info(f'SQLite profile enabled for {engine.url.database}')
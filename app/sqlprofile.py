@@ -0,0 +1,190 @@
+"""
+Per-request SQL profiling.
+
+before/after_cursor_execute listeners on every engine time each statement.
+Inside a request the timings are collected on `g`: statement count, total
+database time and the SQL_PROFILE_TOP slowest statements. Statements slower
+than SLOW_QUERY_MS are written to the log as warnings with their normalised
+fingerprint (literals and IN lists collapsed), the endpoint and request id.
+A request whose statements add up to SLOW_QUERY_MS or more is logged once
+more at the end, with its slowest statements.
+
+When SQL_PROFILE_DETAILS is on (non-production by default) responses also
+get a Server-Timing header listing the database total and the slowest
+statements, and fingerprints are aggregated per worker process for the
+admin SQL profile page.
+"""
+import re
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Distinct fingerprints kept per process; later ones are counted under OTHER
+MAX_FINGERPRINTS = 2000
+OTHER = '(other statements)'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PARAM = re.compile(r'%\(\w+\)s|%s|:\w+|\$\d+|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES = re.compile(r'(VALUES\s*\([^)]*\))(?:\s*,\s*\([^)]*\))+', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Normalise SQL so the same query with different values groups together"""
+    sql = _STRING.sub('?', statement)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PARAM.sub('?', sql)
+    sql = _IN_LIST.sub('(?+)', sql)
+    sql = _VALUES.sub(r'\1 ...', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class FingerprintStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self.since = time.time()
+
+    def add(self, statements, endpoint):
+        with self._lock:
+            for sql, ms in statements:
+                key = fingerprint(sql)
+                row = self._rows.get(key)
+                if row is None:
+                    if len(self._rows) >= MAX_FINGERPRINTS:
+                        key = OTHER
+                        row = self._rows.get(key)
+                    if row is None:
+                        row = self._rows[key] = {'fingerprint': key, 'calls': 0, 'total_ms': 0.0,
+                                                 'max_ms': 0.0, 'endpoints': set()}
+                row['calls'] += 1
+                row['total_ms'] += ms
+                row['max_ms'] = max(row['max_ms'], ms)
+                if len(row['endpoints']) < 10:
+                    row['endpoints'].add(endpoint)
+
+    def top(self, limit=50, order='total_ms'):
+        with self._lock:
+            rows = [dict(row, endpoints=sorted(row['endpoints'])) for row in self._rows.values()]
+        for row in rows:
+            row['avg_ms'] = row['total_ms'] / row['calls']
+        rows.sort(key=lambda row: row.get(order, row['total_ms']), reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._rows = {}
+            self.since = time.time()
+
+
+stats = FingerprintStats()
+
+
+# ------------------------------------------------------------------
+# Engine hooks
+# ------------------------------------------------------------------
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, not conn.info: a statement that raises never
+    # reaches after_cursor_execute, and the context goes away with it
+    if has_request_context() and context is not None:
+        context._sql_profile_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_sql_profile_started', None)
+    if started is None or not has_request_context():
+        return
+    ms = (time.perf_counter() - started) * 1000
+    profile = g.get('sql_profile')
+    if profile is None:
+        return
+    profile['count'] += 1
+    profile['total_ms'] += ms
+    if profile['details']:
+        profile['statements'].append((statement, ms))
+    slowest = profile['slowest']
+    if len(slowest) < profile['top'] or ms > slowest[-1][1]:
+        slowest.append((statement, ms))
+        slowest.sort(key=lambda item: item[1], reverse=True)
+        del slowest[profile['top']:]
+    if ms >= profile['slow_ms']:
+        current_app.logger.warning(
+            f'Slow query {ms:.1f}ms on {request.endpoint}',
+            extra={'slow_query_ms': round(ms, 1), 'fingerprint': fingerprint(statement), 'endpoint': request.endpoint},
+        )
+
+
+# ------------------------------------------------------------------
+# Request hooks
+# ------------------------------------------------------------------
+def _start_profile():
+    config = current_app.config
+    g.sql_profile = {
+        'count': 0,
+        'total_ms': 0.0,
+        'slowest': [],
+        'statements': [],
+        'top': config.get('SQL_PROFILE_TOP', 5),
+        'slow_ms': config.get('SLOW_QUERY_MS', 200),
+        'details': config.get('SQL_PROFILE_DETAILS', False),
+        'started': time.perf_counter(),
+    }
+
+
+def _timing_desc(text):
+    """A Server-Timing desc is a quoted string in a latin-1 header"""
+    text = text[:120].encode('ascii', 'replace').decode('ascii')
+    return text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _finish_profile(response):
+    profile = g.get('sql_profile')
+    if profile is None:
+        return response
+    slow = profile['total_ms'] >= profile['slow_ms']
+    if not slow and not profile['details']:
+        return response
+    # Fingerprinting costs a few regexes per statement, only pay it when shown
+    summary = request_profile()
+    if slow:
+        current_app.logger.warning(
+            f'{summary["count"]} queries took {summary["total_ms"]:.1f}ms on {request.endpoint}',
+            extra={'sql_total_ms': summary['total_ms'], 'sql_count': summary['count'],
+                   'slowest': summary['slowest'], 'endpoint': request.endpoint},
+        )
+    if profile['details']:
+        app_ms = (time.perf_counter() - profile['started']) * 1000
+        timings = [f'db;dur={summary["total_ms"]:.1f};desc="{summary["count"]} queries"', f'app;dur={app_ms:.1f}']
+        for rank, statement in enumerate(summary['slowest'], 1):
+            timings.append(f'sql{rank};dur={statement["ms"]:.1f};desc="{_timing_desc(statement["fingerprint"])}"')
+        response.headers['Server-Timing'] = ', '.join(timings)
+        stats.add(profile['statements'], request.endpoint or 'unmatched')
+    return response
+
+
+def request_profile():
+    """Profile of the current request: count, total_ms and slowest statements"""
+    profile = g.get('sql_profile')
+    if profile is None:
+        return None
+    return {
+        'count': profile['count'],
+        'total_ms': round(profile['total_ms'], 2),
+        'slowest': [{'fingerprint': fingerprint(sql), 'ms': round(ms, 2)} for sql, ms in profile['slowest']],
+    }
+
+
+def init_sql_profiler(app):
+    if not app.config.get('SQL_PROFILE_ENABLED', True):
+        return
+    # Listening on the Engine class covers the primary and every replica bind
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
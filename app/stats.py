@@ -0,0 +1,176 @@
+"""
+Admin dashboard statistics.
+
+All counters come from one aggregate statement. The result is kept in a
+per-worker snapshot that is adjusted in place when bookings, payments, users
+or accommodations are committed through the ORM session, and fully refreshed
+once DASHBOARD_STATS_TTL has passed (which also picks up changes made by
+other workers or bulk statements).
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import case, event, func, inspect, select
+
+from app import db
+
+BOOKING_STATUSES = ('pending', 'approved', 'paid')
+
+
+def query_dashboard_stats():
+    """Single round trip: booking counts by status plus scalar subqueries"""
+    from app.models import User, Accommodation, Booking, Payment
+
+    stmt = select(
+        select(func.count(User.id)).scalar_subquery().label('total_users'),
+        select(func.count(Accommodation.id)).scalar_subquery().label('total_accommodations'),
+        func.count(Booking.id).label('total_bookings'),
+        func.count(case((Booking.status == 'pending', 1))).label('pending_bookings'),
+        func.count(case((Booking.status == 'approved', 1))).label('approved_bookings'),
+        func.count(case((Booking.status == 'paid', 1))).label('paid_bookings'),
+        select(func.coalesce(func.sum(Payment.amount), 0))
+        .where(Payment.status == 'succeeded')
+        .scalar_subquery().label('total_revenue'),
+    ).select_from(Booking)
+
+    row = db.session.execute(stmt).mappings().one()
+    stats = dict(row)
+    stats['total_revenue'] = float(stats['total_revenue'] or 0)
+    return stats
+
+
+class StatsSnapshot:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0.0
+
+    def get(self):
+        ttl = current_app.config.get('DASHBOARD_STATS_TTL', 60)
+        with self._lock:
+            if self._data is not None and time.monotonic() - self._loaded_at < ttl:
+                return dict(self._data)
+        data = query_dashboard_stats()
+        with self._lock:
+            self._data = data
+            self._loaded_at = time.monotonic()
+        return dict(data)
+
+    def apply(self, deltas):
+        with self._lock:
+            if self._data is None:
+                return
+            for key, value in deltas.items():
+                self._data[key] = self._data.get(key, 0) + value
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+
+snapshot = StatsSnapshot()
+
+
+def get_dashboard_stats():
+    return snapshot.get()
+
+
+# ------------------------------------------------------------------
+# Incremental maintenance
+# ------------------------------------------------------------------
+def _old_new(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    old = history.deleted[0] if history.deleted else getattr(obj, attr)
+    new = history.added[0] if history.added else getattr(obj, attr)
+    return old, new
+
+
+def _add(deltas, key, value):
+    if value:
+        deltas[key] = deltas.get(key, 0) + value
+
+
+def _booking_status_delta(deltas, status, sign):
+    if status in BOOKING_STATUSES:
+        _add(deltas, f'{status}_bookings', sign)
+
+
+def _revenue(status, amount):
+    return (amount or 0) if status == 'succeeded' else 0
+
+
+def _collect_deltas(session, flush_context):
+    from app.models import User, Accommodation, Booking, Payment
+
+    deltas = session.info.setdefault('dashboard_stats_deltas', {})
+    for obj in session.new:
+        if isinstance(obj, User):
+            _add(deltas, 'total_users', 1)
+        elif isinstance(obj, Accommodation):
+            _add(deltas, 'total_accommodations', 1)
+        elif isinstance(obj, Booking):
+            _add(deltas, 'total_bookings', 1)
+            _booking_status_delta(deltas, obj.status or 'pending', 1)
+        elif isinstance(obj, Payment):
+            _add(deltas, 'total_revenue', _revenue(obj.status or 'pending', obj.amount))
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            _add(deltas, 'total_users', -1)
+        elif isinstance(obj, Accommodation):
+            _add(deltas, 'total_accommodations', -1)
+        elif isinstance(obj, Booking):
+            _add(deltas, 'total_bookings', -1)
+            _booking_status_delta(deltas, obj.status, -1)
+        elif isinstance(obj, Payment):
+            _add(deltas, 'total_revenue', -_revenue(obj.status, obj.amount))
+
+    for obj in session.dirty:
+        if isinstance(obj, Booking):
+            old, new = _old_new(obj, 'status')
+            if old != new:
+                _booking_status_delta(deltas, old, -1)
+                _booking_status_delta(deltas, new, 1)
+        elif isinstance(obj, Payment):
+            old_status, new_status = _old_new(obj, 'status')
+            old_amount, new_amount = _old_new(obj, 'amount')
+            _add(deltas, 'total_revenue', _revenue(new_status, new_amount) - _revenue(old_status, old_amount))
+
+
+def _apply_deltas(session):
+    deltas = session.info.pop('dashboard_stats_deltas', None)
+    if deltas:
+        snapshot.apply(deltas)
+
+
+def _discard_deltas(session):
+    session.info.pop('dashboard_stats_deltas', None)
+
+
+def _discard_on_rollback(session, previous_transaction):
+    _discard_deltas(session)
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def track_previous_values(*attrs):
+    """
+    Turn on active_history so the ORM loads the committed value before an
+    expired attribute is overwritten, letting flush hooks see what changed.
+    """
+    for attr in attrs:
+        if not event.contains(attr, 'set', _load_previous_value):
+            event.listen(attr, 'set', _load_previous_value, active_history=True, retval=True)
+
+
+def register_stats_listeners():
+    from app.models import Booking, Payment
+    if event.contains(db.session, 'after_flush', _collect_deltas):
+        return
+    track_previous_values(Booking.status, Payment.status, Payment.amount)
+    event.listen(db.session, 'after_flush', _collect_deltas)
+    event.listen(db.session, 'after_commit', _apply_deltas)
+    event.listen(db.session, 'after_soft_rollback', _discard_on_rollback)
@@ -0,0 +1,219 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select, tuple_, update
+
+from app import db
+
+ACTIVE_STATUSES = ('waiting', 'offered')
+
+
+def _offer_window():
+    return timedelta(hours=current_app.config.get('WAITLIST_OFFER_HOURS', 24))
+
+
+# ------------------------------------------------------------------
+# Queue membership
+# ------------------------------------------------------------------
+def get_active_entry(accommodation_id, user_id):
+    from app.models import WaitlistEntry
+    return WaitlistEntry.query.filter(
+        WaitlistEntry.user_id == user_id,
+        WaitlistEntry.accommodation_id == accommodation_id,
+        WaitlistEntry.status.in_(ACTIVE_STATUSES),
+    ).first()
+
+
+def join_waitlist(accommodation_id, user_id, priority=0):
+    """Queue the user, or return the entry they already hold"""
+    from app.models import WaitlistEntry
+    entry = get_active_entry(accommodation_id, user_id)
+    if entry:
+        return entry
+
+    entry = WaitlistEntry(
+        accommodation_id=accommodation_id,
+        user_id=user_id,
+        priority=priority,
+        status='waiting',
+        created_at=datetime.utcnow(),
+    )
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+
+def has_queue(accommodation_id):
+    """True when anyone is waiting for, or holding an offer on, the accommodation"""
+    from app.models import WaitlistEntry
+    return db.session.query(
+        WaitlistEntry.query.filter(
+            WaitlistEntry.accommodation_id == accommodation_id,
+            WaitlistEntry.status.in_(ACTIVE_STATUSES),
+        ).exists()
+    ).scalar()
+
+
+def leave_waitlist(accommodation_id, user_id):
+    """Drop out of the queue; an outstanding offer goes to the next student"""
+    entry = get_active_entry(accommodation_id, user_id)
+    if not entry:
+        return False
+
+    was_offered = entry.status == 'offered'
+    entry.status = 'left'
+    db.session.commit()
+    if was_offered:
+        rebalance(accommodation_id)
+    return True
+
+
+def get_position(entry):
+    """
+    1-based place in the queue: the number of waiting entries ordered before
+    this one, plus one. The row-value comparison on (priority, created_at, id)
+    makes it one index-only range scan on ix_waitlist_queue, so the cost is
+    O(log n + position) rather than the O(log n) of a maintained rank. Queues
+    are per accommodation and a few hundred entries at most, and keeping a
+    rank column current would mean rewriting every entry behind a student
+    who leaves or is promoted.
+    """
+    from app.models import WaitlistEntry
+    if entry.status != 'waiting':
+        return 0
+
+    ahead = db.session.execute(
+        select(func.count(WaitlistEntry.id)).where(
+            WaitlistEntry.accommodation_id == entry.accommodation_id,
+            WaitlistEntry.status == 'waiting',
+            tuple_(WaitlistEntry.priority, WaitlistEntry.created_at, WaitlistEntry.id)
+            < tuple_(entry.priority, entry.created_at, entry.id),
+        )
+    ).scalar()
+    return ahead + 1
+
+
+# ------------------------------------------------------------------
+# Offers
+# ------------------------------------------------------------------
+def get_active_offer(accommodation_id, user_id):
+    from app.models import WaitlistEntry
+    return WaitlistEntry.query.filter(
+        WaitlistEntry.user_id == user_id,
+        WaitlistEntry.accommodation_id == accommodation_id,
+        WaitlistEntry.status == 'offered',
+        WaitlistEntry.offer_expires_at > datetime.utcnow(),
+    ).first()
+
+
+def claim_offer(entry):
+    """Mark an offer as used. Added to the caller's transaction."""
+    entry.status = 'claimed'
+    db.session.add(entry)
+
+
+def promote_next(accommodation_id):
+    """
+    Offer the freed bed to the first waiting student. The claim is a
+    conditional UPDATE, so two workers promoting at once cannot hand the
+    same entry out twice.
+    """
+    from app.models import WaitlistEntry
+    table = WaitlistEntry.__table__
+    now = datetime.utcnow()
+
+    for _ in range(5):
+        next_id = db.session.execute(
+            select(WaitlistEntry.id)
+            .where(WaitlistEntry.accommodation_id == accommodation_id, WaitlistEntry.status == 'waiting')
+            .order_by(WaitlistEntry.priority, WaitlistEntry.created_at, WaitlistEntry.id)
+            .limit(1)
+        ).scalar()
+        if next_id is None:
+            return None
+
+        result = db.session.execute(
+            update(table)
+            .where(table.c.id == next_id, table.c.status == 'waiting')
+            .values(status='offered', offered_at=now, offer_expires_at=now + _offer_window())
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            entry = db.session.get(WaitlistEntry, next_id)
+            notify_offer(entry)
+            return entry
+    return None
+
+
+def notify_offer(entry):
+    current_app.logger.info(
+        f'[TEST MODE] Waitlist offer for accommodation #{entry.accommodation_id} '
+        f'would be sent to user #{entry.user_id} (expires {entry.offer_expires_at:%Y-%m-%d %H:%M})'
+    )
+
+
+def expire_offers(accommodation_id=None):
+    """Close lapsed offers and pass the beds on. Returns the number expired."""
+    from app.models import WaitlistEntry
+    now = datetime.utcnow()
+    query = select(WaitlistEntry.accommodation_id).where(
+        WaitlistEntry.status == 'offered',
+        WaitlistEntry.offer_expires_at <= now,
+    )
+    if accommodation_id is not None:
+        query = query.where(WaitlistEntry.accommodation_id == accommodation_id)
+    affected = set(db.session.execute(query).scalars())
+    if not affected:
+        return 0
+
+    table = WaitlistEntry.__table__
+    result = db.session.execute(
+        update(table)
+        .where(
+            table.c.status == 'offered',
+            table.c.offer_expires_at <= now,
+            table.c.accommodation_id.in_(affected),
+        )
+        .values(status='expired')
+    )
+    db.session.commit()
+    for acc_id in affected:
+        rebalance(acc_id)
+    return result.rowcount
+
+
+# ------------------------------------------------------------------
+# Bed accounting
+# ------------------------------------------------------------------
+def rebalance(accommodation_id):
+    """
+    Hand out offers until every free bed is either offered or the queue is
+    empty. Only reopen the listing to everyone when nobody is waiting.
+    """
+    from app.models import Accommodation, WaitlistEntry
+    accommodation = db.session.get(Accommodation, accommodation_id)
+    if accommodation is None:
+        return
+
+    free_beds = accommodation.capacity - (accommodation.current_occupancy or 0)
+    outstanding = WaitlistEntry.query.filter(
+        WaitlistEntry.accommodation_id == accommodation_id,
+        WaitlistEntry.status == 'offered',
+        WaitlistEntry.offer_expires_at > datetime.utcnow(),
+    ).count()
+
+    while outstanding < free_beds:
+        if promote_next(accommodation_id) is None:
+            break
+        outstanding += 1
+
+    if free_beds > 0 and outstanding == 0 and accommodation.status == 'fully_occupied':
+        accommodation.status = 'available'
+        db.session.commit()
+
+
+def release_bed(accommodation):
+    """Called when a booking that held a bed is cancelled"""
+    accommodation.current_occupancy = max((accommodation.current_occupancy or 0) - 1, 0)
+    db.session.commit()
+    rebalance(accommodation.id)
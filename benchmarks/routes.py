@@ -0,0 +1,329 @@
+"""
+Latency and queries per request for the hot routes, against a seeded
+database of realistic size.
+
+    python benchmarks/routes.py                      # small dataset
+    python benchmarks/routes.py --size large         # 10k listings, 500k bookings, 1M reviews
+    python benchmarks/routes.py --bookings 200000 --routes listing,detail
+    python benchmarks/routes.py --save-baseline      # record benchmarks/baseline.json
+    python benchmarks/routes.py --check              # exit 1 on a regression
+
+The app is built once with create_app() and driven through its test client,
+so the numbers are server time without the network. The dataset comes from
+app/datagen.py (as for `flask generate-data`) and is seeded into a SQLite
+file under benchmarks/.data/ named after its sizes and seed and reused by
+later runs (--reseed rebuilds it). --database-url runs against
+an existing database instead, e.g. a PostgreSQL copy; it is seeded only if
+empty.
+
+Each route gets --warmup untimed requests, then --requests timed ones.
+Reported per route: p50/p95/p99/max latency in ms, SQL statements per
+request and response size. With a baseline file, routes whose p95 grew by
+more than --tolerance (and at least 2 ms) or that issue more statements are
+reported as regressions. Stripe is replaced by an in-process fake for the
+booking flow.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import types
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZES = {
+    'small': {'accommodations': 500, 'users': 2000, 'bookings': 10000, 'reviews': 20000},
+    'medium': {'accommodations': 2000, 'users': 10000, 'bookings': 100000, 'reviews': 200000},
+    'large': {'accommodations': 10000, 'users': 50000, 'bookings': 500000, 'reviews': 1000000},
+}
+
+BENCH_PASSWORD = 'bench-password'
+STUDENT_EMAIL = 'bench.student@campusstay-bench.com'
+ADMIN_EMAIL = 'bench.admin@campusstay-bench.com'
+# Books in every run, so my_bookings for STUDENT_EMAIL stays the same size
+BOOKER_EMAIL = 'bench.booker@campusstay-bench.com'
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+
+# ------------------------------------------------------------------
+# Stripe fake
+# ------------------------------------------------------------------
+def install_fake_stripe():
+    """Answer checkout.Session.create locally; the payment view imports `stripe` lazily"""
+    def create(**kwargs):
+        # Unique across runs, the cached dataset keeps earlier payments
+        n = uuid.uuid4().hex
+        return types.SimpleNamespace(id=f'cs_bench_{n}', payment_intent=f'pi_bench_{n}',
+                                     url=kwargs['success_url'])
+
+    stripe = types.ModuleType('stripe')
+    stripe.api_key = None
+    stripe.checkout = types.SimpleNamespace(Session=types.SimpleNamespace(create=create))
+    sys.modules['stripe'] = stripe
+
+
+# ------------------------------------------------------------------
+# Dataset
+# ------------------------------------------------------------------
+def seed(sizes, seed_value):
+    """Benchmark accounts, then a generated dataset (app/datagen.py) around them"""
+    from sqlalchemy import update
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from app.datagen import generate
+    from app.models import Booking, User
+
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    for n, (email, role) in enumerate(((STUDENT_EMAIL, 'user'), (ADMIN_EMAIL, 'admin'), (BOOKER_EMAIL, 'user')), 1):
+        db.session.add(User(student_number=f'8000000{n}', full_name=email.split('@')[0], email=email,
+                            password_hash=password_hash, id_number=f'800000000000{n}',
+                            phone_number='0710000000', role=role))
+    db.session.commit()
+
+    counts = generate(users=sizes['users'] - 3, accommodations=sizes['accommodations'],
+                      bookings=sizes['bookings'], reviews=sizes['reviews'],
+                      favorites=sizes['reviews'] // 5, seed=seed_value)
+
+    # The benchmark student has a handful of bookings for my_bookings
+    student = User.query.filter_by(email=STUDENT_EMAIL).first()
+    first_ids = db.session.query(Booking.id).order_by(Booking.id).limit(8)
+    db.session.execute(update(Booking).where(Booking.id.in_(first_ids)).values(user_id=student.id))
+    db.session.commit()
+    return counts
+
+
+def dataset_path(sizes, seed_value):
+    name = 'bench-{accommodations}a-{users}u-{bookings}b-{reviews}r'.format(**sizes)
+    return os.path.join(ROOT, 'benchmarks', '.data', f'{name}-s{seed_value}.db')
+
+
+def build_app(args, sizes):
+    if args.database_url:
+        url = args.database_url
+    else:
+        path = dataset_path(sizes, args.seed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if args.reseed and os.path.exists(path):
+            os.remove(path)
+        url = f'sqlite:///{path}'
+    # Must be set before config is imported; load_dotenv does not override it
+    os.environ['DATABASE_URL'] = url
+    os.environ.setdefault('METRICS_DIR', os.path.join(ROOT, 'benchmarks', '.data', 'metrics'))
+    os.environ.setdefault('LOG_FILE', '')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from app import create_app, db
+    from app.models import User
+
+    app = create_app('config.Config')
+    app.config.update(WTF_CSRF_ENABLED=False, TESTING=True)
+    with app.app_context():
+        db.create_all()
+        if User.query.filter_by(email=STUDENT_EMAIL).first() is None:
+            started = time.perf_counter()
+            print(f"Seeding {', '.join(f'{v} {k}' for k, v in sizes.items())} ...", file=sys.stderr)
+            counts = seed(sizes, args.seed)
+            print(f"Seeded {sum(v for k, v in counts.items() if k != 'seconds'):,d} rows "
+                  f'in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    return app
+
+
+# ------------------------------------------------------------------
+# Measurement
+# ------------------------------------------------------------------
+class QueryCounter:
+    def __init__(self):
+        from flask import has_request_context
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        self.count = 0
+
+        def count(*args):
+            # Background writers (analytics, audit) run outside requests
+            if has_request_context():
+                self.count += 1
+
+        event.listen(Engine, 'before_cursor_execute', count)
+
+
+def login(client, email):
+    client.get('/logout')
+    response = client.post('/login', data={'email': email, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit(f'Could not log in as {email}')
+
+
+def routes(app, rng):
+    """name -> (login as, callable(client) returning the responses of one sample)"""
+    from app.models import Accommodation, Booking, User
+
+    with app.app_context():
+        ids = [row[0] for row in Accommodation.query.with_entities(Accommodation.id).all()]
+        # Earlier runs against the cached dataset already booked some of them
+        booker = User.query.filter_by(email=BOOKER_EMAIL).first()
+        booked = Booking.query.with_entities(Booking.accommodation_id).filter(
+            Booking.user_id == booker.id, Booking.status.in_(['pending', 'approved', 'paid']))
+        bookable = iter([row[0] for row in Accommodation.query.with_entities(Accommodation.id)
+                         .filter(Accommodation.status == 'available',
+                                 Accommodation.current_occupancy < Accommodation.capacity,
+                                 Accommodation.id.not_in(booked))
+                         .order_by(Accommodation.id.desc()).all()])
+
+    def get(path):
+        return lambda client: [client.get(path() if callable(path) else path)]
+
+    def booking_flow(client):
+        accommodation_id = next(bookable)
+        book = client.post(f'/book/{accommodation_id}', data={'duration': 'annual', 'period': '', 'payment_responsible': 'self'})
+        payment = client.get(book.headers['Location'])
+        success = client.get(payment.headers['Location'])
+        return [book, payment, success]
+
+    return {
+        'index': (None, get('/')),
+        'listing': (None, get(lambda: f'/accommodations?page={rng.randint(1, 20)}')),
+        'listing_filtered': (None, get(lambda: '/accommodations?room_type={}&min_price={}&max_price={}'.format(
+            rng.choice(('single', 'double', 'shared', 'studio')), rng.randrange(2500, 5000, 500), 8000))),
+        'detail': (None, get(lambda: f'/accommodations/{rng.choice(ids)}')),
+        'my_bookings': (STUDENT_EMAIL, get('/bookings')),
+        'booking_flow': (BOOKER_EMAIL, booking_flow),
+        'admin_dashboard': (ADMIN_EMAIL, get('/admin/dashboard')),
+        'admin_bookings': (ADMIN_EMAIL, get('/admin/bookings')),
+        'admin_users': (ADMIN_EMAIL, get(lambda: f'/admin/users?page={rng.randint(1, 20)}')),
+        'admin_revenue': (ADMIN_EMAIL, get('/admin/revenue')),
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def measure(client, counter, sample, warmup, requests):
+    for _ in range(warmup):
+        sample(client)
+    latencies, queries, sizes = [], [], []
+    for _ in range(requests):
+        counter.count = 0
+        started = time.perf_counter()
+        responses = sample(client)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        sizes.append(sum(len(r.get_data()) for r in responses))
+        for response in responses:
+            if response.status_code >= 400:
+                raise SystemExit(f'{response.request.path} answered {response.status_code}')
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries': round(statistics.fmean(queries), 1),
+        'bytes': int(statistics.fmean(sizes)),
+    }
+
+
+# ------------------------------------------------------------------
+# Baseline
+# ------------------------------------------------------------------
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance) and result['p95_ms'] - base['p95_ms'] >= 2:
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: queries {base['queries']} -> {result['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hot route latency benchmark')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    for key in ('accommodations', 'users', 'bookings', 'reviews'):
+        parser.add_argument(f'--{key}', type=int, default=None, help=f'Override the {key} count of --size.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reseed', action='store_true', help='Rebuild the cached dataset.')
+    parser.add_argument('--database-url', default=None, help='Use this database instead of a cached SQLite file.')
+    parser.add_argument('--routes', default=None, help='Comma-separated subset of routes.')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 growth before a regression.')
+    parser.add_argument('--check', action='store_true', help='Exit 1 when a regression is found.')
+    parser.add_argument('--json', default=None, help='Also write the results to this file.')
+    args = parser.parse_args()
+
+    sizes = dict(SIZES[args.size])
+    sizes.update({key: getattr(args, key) for key in sizes if getattr(args, key) is not None})
+    # The three benchmark accounts plus at least one ordinary student
+    sizes['users'] = max(sizes['users'], 4)
+
+    install_fake_stripe()
+    app = build_app(args, sizes)
+    counter = QueryCounter()
+    rng = random.Random(args.seed)
+    available = routes(app, rng)
+    selected = args.routes.split(',') if args.routes else list(available)
+    unknown = set(selected) - set(available)
+    if unknown:
+        parser.error(f"unknown route(s): {', '.join(sorted(unknown))}")
+
+    results = {}
+    print(f"{'route':<18} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'queries':>8} {'KB':>7}")
+    for user in (None, STUDENT_EMAIL, BOOKER_EMAIL, ADMIN_EMAIL):
+        names = [name for name in selected if available[name][0] == user]
+        if not names:
+            continue
+        client = app.test_client()
+        if user:
+            login(client, user)
+        for name in names:
+            result = results[name] = measure(client, counter, available[name][1], args.warmup, args.requests)
+            print(f"{name:<18} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['p99_ms']:8.1f} "
+                  f"{result['max_ms']:8.1f} {result['queries']:8.1f} {result['bytes'] / 1024:7.1f}")
+
+    report = {'sizes': sizes, 'seed': args.seed, 'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+              'routes': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline written to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('sizes') != sizes:
+        print(f"Baseline was recorded with {baseline.get('sizes')}, not comparing")
+        return
+    regressions = compare(results, baseline['routes'], args.tolerance)
+    if regressions:
+        print('Regressions against baseline:')
+        for line in regressions:
+            print(f'  {line}')
+        if args.check:
+            sys.exit(1)
+    else:
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Concurrent read/write throughput of the SQLite database, default settings
+against the profile in app/sqlite.py.
+
+    python benchmarks/sqlite_concurrency.py
+    python benchmarks/sqlite_concurrency.py --readers 6 --writers 2 --seconds 10
+
+Reader and writer processes stand in for gunicorn workers. Each opens its
+own engine on a scratch database file and, for a fixed time, runs either
+listing-style SELECTs or small booking-style INSERT + UPDATE transactions.
+Reported: operations per second and "database is locked" failures.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app.sqlite import configure_engine  # noqa: E402
+from config import Config  # noqa: E402
+
+ROWS = 20000
+
+SCHEMA = (
+    'CREATE TABLE listings (id INTEGER PRIMARY KEY, title TEXT, price REAL, occupancy INTEGER)',
+    'CREATE TABLE bookings (id INTEGER PRIMARY KEY, listing_id INTEGER REFERENCES listings(id), '
+    'amount REAL, created_at REAL)',
+    'CREATE INDEX ix_bookings_listing ON bookings (listing_id)',
+)
+
+
+def profile_config(tuned):
+    return {key: getattr(Config, key) for key in dir(Config) if key.startswith('SQLITE_')} if tuned else None
+
+
+def make_engine(path, tuned):
+    engine = create_engine(f'sqlite:///{path}')
+    if tuned:
+        configure_engine(engine, profile_config(True))
+    return engine
+
+
+def setup(path, tuned):
+    engine = make_engine(path, tuned)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text('INSERT INTO listings (title, price, occupancy) VALUES (:t, :p, 0)'),
+                     [{'t': f'Residence {i}', 'p': 1000 + i % 500} for i in range(ROWS)])
+    engine.dispose()
+
+
+def reader(path, tuned, seconds, results):
+    engine = make_engine(path, tuned)
+    ops = errors = 0
+    deadline = time.monotonic() + seconds
+    with engine.connect() as conn:
+        while time.monotonic() < deadline:
+            low = random.randint(1, ROWS - 50)
+            try:
+                conn.execute(text(
+                    'SELECT l.id, l.title, l.price, COUNT(b.id) FROM listings l '
+                    'LEFT JOIN bookings b ON b.listing_id = l.id '
+                    'WHERE l.id BETWEEN :low AND :high GROUP BY l.id'
+                ), {'low': low, 'high': low + 50}).fetchall()
+                conn.rollback()
+                ops += 1
+            except OperationalError:
+                conn.rollback()
+                errors += 1
+    results.put(('read', ops, errors))
+
+
+def writer(path, tuned, seconds, results):
+    engine = make_engine(path, tuned)
+    ops = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        listing_id = random.randint(1, ROWS)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text('INSERT INTO bookings (listing_id, amount, created_at) VALUES (:id, 1000, :now)'),
+                             {'id': listing_id, 'now': time.time()})
+                conn.execute(text('UPDATE listings SET occupancy = occupancy + 1 WHERE id = :id'),
+                             {'id': listing_id})
+            ops += 1
+        except OperationalError:
+            errors += 1
+    results.put(('write', ops, errors))
+
+
+def run(tuned, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        setup(path, tuned)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=reader, args=(path, tuned, args.seconds, results))
+                 for _ in range(args.readers)]
+        procs += [multiprocessing.Process(target=writer, args=(path, tuned, args.seconds, results))
+                  for _ in range(args.writers)]
+        for proc in procs:
+            proc.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in procs:
+            kind, ops, errors = results.get()
+            totals[kind][0] += ops
+            totals[kind][1] += errors
+        for proc in procs:
+            proc.join()
+    return {kind: (ops / args.seconds, errors) for kind, (ops, errors) in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite concurrent read/write benchmark')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s each')
+    print(f"{'profile':<10} {'reads/s':>10} {'writes/s':>10} {'locked':>8}")
+    for name, tuned in (('default', False), ('tuned', True)):
+        result = run(tuned, args)
+        locked = result['read'][1] + result['write'][1]
+        print(f"{name:<10} {result['read'][0]:10.0f} {result['write'][0]:10.0f} {locked:8d}")
+
+
+if __name__ == '__main__':
+    main()
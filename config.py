@@ -3,6 +3,22 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _source_version():
+    """
+    Newest modification time of the code, templates and static files under
+    app/. Every worker of a deploy sees the same files and so the same value,
+    across restarts too; uploads and bytecode written at runtime are skipped.
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+    newest = 0
+    for path, dirs, files in os.walk(root):
+        dirs[:] = [name for name in dirs if name not in ('__pycache__', 'uploads')]
+        for name in files:
+            newest = max(newest, os.stat(os.path.join(path, name)).st_mtime_ns)
+    return f'src-{newest}'
+
+
 class Config:
     # Secret key for session management (from environment)
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -16,16 +32,49 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Connection pooling for PostgreSQL - Updated for SQLAlchemy 2.0+
+    # Sizes are per worker; gunicorn.conf.py sets them from DB_MAX_CONNECTIONS
     if SQLALCHEMY_DATABASE_URI and SQLALCHEMY_DATABASE_URI.startswith('postgresql://'):
         SQLALCHEMY_ENGINE_OPTIONS = {
-            'pool_size': 10,
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
             'pool_recycle': 300,
             'pool_pre_ping': True,
-            'max_overflow': 20,
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
             'connect_args': {
                 'sslmode': 'require'  # Required for Render PostgreSQL
             }
         }
+    # SQLite file database (no DATABASE_URL) - pooled like PostgreSQL so
+    # each worker thread keeps its own connection
+    elif SQLALCHEMY_DATABASE_URI.startswith('sqlite:///') and ':memory:' not in SQLALCHEMY_DATABASE_URI:
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    
+    # SQLite profile applied to every connection by app/sqlite.py: WAL,
+    # busy timeout, synchronous=NORMAL, mmap, page cache and foreign keys
+    SQLITE_TUNED = os.environ.get('SQLITE_TUNED', 'true').lower() == 'true'
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', 'true').lower() == 'true'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64000))
+    SQLITE_FOREIGN_KEYS = os.environ.get('SQLITE_FOREIGN_KEYS', 'true').lower() == 'true'
+    
+    # Read replicas - comma-separated URLs; read-only views marked with
+    # @use_replica are served from them (see app/db_routing.py)
+    DATABASE_REPLICA_URLS = [
+        url.strip().replace('postgres://', 'postgresql://', 1)
+        for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()
+    ]
+    SQLALCHEMY_BINDS = {f'replica_{i}': url for i, url in enumerate(DATABASE_REPLICA_URLS)}
+    # Seconds a replica may lag before reads fall back to the primary
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 10))
+    REPLICA_CHECK_SECONDS = float(os.environ.get('REPLICA_CHECK_SECONDS', 5))
+    # Read-your-writes: a browser session that wrote reads from the primary this long
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 15))
     
     # Upload folder for accommodation images
     UPLOAD_FOLDER = os.path.join('static', 'uploads')
@@ -39,8 +88,106 @@ class Config:
     ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@campusstay.com')
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
     
+    # Idempotency - replays of booking/payment submissions within the window
+    # get the stored response instead of creating another booking or Stripe session
+    IDEMPOTENCY_ENABLED = os.environ.get('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+    IDEMPOTENCY_WINDOW_SECONDS = int(os.environ.get('IDEMPOTENCY_WINDOW_SECONDS', 600))
+    IDEMPOTENCY_WAIT_SECONDS = int(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 5))
+    
+    # Waitlist - hours a promoted student has to book the bed held for them
+    WAITLIST_OFFER_HOURS = int(os.environ.get('WAITLIST_OFFER_HOURS', 24))
+    
+    # Admission control - number of sessions allowed into the booking/payment
+    # flow at once; the rest wait in the virtual waiting room
+    ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    ADMISSION_CONCURRENCY = int(os.environ.get('ADMISSION_CONCURRENCY', 20))
+    ADMISSION_TICKET_SECONDS = int(os.environ.get('ADMISSION_TICKET_SECONDS', 300))
+    ADMISSION_POLL_SECONDS = int(os.environ.get('ADMISSION_POLL_SECONDS', 5))
+    # An admitted ticket with no gated request for this long is expired early
+    ADMISSION_IDLE_SECONDS = int(os.environ.get('ADMISSION_IDLE_SECONDS', 120))
+    # Expiry and admission run at most this often per worker, not on every poll;
+    # released and expired tickets are deleted after ADMISSION_PURGE_SECONDS
+    ADMISSION_ADVANCE_SECONDS = float(os.environ.get('ADMISSION_ADVANCE_SECONDS', 1))
+    ADMISSION_PURGE_SECONDS = int(os.environ.get('ADMISSION_PURGE_SECONDS', 3600))
+    
+    # Admin dashboard - seconds before the stats snapshot is recomputed from the database
+    DASHBOARD_STATS_TTL = int(os.environ.get('DASHBOARD_STATS_TTL', 60))
+    DASHBOARD_OCCUPANCY_ROWS = int(os.environ.get('DASHBOARD_OCCUPANCY_ROWS', 10))
+    
+    # Bulk imports - rows per INSERT/COPY batch and processes used to hash passwords
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+    IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', os.cpu_count() or 2))
+    
+    # Password hashing - werkzeug method and salt length for new hashes; hashes
+    # made with other parameters are upgraded on the next login. Each worker
+    # hashes PASSWORD_HASH_CONCURRENCY passwords at once in a thread (or
+    # process) pool; PASSWORD_HASH_MAX_WAITING more may wait up to
+    # PASSWORD_HASH_QUEUE_SECONDS, later ones get a 503 (see app/passwords.py)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    PASSWORD_HASH_POOL = os.environ.get('PASSWORD_HASH_POOL', 'thread')
+    PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 1))
+    PASSWORD_HASH_MAX_WAITING = int(os.environ.get('PASSWORD_HASH_MAX_WAITING', 2))
+    PASSWORD_HASH_QUEUE_SECONDS = float(os.environ.get('PASSWORD_HASH_QUEUE_SECONDS', 5))
+    
+    # Password given to every user created by `flask generate-data`
+    DATAGEN_PASSWORD = os.environ.get('DATAGEN_PASSWORD', 'password123')
+    
+    # Listing analytics - events are counted in memory per worker and written
+    # to accommodation_stats every ANALYTICS_FLUSH_SECONDS
+    ANALYTICS_ENABLED = os.environ.get('ANALYTICS_ENABLED', 'true').lower() == 'true'
+    ANALYTICS_FLUSH_SECONDS = int(os.environ.get('ANALYTICS_FLUSH_SECONDS', 15))
+    
+    # Admin audit log - entries are queued in memory and inserted in batches
+    # of AUDIT_BATCH_SIZE, at least every AUDIT_FLUSH_SECONDS
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+    AUDIT_FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS', 2))
+    
+    # Metrics - each worker writes its counters to METRICS_DIR every
+    # METRICS_FLUSH_SECONDS; GET /metrics merges them. It needs
+    # Bearer METRICS_TOKEN; without a token it is only served when
+    # METRICS_PUBLIC is on (not in production by default)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_PUBLIC = os.environ.get('METRICS_PUBLIC', str(os.environ.get('FLASK_ENV') != 'production')).lower() == 'true'
+    
+    # Conditional GET - listing pages send an ETag and answer repeat views with
+    # 304 (see app/conditional.py). ETAG_VERSION must change on every deploy
+    # and be the same in every worker; it defaults to the commit Render builds,
+    # else to the newest source file under app/
+    CONDITIONAL_GET_ENABLED = os.environ.get('CONDITIONAL_GET_ENABLED', 'true').lower() == 'true'
+    ETAG_VERSION = os.environ.get('ETAG_VERSION') or os.environ.get('RENDER_GIT_COMMIT') or _source_version()
+    
+    # SQL profiler - statements slower than SLOW_QUERY_MS are logged; with
+    # details on (not in production) responses get a Server-Timing header and
+    # /admin/sql-profile aggregates query fingerprints per worker
+    SQL_PROFILE_ENABLED = os.environ.get('SQL_PROFILE_ENABLED', 'true').lower() == 'true'
+    SQL_PROFILE_DETAILS = os.environ.get('SQL_PROFILE_DETAILS', str(os.environ.get('FLASK_ENV') != 'production')).lower() == 'true'
+    SQL_PROFILE_TOP = int(os.environ.get('SQL_PROFILE_TOP', 5))
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+    
+    # Run `flask init-db` (create missing tables, seed admin) inside create_app.
+    # Off by default so workers boot without DDL; run the command once per deploy
+    DB_INIT_ON_BOOT = os.environ.get('DB_INIT_ON_BOOT', 'false').lower() == 'true'
+    
+    # Cold-start budget checked by `flask import-report`: time to import the
+    # app and run create_app in a fresh interpreter, and its resident memory
+    IMPORT_BUDGET_MS = int(os.environ.get('IMPORT_BUDGET_MS', 1500))
+    IMPORT_BUDGET_RSS_MB = int(os.environ.get('IMPORT_BUDGET_RSS_MB', 120))
+    
     # Debug mode (should be False in production)
     DEBUG = os.environ.get('FLASK_ENV') != 'production'
     
-    # Logging
-    LOG_LEVEL = 'INFO'
\ No newline at end of file
+    # Logging - JSON lines on stderr, written off the request thread by
+    # app/log.py. LOG_FILE (off by default) adds a rotating file; a {pid} in
+    # it gives one file per process, which nothing cleans up afterwards
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.environ.get('LOG_FILE', '')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 50 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    # Share of info records tagged extra={'sample': name} that are kept
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'favorites=0.1,idempotency=0.25')
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Gunicorn settings sized from the machine the app runs on.
+
+Workers and threads come from the CPUs and memory available to the container
+(cgroup limits first, then the host). The database connection budget
+DB_MAX_CONNECTIONS is split between the workers and exported as
+DB_POOL_SIZE / DB_MAX_OVERFLOW, which Config reads into
+SQLALCHEMY_ENGINE_OPTIONS, so adding workers never exceeds the budget.
+Pinned values are clamped to the budget too, with a warning at startup.
+
+Every value can be pinned through the environment:
+
+    WEB_CONCURRENCY        worker processes
+    DB_POOL_SIZE / DB_MAX_OVERFLOW  per-worker pool, at most the worker's share
+    GUNICORN_WORKER_CLASS  gthread (default), gevent or sync
+    GUNICORN_THREADS       threads per gthread worker
+    WORKER_MEMORY_MB       expected RSS of one worker, used to cap workers
+    DB_MAX_CONNECTIONS     connections all workers together may open
+    DB_RESERVED_CONNECTIONS  kept free for migrations, CLI and cron jobs
+    GUNICORN_PRELOAD       load the app in the master and fork (default true)
+
+With preload the master builds the app and compiles every template, then
+freezes the garbage collector before forking, so workers share those pages
+copy-on-write instead of each building its own copy. Each worker then resets
+the database pools it inherited. `python measure_worker_memory.py` compares
+per-worker memory with and without preload.
+
+`python gunicorn.conf.py` prints the settings without starting a server.
+"""
+import gc
+import os
+
+
+# Pinned settings that had to be lowered, logged once gunicorn is starting
+clamped = []
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# ------------------------------------------------------------------
+# Machine
+# ------------------------------------------------------------------
+def available_cpus():
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory_mb():
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            # cgroup v1 reports "no limit" as a huge number
+            if value != 'max' and int(value) < 1 << 50:
+                return int(value) // 2**20
+        except (OSError, ValueError):
+            pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+# ------------------------------------------------------------------
+# Sizing
+# ------------------------------------------------------------------
+def pick_worker_class():
+    requested = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+    if requested == 'gevent':
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            return 'gthread'
+    return requested
+
+
+def connection_budget():
+    return max(1, _env_int('DB_MAX_CONNECTIONS', 20) - _env_int('DB_RESERVED_CONNECTIONS', 3))
+
+
+def size_workers(cpus, memory_mb, worker_class):
+    pinned = _env_int('WEB_CONCURRENCY')
+    if pinned:
+        if pinned > connection_budget():
+            clamped.append(f'WEB_CONCURRENCY={pinned} lowered to {connection_budget()}, '
+                           f'the DB_MAX_CONNECTIONS budget allows one connection per worker at most')
+        return max(1, min(pinned, connection_budget()))
+    # Threaded and async workers overlap I/O themselves, so fewer processes
+    # are needed than the classic 2 * cpus + 1 for sync workers
+    workers = 2 * cpus + 1 if worker_class == 'sync' else cpus + 1
+    if memory_mb:
+        per_worker = _env_int('WORKER_MEMORY_MB', 150)
+        # Leave a quarter of the memory for the master and the page cache
+        workers = min(workers, int(memory_mb * 0.75) // per_worker)
+    # Every worker needs at least one connection of its own
+    return max(1, min(workers, connection_budget()))
+
+
+def size_threads(worker_class):
+    if worker_class != 'gthread':
+        return 1
+    return _env_int('GUNICORN_THREADS', 4)
+
+
+def size_pool(workers, concurrency):
+    """(pool_size, max_overflow) per worker within DB_MAX_CONNECTIONS"""
+    per_worker = max(1, connection_budget() // workers)
+    pool_size = min(_env_int('DB_POOL_SIZE', concurrency), per_worker)
+    # Overflow covers the background writers (analytics, audit) on top of
+    # the request threads, never more than one extra per thread
+    max_overflow = min(_env_int('DB_MAX_OVERFLOW', concurrency), per_worker - pool_size)
+    for name, value in (('DB_POOL_SIZE', pool_size), ('DB_MAX_OVERFLOW', max_overflow)):
+        if _env_int(name, value) > value:
+            clamped.append(f'{name}={os.environ[name]} lowered to {value}, '
+                           f'{workers} workers share {connection_budget()} connections')
+    return pool_size, max_overflow
+
+
+cpus = available_cpus()
+memory_mb = available_memory_mb()
+
+worker_class = pick_worker_class()
+workers = size_workers(cpus, memory_mb, worker_class)
+threads = size_threads(worker_class)
+# Requests one gevent worker serves concurrently
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 100)
+
+concurrency = worker_connections if worker_class == 'gevent' else threads
+db_pool_size, db_max_overflow = size_pool(workers, concurrency)
+os.environ['DB_POOL_SIZE'] = str(db_pool_size)
+os.environ['DB_MAX_OVERFLOW'] = str(db_max_overflow)
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+if preload_app:
+    # No collections while the master imports and builds the app; they would
+    # only fragment the heap that is about to be frozen and shared
+    gc.disable()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+timeout = _env_int('GUNICORN_TIMEOUT', 60)
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+
+def settings_summary():
+    return (
+        f"cpus={cpus} memory={memory_mb or '?'}MB worker_class={worker_class} "
+        f"workers={workers} threads={threads} "
+        f"db_pool_size={os.environ['DB_POOL_SIZE']} db_max_overflow={os.environ['DB_MAX_OVERFLOW']} "
+        f"db_connections_max={workers * (int(os.environ['DB_POOL_SIZE']) + int(os.environ['DB_MAX_OVERFLOW']))}"
+    )
+
+
+def on_starting(server):
+    server.log.info(f'Auto-tuned settings: {settings_summary()} preload={preload_app}')
+    for message in clamped:
+        server.log.warning(message)
+    # Per-worker metric snapshots from the previous run would be merged into /metrics
+    from app.metrics import clear_metrics_dir
+    clear_metrics_dir()
+
+
+def when_ready(server):
+    if preload_app:
+        from app.boot import prepare_for_fork
+        prepare_for_fork(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.boot import after_fork
+        after_fork(worker.app.wsgi())
+        gc.enable()
+
+
+if __name__ == '__main__':
+    print(settings_summary())
+    for message in clamped:
+        print(f'warning: {message}')
@@ -0,0 +1,124 @@
+"""
+Report shared and private memory of gunicorn workers.
+
+    python measure_worker_memory.py                 # compare preload off / on
+    python measure_worker_memory.py --workers 4 --requests 50
+    python measure_worker_memory.py --pid 1234      # measure a running master
+
+Compare mode starts gunicorn twice with gunicorn.conf.py on a spare port
+(GUNICORN_PRELOAD=false, then true). It sends the same GET requests to each
+so every worker has rendered pages, then reads /proc/<pid>/smaps_rollup for
+the master and each worker. Linux only.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+PATHS = ('/', '/accommodations', '/login', '/register')
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def read_rollup(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in FIELDS:
+                values[key] = int(rest.split()[0]) / 1024
+    return {
+        'rss': values['Rss'],
+        'pss': values['Pss'],
+        'shared': values['Shared_Clean'] + values['Shared_Dirty'],
+        'private': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def measure(master_pid):
+    workers = [dict(pid=pid, **read_rollup(pid)) for pid in children(master_pid)]
+    return {'master': dict(pid=master_pid, **read_rollup(master_pid)), 'workers': workers}
+
+
+def print_report(title, report):
+    print(f'\n{title}')
+    print(f"{'process':<16} {'RSS MB':>8} {'PSS MB':>8} {'shared':>8} {'private':>8}")
+    rows = [('master', report['master'])] + [(f"worker {w['pid']}", w) for w in report['workers']]
+    for name, row in rows:
+        print(f"{name:<16} {row['rss']:8.1f} {row['pss']:8.1f} {row['shared']:8.1f} {row['private']:8.1f}")
+    workers = report['workers'] or [{'private': 0, 'pss': 0}]
+    avg_private = sum(w['private'] for w in workers) / len(workers)
+    total_pss = report['master']['pss'] + sum(w['pss'] for w in report['workers'])
+    print(f'average private per worker {avg_private:.1f} MB, total PSS {total_pss:.1f} MB')
+    return avg_private, total_pss
+
+
+def wait_for_workers(port, master_pid, workers, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if len(children(master_pid)) >= workers:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=5).read()
+                return
+            except OSError:
+                pass
+        time.sleep(0.5)
+    raise RuntimeError('gunicorn did not come up')
+
+
+def warm_up(port, requests):
+    for i in range(requests):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}{PATHS[i % len(PATHS)]}', timeout=10).read()
+        except OSError:
+            pass
+
+
+def run_mode(preload, args):
+    env = dict(os.environ, GUNICORN_PRELOAD='true' if preload else 'false',
+               WEB_CONCURRENCY=str(args.workers), PORT=str(args.port))
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'wsgi:app', '--config', 'gunicorn.conf.py'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_workers(args.port, proc.pid, args.workers)
+        warm_up(args.port, args.requests)
+        time.sleep(1)
+        return measure(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pid', type=int, help='Measure this running gunicorn master only.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=40, help='Warm-up requests per run.')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.pid:
+        print_report(f'gunicorn master {args.pid}', measure(args.pid))
+        return
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    before = print_report('preload off', run_mode(False, args))
+    after = print_report('preload on (gc.freeze)', run_mode(True, args))
+    print(f'\nprivate per worker {before[0]:.1f} -> {after[0]:.1f} MB, '
+          f'total PSS {before[1]:.1f} -> {after[1]:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
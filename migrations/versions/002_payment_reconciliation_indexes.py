@@ -0,0 +1,29 @@
+"""Index Stripe identifiers used by payment reconciliation
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_bookings_stripe_session_id ON bookings (stripe_session_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_bookings_stripe_payment_intent_id ON bookings (stripe_payment_intent_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payments_booking_id ON payments (booking_id)"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP INDEX IF EXISTS ix_payments_booking_id"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_bookings_stripe_payment_intent_id"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_bookings_stripe_session_id"))
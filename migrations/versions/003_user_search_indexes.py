@@ -0,0 +1,42 @@
+"""Indexes for the admin user search
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_full_name_lower ON users (lower(full_name))"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email))"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_role_created ON users (role, created_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_created_at ON users (created_at)"))
+    if conn.dialect.name == 'postgresql':
+        # Trigram indexes serve LIKE on any word of the name and prefix
+        # matches regardless of collation
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_full_name_trgm ON users USING gin (lower(full_name) gin_trgm_ops)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_student_number_trgm ON users USING gin (student_number gin_trgm_ops)"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("DROP INDEX IF EXISTS ix_users_student_number_trgm"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_users_email_trgm"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_users_full_name_trgm"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_users_created_at"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_users_role_created"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_users_email_lower"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_users_full_name_lower"))
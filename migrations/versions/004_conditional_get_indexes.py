@@ -0,0 +1,29 @@
+"""Indexes for the conditional GET validators
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_accommodations_status_updated ON accommodations (status, updated_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_reviews_accommodation_created ON reviews (accommodation_id, created_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_accommodation_images_accommodation_created ON accommodation_images (accommodation_id, created_at)"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP INDEX IF EXISTS ix_accommodation_images_accommodation_created"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_reviews_accommodation_created"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_accommodations_status_updated"))
@@ -0,0 +1,21 @@
+"""Merge the user column migrations into the main line
+
+Revision ID: 005
+Revises: 004, add_missing_user_columns, add_student_number
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = ('004', 'add_missing_user_columns', 'add_student_number')
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,25 @@
+"""Index waiting room tickets by last poll
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_admission_status_seen ON admission_tickets (status, last_seen_at)"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    conn.execute(text("DROP INDEX IF EXISTS ix_admission_status_seen"))
@@ -0,0 +1,29 @@
+"""Keep the flashed messages of a stored idempotent response
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # A schema created by `flask init-db` from the models already has it
+    if not inspector.has_table('idempotency_keys'):
+        return
+    columns = {column['name'] for column in inspector.get_columns('idempotency_keys')}
+    if 'response_flashes' not in columns:
+        op.add_column('idempotency_keys', sa.Column('response_flashes', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('idempotency_keys', 'response_flashes')
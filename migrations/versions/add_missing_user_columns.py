@@ -17,6 +17,11 @@ depends_on = None
 
 
 def upgrade():
+    # A schema created by `flask init-db` from the models already has these
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    if 'student_number' in columns:
+        return
+
     # ### commands auto generated by Alembic - please adjust! ###
     
     # Add student_number column (nullable first to handle existing data)
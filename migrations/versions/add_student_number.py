@@ -17,6 +17,11 @@ depends_on = None
 
 
 def upgrade():
+    # A schema created by `flask init-db` from the models already has these
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    if 'student_number' in columns:
+        return
+
     # Add student_number column to users table
     op.add_column('users', sa.Column('student_number', sa.String(length=8), nullable=True))
     op.add_column('users', sa.Column('id_number', sa.String(length=13), nullable=True))
@@ -1,6 +1,13 @@
 #!/bin/bash
-# Run migrations (will fail silently if already applied)
-flask db upgrade || echo "Migration may have failed or already applied"
+set -e
+export FLASK_APP=${FLASK_APP:-wsgi.py}
+
+# One-shot setup per deploy: missing tables, indexes and the admin user,
+# then migrations for what create_all cannot do. A failure stops the deploy
+# (set -e). Workers never run DDL themselves.
+flask init-db
+flask db upgrade
 
 # Start the app
-gunicorn wsgi:app --bind 0.0.0.0:$PORT --workers 2
+# Workers, threads and the DB pool are sized in gunicorn.conf.py
+exec gunicorn wsgi:app --config gunicorn.conf.py
@@ -1,12 +1,10 @@
 # test_accommodations_route.py - Test the actual route access
-import requests
+# Quick smoke check; latency and query counts are in benchmarks/routes.py
 import sys
 from app import create_app, db
 from app.models import Accommodation
 
-def test_route():
-    app = create_app()
-    
+def check_route(app):
     # Test 1: Simple route access
     print("=== Testing /accommodations route ===")
     with app.test_client() as client:
@@ -24,9 +22,8 @@ def test_route():
         else:
             print(f"Response data: {response.data.decode()[:500]}...")
 
-def test_database():
+def check_database(app):
     print("\n=== Testing Database Connection ===")
-    app = create_app()
     with app.app_context():
         try:
             # Test database connection
@@ -49,9 +46,8 @@ def test_database():
             import traceback
             traceback.print_exc()
 
-def test_template():
+def check_template(app):
     print("\n=== Testing Template Loading ===")
-    app = create_app()
     with app.app_context():
         try:
             from flask import render_template
@@ -68,6 +64,8 @@ def test_template():
             traceback.print_exc()
 
 if __name__ == "__main__":
-    test_database()
-    test_template()
-    test_route()
\ No newline at end of file
+    # Build the app once; each create_app() call costs a full boot
+    app = create_app()
+    check_database(app)
+    check_template(app)
+    check_route(app)
\ No newline at end of file